@@ -1,12 +1,34 @@
 import os
-import requests
-import json
-import logging
-
-class AnalyticsAIAgent:
-    def __init__(self):
-        self.api_key = os.environ.get("OPENROUTER_API_KEY")
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+import contextlib
+from base_ai_agent import BaseAIAgent
+from prompt_templates import PromptTemplate, respond_template
+from sentiment_pipeline import LexiconScorer, SentimentPipeline, iter_texts
+
+TARGET_AUDIENCE_TEMPLATE = PromptTemplate("target_audience", """
+Conduct an in-depth target audience analysis for the product named in the user message. Your analysis should include:
+1. Detailed demographic profile (age, gender, income, education, occupation, location)
+2. Psychographic characteristics (interests, values, lifestyle, personality traits)
+3. Behavioral patterns (purchasing habits, brand loyalties, media consumption)
+4. Pain points and challenges the audience faces that the product can address
+5. Decision-making process and factors influencing their choices
+6. Segmentation of the audience into distinct buyer personas
+7. Channels and platforms where this audience can be effectively reached
+8. Tailored messaging strategies for each segment
+9. Potential objections or resistance points from this audience
+10. Opportunities for audience expansion or market penetration
+
+Consider any additional context given in the user message in your analysis.
+""")
+
+SENTIMENT_TEMPLATE = PromptTemplate("sentiment", """
+Perform a detailed sentiment analysis on the text in the user message. Classify it as positive, negative, or neutral, and explain why.
+""")
+
+RESPOND_TEMPLATE = respond_template("analytics")
+
+class AnalyticsAIAgent(BaseAIAgent):
+    def __init__(self, client=None, async_client=None, router=None):
+        super().__init__(client, async_client, router)
         self.audiences = {
             "Millennials": {"age": "25-40", "interests": ["Technology", "Experiences", "Social causes"]},
             "Gen Z": {"age": "10-25", "interests": ["Social media", "Authenticity", "Diversity"]},
@@ -15,70 +37,81 @@ class AnalyticsAIAgent:
             "Tech Enthusiasts": {"age": "Various", "interests": ["Gadgets", "Innovation", "Early adoption"]}
         }
 
-    def analyze_target_audience(self, product, additional_info=None, language='english'):
-        """Analyze the target audience for a given product."""
-        prompt = f"Conduct an in-depth target audience analysis for {product}. Your analysis should include:\n"
-        prompt += "1. Detailed demographic profile (age, gender, income, education, occupation, location)\n"
-        prompt += "2. Psychographic characteristics (interests, values, lifestyle, personality traits)\n"
-        prompt += "3. Behavioral patterns (purchasing habits, brand loyalties, media consumption)\n"
-        prompt += "4. Pain points and challenges the audience faces that {product} can address\n"
-        prompt += "5. Decision-making process and factors influencing their choices\n"
-        prompt += "6. Segmentation of the audience into distinct buyer personas\n"
-        prompt += "7. Channels and platforms where this audience can be effectively reached\n"
-        prompt += "8. Tailored messaging strategies for each segment\n"
-        prompt += "9. Potential objections or resistance points from this audience\n"
-        prompt += "10. Opportunities for audience expansion or market penetration\n"
+    def analyze_target_audience(self, product, additional_info=None, language='english', sentiment=None):
+        """Analyze the target audience for a given product.
+
+        `sentiment` is an optional SentimentStats from analyze_sentiment_bulk,
+        whose distribution is added to the context.
+        """
+        return self.call_openrouter_api(self._target_audience_prompt(product, additional_info, sentiment),
+                                        language=language, template=TARGET_AUDIENCE_TEMPLATE)
+
+    async def aanalyze_target_audience(self, product, additional_info=None, language='english', sentiment=None):
+        """Async version of analyze_target_audience."""
+        return await self.acall_openrouter_api(self._target_audience_prompt(product, additional_info, sentiment),
+                                               language=language, template=TARGET_AUDIENCE_TEMPLATE)
+
+    def _target_audience_prompt(self, product, additional_info, sentiment=None):
+        prompt = f"Product: {product}\n"
         if additional_info:
-            prompt += f"\nConsider the following additional context in your analysis:\n{additional_info}"
-        return self.call_openrouter_api(prompt)
+            prompt += f"\nAdditional context:\n{additional_info}"
+        if sentiment is not None:
+            prompt += f"\nCustomer sentiment analysis:\n{sentiment.to_prompt()}"
+        return prompt
 
     def perform_sentiment_analysis(self, text):
         """Perform sentiment analysis on given text."""
-        prompt = f"Perform a detailed sentiment analysis on the following text. Classify it as positive, negative, or neutral, and explain why: '{text}'"
-        return self.call_openrouter_api(prompt)
-
-    def call_openrouter_api(self, prompt, language='english'):
-        """Make a streaming API call to OpenRouter's Anthropic Claude-3.5-sonnet model."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "anthropic/claude-3.5-sonnet",
-            "messages": [{"role": "user", "content": f"Respond in {language}. {prompt}"}],
-            "stream": True
-        }
-        try:
-            response = requests.post(self.base_url, headers=headers, json=data, stream=True)
-            response.raise_for_status()
-            full_response = ""
-            response_id = None
-            for line in response.iter_lines():
-                if line:
-                    chunk = line.decode('utf-8')
-                    if chunk.startswith("data: "):
-                        try:
-                            chunk_data = json.loads(chunk[6:])
-                            if 'id' in chunk_data and not response_id:
-                                response_id = chunk_data['id']
-                            if chunk_data['choices'][0]['finish_reason'] is None:
-                                content = chunk_data['choices'][0]['delta'].get('content', '')
-                                full_response += content
-                                pass
-                            elif 'usage' in chunk_data:
-                                logging.info(f"Usage data: {chunk_data['usage']}")
-                        except json.JSONDecodeError as e:
-                            logging.error(f"JSON decode error: {e}")
-                            logging.error(f"Problematic chunk: {chunk}")
-                            continue
-            print()  # Print a newline at the end
-            logging.info(f"Response ID: {response_id}")
-            return full_response
-        except requests.exceptions.RequestException as e:
-            logging.error(f"API request error: {e}")
-            return f"Error: {str(e)}"
+        return self.call_openrouter_api(self._sentiment_prompt(text), template=SENTIMENT_TEMPLATE)
+
+    async def aperform_sentiment_analysis(self, text):
+        """Async version of perform_sentiment_analysis."""
+        return await self.acall_openrouter_api(self._sentiment_prompt(text), template=SENTIMENT_TEMPLATE)
+
+    def _sentiment_prompt(self, text):
+        return f"Text: '{text}'"
+
+    def analyze_sentiment_bulk(self, source, output_path=None, lexicon=True, batch_size=40, concurrency=4,
+                               text_field='text', id_field='id'):
+        """Label and score a large corpus, returning its SentimentStats.
+
+        `source` is a .jsonl, .csv or plain text file (see
+        sentiment_pipeline.iter_texts) or an iterable of texts or (id, text)
+        pairs. Duplicates are scored once, obvious texts by a local lexicon
+        unless `lexicon` is False, and the rest by the model in batches of
+        `batch_size`. Per-text results go to `output_path` as JSON lines
+        while the run progresses.
+        """
+        pipeline = self._sentiment_pipeline(lexicon, batch_size, concurrency)
+        with self._sentiment_output(output_path) as output:
+            return pipeline.run(self._sentiment_texts(source, text_field, id_field), output)
+
+    async def aanalyze_sentiment_bulk(self, source, output_path=None, lexicon=True, batch_size=40, concurrency=4,
+                                      text_field='text', id_field='id'):
+        """Async version of analyze_sentiment_bulk."""
+        pipeline = self._sentiment_pipeline(lexicon, batch_size, concurrency)
+        with self._sentiment_output(output_path) as output:
+            return await pipeline.arun(self._sentiment_texts(source, text_field, id_field), output)
+
+    def _sentiment_pipeline(self, lexicon, batch_size, concurrency):
+        if lexicon is True:
+            lexicon = LexiconScorer()
+        return SentimentPipeline(self, lexicon or None, batch_size, concurrency)
+
+    def _sentiment_output(self, output_path):
+        return open(output_path, 'w', encoding='utf-8') if output_path else contextlib.nullcontext()
+
+    def _sentiment_texts(self, source, text_field, id_field):
+        if isinstance(source, (str, os.PathLike)):
+            return iter_texts(source, text_field, id_field)
+        return ((i, item) if isinstance(item, str) else item for i, item in enumerate(source))
 
     def respond_to_agent(self, message, language='english'):
         """Respond to messages from other agents."""
-        prompt = f"As an analytics AI agent, respond to the following message from another agent: {message}"
-        return self.call_openrouter_api(prompt, language=language)
+        return self.call_openrouter_api(self._respond_prompt(message), language=language, template=RESPOND_TEMPLATE)
+
+    async def arespond_to_agent(self, message, language='english'):
+        """Async version of respond_to_agent."""
+        return await self.acall_openrouter_api(self._respond_prompt(message), language=language, template=RESPOND_TEMPLATE)
+
+    def _respond_prompt(self, message):
+        return f"Message from another agent: {message}"
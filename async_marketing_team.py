@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import contextlib
+from colorama import Fore, Style
+from marketing_ai_agent import MarketingAIAgent
+from sales_ai_agent import SalesAIAgent
+from strategy_ai_agent import StrategyAIAgent
+from analytics_ai_agent import AnalyticsAIAgent
+from translation_ai_agent import TranslationAIAgent
+from marketing_team import SYNTHESIS_TEMPLATE, build_synthesis_prompt, create_styled_document
+from openrouter_client import AsyncOpenRouterClient
+from pipeline import PlanResult, Stage, cancelled_status, plan_attributes, run_stage_graph, stage_depths
+from brief_index import BriefIndex, brief_scope
+from stream_observers import ConsoleProgressObserver, NullObserver, observe
+from openrouter_errors import OpenRouterError, OperationCancelled
+from usage_tracking import UsageReport, usage_scope
+from context_compactor import ContextCompactor
+from report_writer import ReportWriter, translated_report_path, unique_report_path
+from model_router import get_default_router
+from stage_store import STAGE_PARAMS, StageStore, stage_params
+from response_cache import cache_bypassed
+from cancellation import plan_token, stage_scope
+from tracing import current_span, span
+from logging_setup import log_response
+
+STAGE_LABELS = {
+    "marketing": (Fore.RED, "Marketing Agent"),
+    "sales": (Fore.GREEN, "Sales Agent"),
+    "strategy": (Fore.YELLOW, "Strategy Agent"),
+    "analytics": (Fore.MAGENTA, "Analytics Agent"),
+    "final_marketing": (Fore.RED, "Marketing Agent (Final)"),
+    "synthesis": (Fore.BLUE, "Final Marketing Plan"),
+}
+
+
+class AsyncMarketingTeam:
+    """asyncio version of MarketingTeam that runs the discussion as a stage graph.
+
+    With `fan_out=True` the Sales, Strategy and Analytics agents all react to
+    the initial campaign idea in parallel instead of building on each other.
+    """
+
+    def __init__(self, client=None, fan_out=False, write_document=True, verbose=True, observer_factory=None,
+                 stage_retries=1, context_budget=800, compaction_mode='summarize', router=None, stage_store=None,
+                 plan_timeout=None, languages=None, profiler=None, brief_index=None):
+        self.client = client or AsyncOpenRouterClient()
+        self.router = router or get_default_router()
+        self.marketing_agent = MarketingAIAgent(async_client=self.client, router=self.router)
+        self.sales_agent = SalesAIAgent(async_client=self.client, router=self.router)
+        self.strategy_agent = StrategyAIAgent(async_client=self.client, router=self.router)
+        self.analytics_agent = AnalyticsAIAgent(async_client=self.client, router=self.router)
+        self.translation_agent = TranslationAIAgent(async_client=self.client, router=self.router)
+        self.fan_out = fan_out
+        self.write_document = write_document
+        self.verbose = verbose
+        self.observer_factory = observer_factory or (ConsoleProgressObserver if verbose else NullObserver)
+        self.stage_retries = stage_retries
+        self.compactor = ContextCompactor(context_budget, compaction_mode, agent=self.marketing_agent)
+        self.last_usage = None
+        self.stage_store = stage_store if stage_store is not None else StageStore.from_env()
+        self.config = {"context_budget": context_budget, "compaction_mode": compaction_mode}
+        # Seconds a discussion may take, shared out over the stages still ahead (None for no limit)
+        self.plan_timeout = plan_timeout
+        # Output languages: the discussion runs in the first, the plan is translated into the rest
+        self.languages = list(languages) if languages else None
+        # PlanProfiler wrapped around every discussion (None to not profile)
+        self.profiler = profiler
+        # Past briefs and their stage outputs, as in MarketingTeam (False turns it off)
+        self.brief_index = brief_index if brief_index is not None else BriefIndex.from_env()
+
+    def build_stages(self, product, additional_info):
+        """Describe the discussion as a list of stages with their dependencies."""
+        language = additional_info.get('language', 'english')
+
+        async def marketing(inputs):
+            return await self.marketing_agent.agenerate_campaign_idea(product, additional_info=additional_info)
+
+        async def sales(inputs):
+            marketing_input = await self.compactor.acompact(inputs['marketing'], language=language)
+            return await self.sales_agent.arespond_to_agent(marketing_input, language=language)
+
+        async def strategy(inputs):
+            context = await self.compactor.ajoin([inputs[dep] for dep in strategy_deps], language)
+            return await self.strategy_agent.aanalyze_market_trends(product, context, language=language)
+
+        async def analytics(inputs):
+            context = await self.compactor.ajoin([inputs[dep] for dep in analytics_deps], language)
+            return await self.analytics_agent.aanalyze_target_audience(product, context, language=language)
+
+        async def final_marketing(inputs):
+            context = await self.compactor.ajoin([inputs['sales'], inputs['strategy'], inputs['analytics']], language)
+            return await self.marketing_agent.agenerate_campaign_idea(product, additional_info={'input': context, 'language': language})
+
+        async def synthesis(inputs):
+            outputs = await self.compactor.acompact_all(
+                [inputs['final_marketing'], inputs['sales'], inputs['strategy'], inputs['analytics']], language)
+            prompt = build_synthesis_prompt(*outputs, product, additional_info)
+            return await self.marketing_agent.acall_openrouter_api(prompt, language=language,
+                                                                   template=SYNTHESIS_TEMPLATE)
+
+        if self.fan_out:
+            strategy_deps = ('marketing',)
+            analytics_deps = ('marketing',)
+        else:
+            strategy_deps = ('marketing', 'sales')
+            analytics_deps = ('marketing', 'sales', 'strategy')
+
+        return [
+            Stage("marketing", "Initial Marketing Campaign Idea", marketing, params=STAGE_PARAMS["marketing"]),
+            Stage("sales", "Sales Agent Feedback", sales, deps=('marketing',), params=STAGE_PARAMS["sales"]),
+            Stage("strategy", "Market Trends Analysis", strategy, deps=strategy_deps, params=STAGE_PARAMS["strategy"]),
+            Stage("analytics", "Target Audience Analysis", analytics, deps=analytics_deps,
+                  params=STAGE_PARAMS["analytics"]),
+            Stage("final_marketing", "Final Marketing Campaign Idea", final_marketing,
+                  deps=('sales', 'strategy', 'analytics'), params=STAGE_PARAMS["final_marketing"]),
+            Stage("synthesis", "Final Marketing Plan", synthesis, deps=('final_marketing', 'sales', 'strategy', 'analytics'),
+                  params=STAGE_PARAMS["synthesis"]),
+        ]
+
+    def _wrap_stage(self, stage, usage, token=None, depth=1):
+        """Wrap a stage so it reports stream events to a fresh observer, records
+        its calls in `usage` and is re-run on its own when it fails with a
+        retryable OpenRouterError. With the plan's CancellationToken the stage
+        gets the time left divided by `depth`, the stages on its longest path
+        to the end."""
+        run = stage.run
+        label = STAGE_LABELS.get(stage.name, (None, stage.title))[1]
+
+        async def wrapped_run(inputs):
+            with span("stage", stage=stage.name) as stage_span:
+                for attempt in range(self.stage_retries + 1):
+                    stage_span.set_attribute("stage.attempts", attempt + 1)
+                    try:
+                        with observe(self.observer_factory(label)), usage_scope(usage, stage.name), \
+                                stage_scope(token, depth):
+                            return await run(inputs)
+                    except OpenRouterError as e:
+                        if not e.retryable or attempt == self.stage_retries:
+                            raise
+                        logging.warning(f"{label} failed with {type(e).__name__}, retrying the stage: {e}")
+        return Stage(stage.name, stage.title, wrapped_run, deps=stage.deps, params=stage.params)
+
+    def _brief_scope(self, product, additional_info):
+        return brief_scope(product, additional_info, {**self.config, "fan_out": self.fan_out})
+
+    def _similar_brief(self, product, additional_info):
+        """Async counterpart of MarketingTeam._similar_brief."""
+        if not self.brief_index or cache_bypassed():
+            return None
+        match = self.brief_index.lookup(additional_info, self._brief_scope(product, additional_info))
+        if match is not None:
+            logging.info(f"Starting from the stage outputs of a similar brief (similarity {match.similarity:.3f})")
+            current_span().set_attribute("plan.similar_brief", round(match.similarity, 4))
+        return match
+
+    def _reused_stage(self, stage, output, usage):
+        """A stand-in for `stage` that returns the output of a similar earlier brief."""
+        async def reused(inputs):
+            logging.info(f"Starting from the '{stage.name}' output of a similar brief")
+            usage.record_reuse(stage.name)
+            current_span().set_attribute("stage.similar_brief", True)
+            return output
+        return Stage(stage.name, stage.title, reused, deps=stage.deps, params=stage.params)
+
+    def _report_stage(self, stage, output):
+        log_response(stage.title, output)
+        if self.verbose:
+            color, label = STAGE_LABELS.get(stage.name, (Fore.WHITE, stage.title))
+            print(f"{color}{label}: {output}{Style.RESET_ALL}\n", flush=True)
+
+    def _stage_sink(self, stages, writer, outputs):
+        """on_stage_complete callback that reports each stage, collects its
+        output in `outputs` and appends the finished sections to `writer` in
+        document order, even when fan-out stages complete out of order."""
+        order = [stage.name for stage in stages]
+        finished = {}
+
+        def on_stage_complete(stage, output):
+            outputs[stage.name] = output
+            self._report_stage(stage, output)
+            if writer is None:
+                return
+            finished[stage.name] = (stage.title, output)
+            while order and order[0] in finished:
+                writer.add_section(*finished.pop(order.pop(0)))
+        return on_stage_complete
+
+    async def discuss_marketing_plan(self, product, additional_info=None, usage=None, output_path=None,
+                                     cancel_token=None, languages=None):
+        """Run the discussion and return the document sections as a PlanResult, or None on failure.
+
+        Sections are added to the document as their stages finish; it is
+        written off the event loop at the end, or with the finished sections
+        when a stage fails. `output_path` may be a path (a unique one by
+        default) or a binary stream. Per-stage usage is rolled up into `usage`
+        (a fresh UsageReport by default), also kept as `last_usage`. When
+        `plan_timeout` runs out or `cancel_token` is cancelled, in-flight
+        streams are closed and the finished sections come back with status
+        "timed_out" or "cancelled". With several output `languages` the
+        discussion runs in the first and the finished plan is translated
+        into the others concurrently, as MarketingTeam does. Runs are traced
+        and profiled as in MarketingTeam.
+        """
+        usage = usage if usage is not None else UsageReport()
+        with span("plan", product=product, team="async", fan_out=self.fan_out) as plan_span, self._profiled():
+            result = await self._discuss(product, additional_info, usage, output_path, cancel_token, languages)
+            plan_span.set_attributes(plan_attributes(result, usage))
+            return result
+
+    def _profiled(self):
+        return self.profiler.profile("plan") if self.profiler is not None else contextlib.nullcontext()
+
+    async def _discuss(self, product, additional_info, usage, output_path, cancel_token, languages):
+        additional_info = additional_info or {}
+        languages = list(languages or self.languages or [])
+        if languages:
+            additional_info = {**additional_info, 'language': languages[0]}
+        self.last_usage = usage
+        language = additional_info.get('language', 'english')
+        writer = None
+        if self.write_document:
+            # Saving is blocking file IO, so it happens in a worker thread rather than per section
+            writer = ReportWriter(output_path if output_path is not None else unique_report_path(language),
+                                  language, autosave=False)
+        if self.verbose:
+            print(f"{Fore.CYAN}Marketing Team discussing: {product}{Style.RESET_ALL}\n", flush=True)
+        logging.info(f"Starting async marketing plan discussion for {product} (fan_out={self.fan_out})")
+
+        token = plan_token(self.plan_timeout, cancel_token)
+        stages = self.build_stages(product, additional_info)
+        match = self._similar_brief(product, additional_info)
+        if match is not None:
+            stages = [self._reused_stage(stage, match.outputs[stage.name], usage)
+                      if stage.name in match.outputs else stage for stage in stages]
+        outputs = {}
+        try:
+            depths = stage_depths(stages)
+            results = await run_stage_graph([self._wrap_stage(stage, usage, token, depths[stage.name])
+                                             for stage in stages],
+                                            on_stage_complete=self._stage_sink(stages, writer, outputs),
+                                            store=self.stage_store or None,
+                                            params=stage_params(product, additional_info, self.config, self.router),
+                                            on_stage_reused=lambda stage: usage.record_reuse(stage.name))
+            content = [{"title": stage.title, "content": results[stage.name]} for stage in stages]
+            if writer is not None:
+                await asyncio.to_thread(writer.save)
+                logging.info(f"Marketing plan saved as '{writer.target}'")
+            result = PlanResult(content)
+            if self.brief_index and match is None:
+                self.brief_index.add(additional_info, self._brief_scope(product, additional_info), results)
+            if len(languages) > 1:
+                await self._translate(result, languages[0], languages[1:], output_path, usage, token)
+            logging.info(f"Marketing plan discussion completed, usage: {usage.totals()}")
+            return result
+        except OperationCancelled as e:
+            status = cancelled_status(e)
+            logging.warning(f"Marketing plan discussion {status.replace('_', ' ')} after {len(outputs)} of "
+                            f"{len(stages)} stages: {e}")
+            if self.verbose:
+                print(f"{Fore.RED}Stopped: the discussion {status.replace('_', ' ')} after {len(outputs)} "
+                      f"stages.{Style.RESET_ALL}")
+            await self._keep_partial(writer)
+            return PlanResult([{"title": stage.title, "content": outputs[stage.name]}
+                               for stage in stages if stage.name in outputs], status, str(e))
+        except Exception as e:
+            logging.error(f"An error occurred during the marketing plan discussion: {str(e)}")
+            if self.verbose:
+                print(f"{Fore.RED}Error: An unexpected error occurred. Please check the logs for more information.{Style.RESET_ALL}")
+            await self._keep_partial(writer)
+            return None
+        finally:
+            if token is not None:
+                token.close()
+
+    async def _translate(self, result, pivot, languages, output_path, usage, token):
+        """Async version of MarketingTeam._translate; documents are written off the event loop."""
+        async def translate(language):
+            try:
+                with observe(self.observer_factory(f"Translation ({language})")), usage_scope(usage, "translation"), \
+                        stage_scope(token, 1), span("stage", stage="translation", language=language):
+                    sections = await self.translation_agent.atranslate_sections(result, language,
+                                                                                source_language=pivot)
+            except Exception as e:
+                logging.error(f"Translating the marketing plan into {language} failed: {e}")
+                return PlanResult([], "failed", str(e)), None
+            document = None
+            if self.write_document:
+                document = await asyncio.to_thread(create_styled_document, sections, language,
+                                                   translated_report_path(output_path, language))
+            return PlanResult(sections), document
+
+        for language, (translation, document) in zip(languages, await asyncio.gather(*map(translate, languages))):
+            result.translations[language] = translation
+            if document is not None:
+                result.documents[language] = document
+
+    async def _keep_partial(self, writer):
+        if writer is not None and writer.sections:
+            await asyncio.to_thread(writer.save)
+            logging.info(f"Partial marketing plan with {writer.sections} sections kept at {writer.target!r}")
+
+    async def close(self):
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+def run_marketing_plan(product, additional_info=None, fan_out=False, **team_kwargs):
+    """Synchronous entry point that runs one AsyncMarketingTeam discussion to completion."""
+    async def _run():
+        async with AsyncMarketingTeam(fan_out=fan_out, **team_kwargs) as team:
+            return await team.discuss_marketing_plan(product, additional_info)
+    return asyncio.run(_run())
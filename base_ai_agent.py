@@ -0,0 +1,111 @@
+from openrouter_client import DEFAULT_MODEL, AsyncOpenRouterClient, get_default_client
+from batch_calls import afan_out, check_mode, fan_out, log_missing, pack_prompt, packed_template, unpack_response
+
+# Returned in place of an empty completion
+NO_RESPONSE = "No valid response received from the API."
+
+
+class BaseAIAgent:
+    """Common plumbing shared by all AI agents."""
+
+    model = DEFAULT_MODEL
+
+    def __init__(self, client=None, async_client=None, router=None):
+        self._client = client
+        self._async_client = async_client
+        # ModelRouter choosing the model per call; without one every call uses `model`
+        self.router = router
+
+    @property
+    def client(self):
+        """The agent's own client if one was given, otherwise the shared default client."""
+        return self._client or get_default_client()
+
+    @property
+    def async_client(self):
+        """The client used by the async agent methods, created on first use."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenRouterClient()
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, client):
+        self._async_client = client
+
+    def _messages(self, prompt, language, template=None):
+        if template is not None:
+            return template.messages(prompt, language)
+        return [{"role": "user", "content": f"Respond in {language}. {prompt}"}]
+
+    def _route_key(self, template, route):
+        return route or (template.name if template is not None else None)
+
+    def call_openrouter_api(self, prompt, language='english', template=None, route=None):
+        """Make a streaming API call to OpenRouter (Anthropic Claude-3.5-sonnet unless routed elsewhere).
+
+        With a PromptTemplate, its static instructions go first as a cacheable
+        system message and `prompt` holds only the per-request part. With a
+        router, the model is picked by `route`, the template name or the
+        current stage. Raises an OpenRouterError subclass if the call still
+        fails after the scheduler's retries (and the router's alternates).
+        """
+        messages = self._messages(prompt, language, template)
+
+        def send(model):
+            return self.client.stream_chat(messages, model=model, language=language)
+
+        if self.router is None:
+            full_response = send(self.model)
+        else:
+            full_response = self.router.call(send, self._route_key(template, route))
+        return full_response if full_response else NO_RESPONSE
+
+    async def acall_openrouter_api(self, prompt, language='english', template=None, route=None):
+        """Async version of call_openrouter_api."""
+        messages = self._messages(prompt, language, template)
+
+        def send(model):
+            return self.async_client.stream_chat(messages, model=model, language=language)
+
+        if self.router is None:
+            full_response = await send(self.model)
+        else:
+            full_response = await self.router.acall(send, self._route_key(template, route))
+        return full_response if full_response else NO_RESPONSE
+
+    def call_many(self, tasks, mode='fan_out', concurrency=4, language='english'):
+        """Run several independent requests and return {key: response} in the order of `tasks`.
+
+        `tasks` maps each key to a (prompt, template) pair. Mode "fan_out"
+        makes one call per task, at most `concurrency` at a time. Mode
+        "packed" asks for every task in one structured-JSON request and
+        splits the answer back per key; keys the model leaves out are
+        requested one by one.
+        """
+        check_mode(mode)
+        if mode == 'packed' and len(tasks) > 1:
+            template = packed_template(*dict.fromkeys(template for _, template in tasks.values()))
+            answers = unpack_response(self.call_openrouter_api(pack_prompt(tasks), language, template), tasks)
+            missing = [key for key in tasks if key not in answers]
+            if missing:
+                log_missing(missing)
+                answers.update(self.call_many({key: tasks[key] for key in missing}, 'fan_out', concurrency, language))
+            return {key: answers[key] for key in tasks}
+        return fan_out(lambda key: self.call_openrouter_api(tasks[key][0], language, tasks[key][1]),
+                       tasks, concurrency)
+
+    async def acall_many(self, tasks, mode='fan_out', concurrency=4, language='english'):
+        """Async version of call_many."""
+        check_mode(mode)
+        if mode == 'packed' and len(tasks) > 1:
+            template = packed_template(*dict.fromkeys(template for _, template in tasks.values()))
+            text = await self.acall_openrouter_api(pack_prompt(tasks), language, template)
+            answers = unpack_response(text, tasks)
+            missing = [key for key in tasks if key not in answers]
+            if missing:
+                log_missing(missing)
+                answers.update(await self.acall_many({key: tasks[key] for key in missing}, 'fan_out',
+                                                     concurrency, language))
+            return {key: answers[key] for key in tasks}
+        return await afan_out(lambda key: self.acall_openrouter_api(tasks[key][0], language, tasks[key][1]),
+                              tasks, concurrency)
@@ -0,0 +1,107 @@
+import re
+import json
+import asyncio
+import logging
+import contextvars
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from prompt_templates import PromptTemplate
+from profiling import followed
+
+BATCH_MODES = ('fan_out', 'packed')
+
+PACKED_INSTRUCTIONS = """
+The user message holds a JSON object that maps item keys to separate requests. Answer every request on its
+own, following the instructions above, and reply with a single JSON object that maps each key, exactly as
+given, to its answer as a string. Reply with the JSON object only.
+"""
+
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def check_mode(mode):
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Unknown batch mode {mode!r}, expected one of {BATCH_MODES}")
+
+
+@lru_cache(maxsize=64)
+def packed_template(*templates):
+    """One cacheable system message covering every template in a packed request.
+
+    Cached per combination, so repeated batches send a byte-identical prefix.
+    """
+    if len(templates) == 1:
+        instructions = templates[0].instructions
+    else:
+        instructions = "\n\n".join(f"For [{template.name.replace('_', ' ')}] items:\n{template.instructions}"
+                                   for template in templates)
+    name = "+".join(template.name for template in templates)
+    return PromptTemplate(f"{name}_packed", f"{instructions}\n{PACKED_INSTRUCTIONS}")
+
+
+def pack_prompt(tasks):
+    """User text of a packed request: the per-item prompts keyed by item.
+
+    When items use different templates, each prompt is labelled with the
+    template it belongs to.
+    """
+    labelled = len({template for _, template in tasks.values()}) > 1
+    return json.dumps({key: f"[{template.name.replace('_', ' ')}] {prompt}" if labelled else prompt
+                       for key, (prompt, template) in tasks.items()}, ensure_ascii=False, indent=2)
+
+
+def parse_json_object(text):
+    """The JSON object in a model reply, ignoring code fences and surrounding prose; {} if there is none."""
+    body = _JSON_FENCE.sub("", text.strip())
+    start, end = body.find("{"), body.rfind("}")
+    try:
+        answers = json.loads(body[start:end + 1]) if start != -1 else {}
+    except json.JSONDecodeError:
+        answers = {}
+    return answers if isinstance(answers, dict) else {}
+
+
+def unpack_response(text, keys):
+    """Split a packed answer into {key: answer}; keys the model left out are missing."""
+    answers = parse_json_object(text)
+    results = {}
+    for key in keys:
+        answer = answers.get(key)
+        if isinstance(answer, str) and answer.strip():
+            results[key] = answer
+        elif answer:
+            results[key] = json.dumps(answer, ensure_ascii=False, indent=2)
+    return results
+
+
+def fan_out(call, keys, concurrency):
+    """Run `call(key)` for every key on up to `concurrency` threads; results in key order.
+
+    Each call runs in a copy of the caller's context, so the active observer
+    and usage scope apply to it as they would to a sequential call, and a
+    sampled plan's profile includes the worker threads.
+    """
+    keys = list(keys)
+    if concurrency <= 1 or len(keys) <= 1:
+        return {key: call(key) for key in keys}
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(keys))) as executor:
+        futures = {key: executor.submit(contextvars.copy_context().run, followed, call, key) for key in keys}
+        return {key: future.result() for key, future in futures.items()}
+
+
+async def afan_out(call, keys, concurrency):
+    """Async version of fan_out: at most `concurrency` of the `call(key)` coroutines in flight."""
+    keys = list(keys)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(key):
+        async with semaphore:
+            return await call(key)
+
+    results = await asyncio.gather(*(_one(key) for key in keys))
+    return dict(zip(keys, results))
+
+
+def log_missing(missing):
+    logging.warning(f"Packed request left {len(missing)} item(s) unanswered, asking for them one by one: "
+                    f"{', '.join(map(str, missing))}")
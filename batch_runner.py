@@ -0,0 +1,232 @@
+"""Non-interactive batch mode: generate marketing plans for every brief in a JSONL or CSV file.
+
+    python batch_runner.py briefs.jsonl --output results.jsonl --docs-dir plans --concurrency 8
+
+Each input record needs a `brief` (free text) and/or a `product`; `id`,
+`language`, `target_audience`, `marketing_goals` and `budget` are optional.
+Results are appended to the output JSONL as plans finish, and every finished
+brief id is recorded in a checkpoint file so a restarted run skips it. Each
+result carries the plan's token usage; `--usage-json` and `--usage-metrics`
+write the roll-up for the whole run as JSON or Prometheus text, and
+`--profile-dir` keeps a profile of every plan.
+"""
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from marketing_team import MarketingTeam
+from stream_observers import NullObserver
+from usage_tracking import UsageReport
+from logging_setup import configure_logging
+from profiling import DEFAULT_PROFILE_MODE, PROFILE_MODES, PlanProfiler
+
+BRIEF_FIELDS = ('target_audience', 'marketing_goals', 'budget')
+
+
+class Brief:
+    """One normalized input record."""
+
+    def __init__(self, brief_id, product, additional_info):
+        self.id = brief_id
+        self.product = product
+        self.additional_info = additional_info
+
+    @classmethod
+    def from_record(cls, record):
+        text = (record.get('brief') or record.get('additional_info') or '').strip()
+        product = (record.get('product') or text.split('.')[0]).strip()
+        if not product:
+            raise ValueError(f"Brief has neither a product nor brief text: {record!r}")
+        additional_info = {field: record[field] for field in BRIEF_FIELDS if record.get(field)}
+        additional_info['additional_info'] = text
+        additional_info['language'] = (record.get('language') or 'english').strip().lower()
+        brief_id = str(record.get('id') or '').strip()
+        if not brief_id:
+            # Derive a stable id from the content so resumed runs recognise the brief
+            brief_id = hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        return cls(brief_id, product, additional_info)
+
+
+def iter_briefs(path, on_error=None):
+    """Lazily yield Brief objects from a .jsonl or .csv file.
+
+    A malformed record (invalid JSON, or neither a product nor brief text)
+    is skipped: `on_error(record_id, error)` is called for it if given,
+    otherwise it is logged. Its id is the record's own, or
+    `<file name>:<line>` when it has none.
+    """
+    name = os.path.basename(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            reader = csv.DictReader(f)
+            records = ((reader.line_num, record) for record in reader)
+        else:
+            # JSON lines are parsed one at a time below, so a bad line only loses itself
+            records = ((number, line) for number, line in enumerate(f, 1) if line.strip())
+        for line_number, record in records:
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                if not isinstance(record, dict):
+                    raise ValueError(f"Expected a JSON object, got {type(record).__name__}")
+                brief = Brief.from_record(record)
+            except ValueError as e:
+                record_id = str(record.get('id') or '').strip() if isinstance(record, dict) else ''
+                record_id = record_id or f"{name}:{line_number}"
+                if on_error is None:
+                    logging.warning(f"Skipping invalid brief {record_id}: {e}")
+                else:
+                    on_error(record_id, e)
+                continue
+            yield brief
+
+
+def load_checkpoint(path):
+    """Return the set of brief ids already completed according to the checkpoint file."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def document_path(docs_dir, brief_id):
+    """Unique, filesystem-safe document path for a brief."""
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '-', brief_id).strip('-')[:48] or 'brief'
+    digest = hashlib.sha1(brief_id.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(docs_dir, f"plan_{slug}_{digest}.docx")
+
+
+def run_brief(team, brief, docs_dir, batch_usage=None, cancel_token=None):
+    """Run one plan and return its result record, merging its usage into `batch_usage` if given."""
+    start = time.perf_counter()
+    path = document_path(docs_dir, brief.id)
+    usage = UsageReport()
+    content = team.discuss_marketing_plan(brief.product, brief.additional_info, output_path=path, usage=usage,
+                                          cancel_token=cancel_token)
+    if batch_usage is not None:
+        batch_usage.merge(usage)
+    if content is None:
+        status = "error"
+    else:
+        # A plan stopped by its deadline keeps the sections (and document) it finished
+        status = "ok" if content.completed else content.status
+    record = {
+        "id": brief.id,
+        "product": brief.product,
+        "language": brief.additional_info['language'],
+        "status": status,
+        "document": path if content else None,
+        "sections": content,
+        "elapsed": round(time.perf_counter() - start, 3),
+        "usage": usage.to_dict(),
+    }
+    if content is not None and not content.completed:
+        record["error"] = content.error
+    return record
+
+
+def run_batch(input_path, output_path, docs_dir, concurrency=4, checkpoint_path=None, team=None, usage=None,
+              plan_timeout=None, profiler=None):
+    """Generate plans for every brief in `input_path` with at most `concurrency` running at once.
+
+    Only a bounded window of briefs is read ahead of the workers and results
+    are written out as they finish, so memory stays flat for large inputs.
+    Failed briefs and malformed input records are written with status
+    "error" ("timed_out" when a plan ran past `plan_timeout` seconds) but
+    not checkpointed, so a re-run retries them. Plan usage is merged into
+    `usage` (a UsageReport) when given, and each plan is profiled by
+    `profiler` (a PlanProfiler) when given. Returns counts of completed,
+    failed and skipped briefs.
+    """
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+    completed_ids = load_checkpoint(checkpoint_path)
+    team = team or MarketingTeam(observer_factory=NullObserver, verbose=False, plan_timeout=plan_timeout,
+                                 profiler=profiler)
+    os.makedirs(docs_dir, exist_ok=True)
+    stats = {"completed": 0, "failed": 0, "skipped": 0}
+
+    with open(output_path, 'a', encoding='utf-8') as output, \
+            open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        def record(future):
+            write(future.result())
+
+        def invalid(record_id, error):
+            logging.warning(f"Brief {record_id} is invalid: {error}")
+            write({"id": record_id, "status": "error", "error": f"Invalid brief: {error}", "elapsed": 0.0})
+
+        def write(result):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            if result["status"] == "ok":
+                checkpoint.write(result["id"] + "\n")
+                checkpoint.flush()
+                stats["completed"] += 1
+            else:
+                stats["failed"] += 1
+            logging.info(f"Brief {result['id']} finished with status {result['status']} in {result['elapsed']}s")
+
+        in_flight = set()
+        for brief in iter_briefs(input_path, on_error=invalid):
+            if brief.id in completed_ids:
+                stats["skipped"] += 1
+                continue
+            completed_ids.add(brief.id)
+            if len(in_flight) >= concurrency * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(future)
+            in_flight.add(executor.submit(run_brief, team, brief, docs_dir, usage))
+
+        for future in wait(in_flight).done:
+            record(future)
+
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate marketing plans for a file of briefs.")
+    parser.add_argument("input", help="JSONL or CSV file of briefs")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--docs-dir", default="plans", help="directory for the generated Word documents")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of plans generated at once")
+    parser.add_argument("--checkpoint", help="checkpoint file (defaults to <output>.checkpoint)")
+    parser.add_argument("--plan-timeout", type=float, help="seconds a plan may take before it stops with the "
+                                                              "sections finished so far")
+    parser.add_argument("--usage-json", help="write the run's token usage roll-up to this JSON file")
+    parser.add_argument("--usage-metrics", help="write the run's token usage roll-up in Prometheus text format")
+    parser.add_argument("--log-file", help="write the log to this file instead of stderr")
+    parser.add_argument("--profile-dir", help="profile every plan, writing one profile per plan to this directory")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, default=DEFAULT_PROFILE_MODE,
+                        help="cProfile of the plan's thread, or sampled stacks of the plan's threads (default)")
+    args = parser.parse_args()
+    configure_logging(path=args.log_file)
+
+    if not os.getenv("OPENROUTER_API_KEY"):
+        parser.error("OPENROUTER_API_KEY is not set")
+
+    usage = UsageReport(plans=0)
+    stats = run_batch(args.input, args.output, args.docs_dir, concurrency=args.concurrency,
+                      checkpoint_path=args.checkpoint, usage=usage, plan_timeout=args.plan_timeout,
+                      profiler=PlanProfiler(args.profile_dir, args.profile_mode) if args.profile_dir else None)
+    print(f"Completed: {stats['completed']}, failed: {stats['failed']}, skipped (already done): {stats['skipped']}")
+    totals = usage.totals()
+    print(f"Tokens used: {totals['total_tokens']} ({totals['prompt_tokens']} prompt, "
+          f"{totals['cached_prompt_tokens']} of them from the prompt cache, "
+          f"{totals['completion_tokens']} completion) across {totals['calls']} calls")
+    if args.usage_json:
+        with open(args.usage_json, 'w', encoding='utf-8') as f:
+            f.write(usage.to_json(indent=2))
+    if args.usage_metrics:
+        with open(args.usage_metrics, 'w', encoding='utf-8') as f:
+            f.write(usage.to_prometheus())
+
+
+if __name__ == "__main__":
+    main()
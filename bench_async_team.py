@@ -0,0 +1,65 @@
+"""Compare wall-clock time of the sequential MarketingTeam with AsyncMarketingTeam.
+
+Runs every flow against a local FakeOpenRouterServer that simulates upstream
+latency, so no API key or network access is needed:
+
+    python bench_async_team.py --first-token-delay 0.5 --chunk-delay 0.02
+"""
+import argparse
+import asyncio
+import time
+from unittest.mock import patch
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient, set_default_client
+import marketing_team
+from async_marketing_team import AsyncMarketingTeam
+from stream_observers import NullObserver
+
+
+def time_sequential(server, product, additional_info):
+    client = OpenRouterClient(api_key="bench", base_url=server.url)
+    previous = set_default_client(client)
+    try:
+        team = marketing_team.MarketingTeam(observer_factory=NullObserver, write_document=False)
+        with patch('builtins.print'):
+            start = time.perf_counter()
+            team.discuss_marketing_plan(product, additional_info)
+            return time.perf_counter() - start
+    finally:
+        set_default_client(previous)
+        client.close()
+
+
+def time_async(server, product, additional_info, fan_out):
+    async def _run():
+        async with AsyncMarketingTeam(client=AsyncOpenRouterClient(api_key="bench", base_url=server.url),
+                                      fan_out=fan_out, write_document=False, verbose=False) as team:
+            start = time.perf_counter()
+            await team.discuss_marketing_plan(product, additional_info)
+            return time.perf_counter() - start
+    return asyncio.run(_run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--first-token-delay", type=float, default=0.5)
+    parser.add_argument("--chunk-delay", type=float, default=0.02)
+    parser.add_argument("--response-words", type=int, default=60)
+    args = parser.parse_args()
+
+    text = " ".join(f"word{i}" for i in range(args.response_words))
+    product, additional_info = "Benchmark Product", {'language': 'english'}
+    with FakeOpenRouterServer(response_text=text, first_token_delay=args.first_token_delay,
+                              chunk_delay=args.chunk_delay) as server:
+        sequential = time_sequential(server, product, additional_info)
+        async_sequential = time_async(server, product, additional_info, fan_out=False)
+        async_fan_out = time_async(server, product, additional_info, fan_out=True)
+
+    print(f"MarketingTeam (sequential):      {sequential:.2f}s")
+    print(f"AsyncMarketingTeam (graph):      {async_sequential:.2f}s")
+    print(f"AsyncMarketingTeam (fan-out):    {async_fan_out:.2f}s  "
+          f"({(1 - async_fan_out / sequential) * 100:.0f}% faster than sequential)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Micro-benchmark: ChatStreamParser vs. the per-delta `full_response +=` loop it replaced.
+
+    python bench_sse_parser.py --deltas 20000 --repeat 5
+"""
+import json
+import argparse
+import timeit
+from sse_parser import ChatStreamParser
+
+
+def legacy_parse(lines):
+    """The loop every agent used to carry: decode and json.loads every line, grow a string."""
+    full_response = ""
+    for line in lines:
+        if line:
+            chunk = line.decode('utf-8').strip()
+            if chunk.startswith("data: "):
+                try:
+                    chunk_data = json.loads(chunk[6:])
+                    if chunk_data['choices'][0]['finish_reason'] is None:
+                        content = chunk_data['choices'][0]['delta'].get('content', '')
+                        full_response += content
+                except json.JSONDecodeError:
+                    continue
+    return full_response
+
+
+def parser_parse(lines):
+    parser = ChatStreamParser()
+    for line in lines:
+        parser.feed_line(line)
+    return parser.text
+
+
+def synthetic_stream(deltas, keepalive_every=20):
+    lines = []
+    for i in range(deltas):
+        if i % keepalive_every == 0:
+            lines += [b": OPENROUTER PROCESSING", b""]
+        chunk = {"id": "gen-bench", "choices": [{"delta": {"content": f"token{i} "}, "finish_reason": None}]}
+        lines += [b"data: " + json.dumps(chunk).encode('utf-8'), b""]
+    lines += [b"data: [DONE]", b""]
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deltas", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = synthetic_stream(args.deltas)
+    assert legacy_parse(lines) == parser_parse(lines)
+    legacy = min(timeit.repeat(lambda: legacy_parse(lines), number=1, repeat=args.repeat))
+    current = min(timeit.repeat(lambda: parser_parse(lines), number=1, repeat=args.repeat))
+    print(f"{args.deltas} deltas, {len(lines)} lines")
+    print(f"legacy loop:      {legacy * 1000:.1f} ms")
+    print(f"ChatStreamParser: {current * 1000:.1f} ms ({legacy / current:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
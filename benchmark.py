@@ -0,0 +1,251 @@
+"""End-to-end benchmark and load test against a local fake OpenRouter server.
+
+    python benchmark.py --runs 5 --concurrency 1,2,4,8 --ttft 0.2 --tokens-per-second 200 \\
+        --error-rate 0.02 --rate-limit-rate 0.02 --output bench.json --baseline previous.json
+
+Drives MarketingTeam.discuss_marketing_plan, AsyncMarketingTeam and the
+batch runner through real HTTP streaming, SSE parsing, scheduling and
+document writing. Reports p50/p95/p99 latency, throughput at each
+concurrency level, CPU time and peak RSS, and saves everything as JSON.
+With --baseline, latency and throughput are compared with an earlier run;
+the exit status is 1 when any of them regressed by more than
+--max-regression.
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient, set_default_client
+from request_scheduler import RequestScheduler, set_default_scheduler
+from marketing_team import MarketingTeam
+from async_marketing_team import AsyncMarketingTeam
+from batch_runner import run_batch
+from stream_observers import NullObserver
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PRODUCT, ADDITIONAL_INFO = "Benchmark Product", {'language': 'english'}
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile (q in 0..100) of a non-empty list."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "mean": sum(latencies) / len(latencies),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies),
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Measurement:
+    """Wall-clock and CPU time of a block."""
+
+    def __enter__(self):
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall = time.perf_counter() - self._wall
+        self.cpu = time.process_time() - self._cpu
+
+    def as_dict(self):
+        return {"wall_seconds": self.wall, "cpu_seconds": self.cpu}
+
+
+def bench_sequential(runs):
+    # Every run repeats the same brief, so stored stage outputs would answer all but the first
+    team = MarketingTeam(observer_factory=NullObserver, verbose=False, stage_store=False)
+    latencies, failures = [], 0
+    with Measurement() as measurement:
+        for _ in range(runs):
+            start = time.perf_counter()
+            if team.discuss_marketing_plan(PRODUCT, ADDITIONAL_INFO, output_path=io.BytesIO()) is None:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+    return {"latency": latency_summary(latencies), "failures": failures, **measurement.as_dict()}
+
+
+def bench_async(server, runs, fan_out):
+    async def _run():
+        latencies, failures = [], 0
+        async with AsyncMarketingTeam(client=AsyncOpenRouterClient(api_key="bench", base_url=server.url,
+                                                                   single_flight=False),
+                                      fan_out=fan_out, verbose=False, stage_store=False) as team:
+            for _ in range(runs):
+                start = time.perf_counter()
+                if await team.discuss_marketing_plan(PRODUCT, ADDITIONAL_INFO, output_path=io.BytesIO()) is None:
+                    failures += 1
+                latencies.append(time.perf_counter() - start)
+        return latencies, failures
+
+    with Measurement() as measurement:
+        latencies, failures = asyncio.run(_run())
+    return {"latency": latency_summary(latencies), "failures": failures, **measurement.as_dict()}
+
+
+def bench_batch(concurrency, plans):
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "briefs.jsonl")
+        output_path = os.path.join(tmp, "results.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i in range(plans):
+                f.write(json.dumps({"id": f"bench-{i}", "brief": f"Product {i}. Benchmark brief."}) + "\n")
+        with Measurement() as measurement:
+            team = MarketingTeam(observer_factory=NullObserver, verbose=False, stage_store=False)
+            stats = run_batch(input_path, output_path, os.path.join(tmp, "plans"), concurrency=concurrency, team=team)
+        with open(output_path, encoding="utf-8") as f:
+            latencies = [json.loads(line)["elapsed"] for line in f]
+    return {
+        "concurrency": concurrency,
+        "plans": plans,
+        "failures": stats["failed"],
+        "throughput_plans_per_second": plans / measurement.wall,
+        "latency": latency_summary(latencies),
+        **measurement.as_dict(),
+    }
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, max_regression):
+    """Return human-readable regressions of `results` against `baseline`."""
+    regressions = []
+
+    def check(name, current, previous, higher_is_better=False):
+        if not current or not previous:
+            return
+        change = (previous - current) / previous if higher_is_better else (current - previous) / previous
+        if change > max_regression:
+            regressions.append(f"{name}: {previous:.3f} -> {current:.3f} ({change:+.0%})")
+
+    for name, scenario in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for q in ("p50", "p95", "p99"):
+            check(f"{name} {q}", scenario["latency"].get(q), previous["latency"].get(q))
+        check(f"{name} throughput", scenario.get("throughput_plans_per_second"),
+              previous.get("throughput_plans_per_second"), higher_is_better=True)
+    return regressions
+
+
+def run_benchmarks(args):
+    text = " ".join(f"word{i}" for i in range(args.response_words))
+    server_kwargs = dict(response_text=text, first_token_delay=args.ttft, tokens_per_second=args.tokens_per_second,
+                         error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, seed=args.seed)
+    if args.recording:
+        server = FakeOpenRouterServer.from_recording(args.recording, **{k: v for k, v in server_kwargs.items()
+                                                                       if k != 'response_text'})
+    else:
+        server = FakeOpenRouterServer(**server_kwargs)
+
+    scenarios = {}
+    with server:
+        # The fake server answers every prompt alike, which would let unrelated requests coalesce
+        client = OpenRouterClient(api_key="bench", base_url=server.url, single_flight=False)
+        previous_client = set_default_client(client)
+        previous_scheduler = set_default_scheduler(RequestScheduler(base_delay=0.05, max_delay=1.0))
+        try:
+            scenarios["sequential"] = bench_sequential(args.runs)
+            scenarios["async"] = bench_async(server, args.runs, fan_out=False)
+            scenarios["async_fan_out"] = bench_async(server, args.runs, fan_out=True)
+            for concurrency in args.concurrency:
+                scenarios[f"batch_c{concurrency}"] = bench_batch(concurrency, args.batch_plans or concurrency * 2)
+        finally:
+            set_default_client(previous_client)
+            set_default_scheduler(previous_scheduler)
+            client.close()
+        requests_served = len(server.requests)
+
+    return {
+        "version": git_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "requests_served": requests_served,
+        "peak_rss_mb": peak_rss_mb(),
+        "scenarios": scenarios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="plans per single-plan scenario")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        type=lambda value: [int(level) for level in value.split(",")],
+                        help="comma-separated batch concurrency levels")
+    parser.add_argument("--batch-plans", type=int, help="plans per batch level (default: 2x concurrency)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="simulated time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-words", type=int, default=60)
+    parser.add_argument("--recording", help="JSONL file of recorded completions to replay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for name, scenario in results["scenarios"].items():
+        latency = scenario["latency"]
+        throughput = scenario.get("throughput_plans_per_second")
+        print(f"{name:<16} p50 {latency.get('p50', 0):.2f}s  p95 {latency.get('p95', 0):.2f}s  "
+              f"p99 {latency.get('p99', 0):.2f}s  cpu {scenario['cpu_seconds']:.2f}s"
+              + (f"  {throughput:.2f} plans/s" if throughput else "")
+              + (f"  failures {scenario['failures']}" if scenario['failures'] else ""))
+    print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB" if results['peak_rss_mb'] else "Peak RSS: n/a")
+    print(f"Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import re
+import zlib
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# Stages whose outputs a similar earlier brief can stand in for; the synthesis always runs for the new brief
+REUSABLE_STAGES = ("marketing", "sales", "strategy", "analytics", "final_marketing")
+# Brief fields that must match exactly (through the scope) rather than be compared as free text
+STRUCTURED_FIELDS = ("language", "budget")
+NGRAM_SIZES = (3, 4, 5)
+STOPWORDS = frozenset("a an and at by during for from in into its of on our over per the their to with".split())
+
+
+def _normalize(value):
+    return " ".join(str(value).lower().split())
+
+
+def brief_text(additional_info):
+    """The free-text fields of a brief (everything but the STRUCTURED_FIELDS), as one text."""
+    return "\n".join(f"{name}: {_normalize(value)}" for name, value in sorted(additional_info.items())
+                     if name not in STRUCTURED_FIELDS)
+
+
+def brief_scope(product, additional_info, config=None):
+    """Briefs only match within a scope: the same product, output language, budget and team settings."""
+    payload = json.dumps({"product": _normalize(product), "language": additional_info.get('language', 'english'),
+                          "budget": _normalize(additional_info.get('budget', '')), "config": config or {}},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def embed(text, dim=1024, field=""):
+    """L2-normalized hashed vector of the words and character n-grams of `text`.
+
+    Stopwords are dropped, and each feature is hashed (crc32, stable across
+    processes) together with `field` to one of `dim` buckets with a
+    hash-derived sign, so the vector needs no vocabulary and no model.
+    """
+    words = [word for word in re.findall(r"\w+", text.lower()) if word not in STOPWORDS]
+    padded = f" {' '.join(words)} "
+    features = words + [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+    hashes = np.fromiter((zlib.crc32(f"{field}\x00{feature}".encode('utf-8')) for feature in features),
+                         dtype=np.uint32, count=len(features))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+    vector = np.bincount(hashes % dim, weights=signs, minlength=dim).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_brief(additional_info, dim=1024):
+    """L2-normalized sum of the embed() vectors of a brief's free-text fields.
+
+    Each field hashes into its own features, so the cosine similarity of
+    two briefs is close to the mean similarity of their fields: rewording
+    one field costs a share of the score, and an unchanged field counts
+    in full.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for name, value in additional_info.items():
+        if name not in STRUCTURED_FIELDS:
+            vector += embed(str(value), dim, field=name)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class BriefMatch:
+    """An earlier brief close enough to reuse: its stage outputs and cosine `similarity` to the new one."""
+
+    def __init__(self, brief_id, similarity, brief, outputs):
+        self.id = brief_id
+        self.similarity = similarity
+        self.brief = brief
+        self.outputs = outputs
+
+
+class BriefIndex:
+    """Nearest-neighbour index of past briefs and their stage outputs, for reusing near-duplicate plans.
+
+    Briefs are embedded with embed_brief() and kept as rows of one NumPy
+    matrix, so a lookup is a single matrix-vector product. A lookup whose
+    best match in the same scope (see brief_scope()) reaches `threshold`
+    cosine similarity is a hit.
+    At most `max_entries` briefs are kept; beyond that the least recently
+    used is evicted. With `db_path` the index lives in SQLite as well and
+    is reloaded on start.
+    """
+
+    def __init__(self, db_path=None, max_entries=1000, threshold=0.82, dim=1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.dim = dim
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        # Per matrix row: brief id, scope, brief text, stage outputs, last use
+        self._ids = [None] * max_entries
+        self._scopes = np.full(max_entries, "", dtype=object)
+        self._briefs = [None] * max_entries
+        self._outputs = [None] * max_entries
+        self._last_used = np.full(max_entries, -np.inf)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS briefs (id TEXT PRIMARY KEY, scope TEXT NOT NULL, "
+                             "brief TEXT NOT NULL, vector BLOB NOT NULL, outputs TEXT NOT NULL, "
+                             "last_used REAL NOT NULL)")
+            self._db.commit()
+            self._load()
+
+    @classmethod
+    def from_env(cls):
+        """Build the index described by OPENROUTER_BRIEF_* variables, or None unless OPENROUTER_BRIEF_INDEX=on."""
+        if os.environ.get("OPENROUTER_BRIEF_INDEX", "off").lower() not in ("on", "1", "true", "yes"):
+            return None
+        return cls(db_path=os.environ.get("OPENROUTER_BRIEF_DB") or None,
+                   max_entries=int(os.environ.get("OPENROUTER_BRIEF_INDEX_SIZE", 1000)),
+                   threshold=float(os.environ.get("OPENROUTER_BRIEF_THRESHOLD", 0.82)))
+
+    def _load(self):
+        rows = self._db.execute("SELECT id, scope, brief, vector, outputs, last_used FROM briefs "
+                                "ORDER BY last_used DESC LIMIT ?", (self.max_entries,)).fetchall()
+        for brief_id, scope, brief, vector, outputs, last_used in reversed(rows):
+            vector = np.frombuffer(vector, dtype=np.float32)
+            if len(vector) == self.dim:
+                self._store(self._size, brief_id, scope, brief, vector, json.loads(outputs), last_used)
+                self._size += 1
+        # Rows beyond the cap (from a run with a larger index) are dropped
+        self._db.execute("DELETE FROM briefs WHERE id NOT IN (SELECT id FROM briefs ORDER BY last_used DESC "
+                         "LIMIT ?)", (self.max_entries,))
+        self._db.commit()
+
+    def _store(self, row, brief_id, scope, brief, vector, outputs, last_used):
+        self._vectors[row] = vector
+        self._ids[row] = brief_id
+        self._scopes[row] = scope
+        self._briefs[row] = brief
+        self._outputs[row] = outputs
+        self._last_used[row] = last_used
+
+    def _similarities(self, vector, scope):
+        similarities = np.full(self.max_entries, -np.inf, dtype=np.float32)
+        if self._size:
+            in_scope = self._scopes[:self._size] == scope
+            similarities[:self._size] = np.where(in_scope, self._vectors[:self._size] @ vector, -np.inf)
+        return similarities
+
+    def lookup(self, additional_info, scope):
+        """The closest earlier brief in `scope` as a BriefMatch if it reaches the threshold, else None."""
+        vector = embed_brief(additional_info, self.dim)
+        with self._lock:
+            similarities = self._similarities(vector, scope)
+            best = int(np.argmax(similarities)) if self._size else None
+            if best is None or similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_used[best] = time.time()
+            if self._db is not None:
+                self._db.execute("UPDATE briefs SET last_used = ? WHERE id = ?",
+                                 (self._last_used[best], self._ids[best]))
+                self._db.commit()
+            return BriefMatch(self._ids[best], float(similarities[best]), self._briefs[best],
+                              dict(self._outputs[best]))
+
+    def add(self, additional_info, scope, outputs):
+        """Index a finished brief with its outputs of the REUSABLE_STAGES; returns its id."""
+        brief = brief_text(additional_info)
+        brief_id = hashlib.sha256(f"{scope}\n{brief}".encode('utf-8')).hexdigest()
+        outputs = {stage: str(outputs[stage]) for stage in REUSABLE_STAGES if stage in outputs}
+        vector = embed_brief(additional_info, self.dim)
+        now = time.time()
+        with self._lock:
+            if brief_id in self._ids:
+                row = self._ids.index(brief_id)
+            elif self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used))
+                self.evictions += 1
+                if self._db is not None:
+                    self._db.execute("DELETE FROM briefs WHERE id = ?", (self._ids[row],))
+            self._store(row, brief_id, scope, brief, vector, outputs, now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO briefs (id, scope, brief, vector, outputs, last_used) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)",
+                                 (brief_id, scope, brief, vector.tobytes(), json.dumps(outputs), now))
+                self._db.commit()
+        return brief_id
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": self._size, "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._ids = [None] * self.max_entries
+            self._last_used[:] = -np.inf
+            if self._db is not None:
+                self._db.execute("DELETE FROM briefs")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,175 @@
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from openrouter_errors import DeadlineExceeded, OperationCancelled
+
+_current_token = contextvars.ContextVar("cancel_token", default=None)
+
+
+class CancellationToken:
+    """Cooperative cancellation with an optional deadline `timeout` seconds from now.
+
+    cancel(), or the deadline passing, fires the callbacks registered with
+    on_cancel() exactly once, in the cancelling thread (a timer thread for
+    deadlines); clients use them to close in-flight streams. A token made
+    with `parent` is cancelled along with it and never outlives its
+    deadline. close() releases the timer and the link to the parent.
+    """
+
+    def __init__(self, timeout=None, parent=None):
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        if parent is not None and parent.deadline is not None:
+            self.deadline = parent.deadline if self.deadline is None else min(self.deadline, parent.deadline)
+        self.reason = None
+        self._callbacks = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._timer = None
+        if self.deadline is not None:
+            self._timer = threading.Timer(max(0.0, self.deadline - time.monotonic()), self.cancel, ("deadline",))
+            self._timer.daemon = True
+            self._timer.start()
+        self._unlink = parent.on_cancel(lambda: self.cancel(parent.reason)) if parent is not None else None
+
+    def child(self, timeout=None):
+        """A token cancelled with this one, with its own (never later) deadline."""
+        return CancellationToken(timeout, parent=self)
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def remaining(self):
+        """Seconds left until the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        self._cancelled.set()
+        if self._timer is not None:
+            self._timer.cancel()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logging.exception("Cancellation callback failed")
+
+    def on_cancel(self, callback):
+        """Call `callback()` once the token is cancelled (right away if it already is); returns an unregister function."""
+        with self._lock:
+            if self.reason is None:
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+        callback()
+        return lambda: None
+
+    def error(self):
+        """The exception describing why the token was cancelled."""
+        if self.reason == "deadline":
+            return DeadlineExceeded("Deadline exceeded")
+        return OperationCancelled(f"Cancelled: {self.reason}")
+
+    def expired(self):
+        """True once the token is cancelled or its deadline has passed (even if its timer has not fired yet)."""
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+        return self.reason is not None
+
+    def check(self):
+        """Raise the token's error if it is cancelled or its deadline has passed."""
+        if self.expired():
+            raise self.error()
+
+    def wait(self, timeout):
+        """Sleep for up to `timeout` seconds, waking early (and raising) when the token is cancelled."""
+        if self._cancelled.wait(timeout):
+            raise self.error()
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        if self._unlink is not None:
+            self._unlink()
+
+
+def current_token():
+    """The CancellationToken installed for the current thread or task, if any."""
+    return _current_token.get()
+
+
+@contextmanager
+def cancel_scope(token):
+    """Make every API call inside the block honour `token` (None lifts an outer one)."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def plan_token(timeout=None, parent=None):
+    """Token for one plan run: `timeout` seconds, cancelled with `parent`; None when neither is given."""
+    if timeout is None and parent is None:
+        return None
+    return CancellationToken(timeout, parent=parent)
+
+
+@contextmanager
+def stage_scope(token, stages_left):
+    """Run one stage under an even share of the plan's remaining time.
+
+    The stage gets the time left divided by the stages still to run
+    (itself included), so time a stage does not use carries over to the
+    ones after it.
+    """
+    if token is None:
+        yield None
+        return
+    remaining = token.remaining()
+    child = token.child(remaining / max(1, stages_left) if remaining is not None else None)
+    try:
+        with cancel_scope(child):
+            yield child
+    finally:
+        child.close()
+
+
+async def run_with_token(awaitable, token=None):
+    """Await the coroutine `awaitable`, cancelling it as soon as `token` (the current one by default) is cancelled."""
+    token = token or current_token()
+    if token is None:
+        return await awaitable
+    if token.expired():
+        awaitable.close()
+        raise token.error()
+    loop = asyncio.get_running_loop()
+    task = asyncio.ensure_future(awaitable)
+
+    def cancel_task():
+        try:
+            loop.call_soon_threadsafe(task.cancel)
+        except RuntimeError:
+            # The loop is already closed
+            pass
+
+    unregister = token.on_cancel(cancel_task)
+    try:
+        return await task
+    except asyncio.CancelledError:
+        if token.cancelled:
+            raise token.error() from None
+        raise
+    finally:
+        unregister()
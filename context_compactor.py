@@ -0,0 +1,121 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from base_ai_agent import BaseAIAgent
+from request_scheduler import estimate_tokens
+from stream_observers import NullObserver, observe
+
+COMPACTION_MODES = ('summarize', 'truncate')
+
+
+class ContextCompactor:
+    """Fits earlier stage outputs into a token budget before they go into later prompts.
+
+    Each output is held to `max_tokens`. One that fits is passed through
+    unchanged; a longer one is summarized by the model (mode "summarize") or
+    cut at a word boundary (mode "truncate"). The budget is per output rather
+    than per prompt, so an output condenses to the same text wherever it is
+    used. Results are cached by text, budget and language, so each output is
+    condensed once and reused by every later stage. Token counts use the same
+    local estimate as the scheduler.
+    """
+
+    def __init__(self, max_tokens=800, mode='summarize', agent=None, max_entries=256):
+        if mode not in COMPACTION_MODES:
+            raise ValueError(f"Unknown compaction mode {mode!r}, expected one of {COMPACTION_MODES}")
+        self.max_tokens = max_tokens
+        self.mode = mode
+        self.agent = agent or BaseAIAgent()
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, text, budget, language):
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return f"{self.mode}:{budget}:{language}:{digest}"
+
+    def _cached(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def _summary_prompt(self, text, budget):
+        # Ask for fewer words than the budget allows; models overshoot word limits
+        words = max(20, int(budget * 0.6))
+        return (f"Summarize the following text in at most {words} words. Keep every concrete fact, figure, "
+                f"channel, audience and recommendation; drop repetition and filler.\n\n{text}")
+
+    def compact(self, text, budget=None, language='english'):
+        """Return `text`, or a condensed version of it if it exceeds `budget` tokens."""
+        budget = budget or self.max_tokens
+        if not budget or estimate_tokens(text) <= budget:
+            return text
+        key = self._key(text, budget, language)
+        compacted = self._cached(key)
+        if compacted is None:
+            if self.mode == 'truncate':
+                compacted = truncate_to_tokens(text, budget)
+            else:
+                with observe(NullObserver()):
+                    summary = self.agent.call_openrouter_api(self._summary_prompt(text, budget), language=language,
+                                                             route='compaction')
+                # The model can overshoot the requested length
+                compacted = truncate_to_tokens(summary, budget)
+            logging.info(f"Compacted context from ~{estimate_tokens(text)} to ~{estimate_tokens(compacted)} tokens")
+            self._store(key, compacted)
+        return compacted
+
+    async def acompact(self, text, budget=None, language='english'):
+        """Async version of compact."""
+        budget = budget or self.max_tokens
+        if not budget or estimate_tokens(text) <= budget:
+            return text
+        key = self._key(text, budget, language)
+        compacted = self._cached(key)
+        if compacted is None:
+            if self.mode == 'truncate':
+                compacted = truncate_to_tokens(text, budget)
+            else:
+                with observe(NullObserver()):
+                    summary = await self.agent.acall_openrouter_api(self._summary_prompt(text, budget),
+                                                                    language=language, route='compaction')
+                compacted = truncate_to_tokens(summary, budget)
+            logging.info(f"Compacted context from ~{estimate_tokens(text)} to ~{estimate_tokens(compacted)} tokens")
+            self._store(key, compacted)
+        return compacted
+
+    def compact_all(self, texts, language='english'):
+        return [self.compact(text, language=language) for text in texts]
+
+    async def acompact_all(self, texts, language='english'):
+        return [await self.acompact(text, language=language) for text in texts]
+
+    def join(self, texts, language='english'):
+        """Compact `texts` and join them with newlines, as the stages pass context along."""
+        return "\n".join(self.compact_all(texts, language))
+
+    async def ajoin(self, texts, language='english'):
+        return "\n".join(await self.acompact_all(texts, language))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+def truncate_to_tokens(text, budget):
+    """Cut `text` to roughly `budget` tokens at a word boundary."""
+    limit = budget * 4
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(' ', 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip() + " [...]"
@@ -0,0 +1,225 @@
+import json
+import time
+import argparse
+import random
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _FakeOpenRouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server.fake
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server._record(payload, self.client_address)
+
+        failure = server._next_failure() or server._random_failure()
+        if failure is not None:
+            status_code, retry_after = failure
+            body = json.dumps({"error": {"code": status_code, "message": "Injected failure"}}).encode('utf-8')
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if retry_after is not None:
+                self.send_header("Retry-After", str(retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        first_token_delay = server._next_stall()
+        if first_token_delay is None:
+            first_token_delay = server.first_token_delay
+        if first_token_delay:
+            time.sleep(first_token_delay)
+        chunk_delay = 1.0 / server.tokens_per_second if server.tokens_per_second else server.chunk_delay
+        try:
+            for event in server.events_for(payload):
+                self._write_chunk(f"data: {event}\n\n".encode('utf-8'))
+                if chunk_delay:
+                    time.sleep(chunk_delay)
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the stream (e.g. a cancelled hedge)
+            self.close_connection = True
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenRouterServer:
+    """Local stand-in for the OpenRouter chat completions endpoint.
+
+    Streams `response_text` back as OpenAI-style SSE deltas and records every
+    request payload and client connection it sees. `first_token_delay` and
+    `chunk_delay` (seconds) simulate upstream latency; `tokens_per_second`
+    overrides `chunk_delay`, counting each chunk as one token. `responses`
+    replays recorded completions in turn instead of `response_text`.
+    `error_rate` and `rate_limit_rate` are the fractions of requests answered
+    with a 500 or a 429 (with `retry_after`), drawn from a seeded RNG.
+    System blocks marked with `cache_control` are counted one token per word
+    and reported as `cached_tokens` when the same block was seen before, like
+    a provider prompt cache.
+    """
+
+    def __init__(self, response_text="Fake response", chunk_size=8, first_token_delay=0.0, chunk_delay=0.0,
+                 host="127.0.0.1", port=0, tokens_per_second=None, responses=None, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=0, seed=0):
+        self.response_text = response_text
+        self.chunk_size = chunk_size
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.tokens_per_second = tokens_per_second
+        self._responses = itertools.cycle(responses) if responses else None
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.requests = []
+        self.client_addresses = set()
+        self._failures = []
+        self._stalls = []
+        self._cached_prefixes = set()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _FakeOpenRouterHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def _record(self, payload, client_address):
+        with self._lock:
+            self.requests.append(payload)
+            self.client_addresses.add(client_address)
+
+    def fail_next(self, status_code, times=1, retry_after=None):
+        """Answer the next `times` requests with `status_code` (and a Retry-After header if given)."""
+        with self._lock:
+            self._failures.extend([(status_code, retry_after)] * times)
+
+    def stall_next(self, seconds, times=1):
+        """Hold the first token of the next `times` streams back for `seconds`, like a slow upstream."""
+        with self._lock:
+            self._stalls.extend([seconds] * times)
+
+    def _next_stall(self):
+        with self._lock:
+            return self._stalls.pop(0) if self._stalls else None
+
+    def _next_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def _random_failure(self):
+        if not (self.error_rate or self.rate_limit_rate):
+            return None
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429, self.retry_after
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, None
+        return None
+
+    @classmethod
+    def from_recording(cls, path, **kwargs):
+        """Serve the completions recorded in a JSONL file (one {"text": ...} object per line)."""
+        with open(path, encoding='utf-8') as f:
+            responses = [json.loads(line)["text"] for line in f if line.strip()]
+        return cls(responses=responses, **kwargs)
+
+    def _next_text(self):
+        if self._responses is None:
+            return self.response_text
+        with self._lock:
+            return next(self._responses)
+
+    def _prompt_usage(self, payload):
+        """Prompt token counts for a request: (prompt_tokens, cached_tokens)."""
+        messages = payload.get('messages') or []
+        system = messages[0] if messages and messages[0].get('role') == 'system' else None
+        blocks = system.get('content') if system else None
+        if not isinstance(blocks, list):
+            return 10, 0
+        cacheable = " ".join(block.get('text', '') for block in blocks if block.get('cache_control'))
+        prefix_tokens = len(cacheable.split())
+        with self._lock:
+            hit = cacheable in self._cached_prefixes
+            self._cached_prefixes.add(cacheable)
+        return 10 + prefix_tokens, prefix_tokens if hit else 0
+
+    def events_for(self, payload):
+        """Yield the JSON-encoded SSE events for one request."""
+        text = self._next_text()
+        prompt_tokens, cached_tokens = self._prompt_usage(payload)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text.split()),
+                 "total_tokens": prompt_tokens + len(text.split())}
+        if cached_tokens:
+            usage["prompt_tokens_details"] = {"cached_tokens": cached_tokens}
+        for i in range(0, len(text), self.chunk_size):
+            yield json.dumps({
+                "id": "gen-fake",
+                "choices": [{"delta": {"content": text[i:i + self.chunk_size]}, "finish_reason": None}]
+            })
+        yield json.dumps({
+            "id": "gen-fake",
+            "choices": [{"delta": {}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+        yield "[DONE]"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake OpenRouter completions for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--ttft", type=float, default=0.2, help="time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--recording", help="JSONL file of recorded completions to replay")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    kwargs = dict(host=args.host, port=args.port, first_token_delay=args.ttft, tokens_per_second=args.tokens_per_second,
+                  error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    server = FakeOpenRouterServer.from_recording(args.recording, **kwargs) if args.recording else FakeOpenRouterServer(**kwargs)
+    server.start()
+    print(f"Serving fake completions at {server.url} (set OPENROUTER_BASE_URL to use it)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
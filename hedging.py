@@ -0,0 +1,205 @@
+import os
+import time
+import threading
+from collections import deque
+from stream_observers import StreamObserver
+
+# Claims the race: the first racer to produce one of these becomes the winner
+_CLAIMING_EVENTS = ("on_token", "on_complete")
+
+
+class HedgePolicy:
+    """When to send a second, identical request for a stream that is slow to start.
+
+    A hedge is sent once a stream has gone `delay` seconds without its first
+    token, or, without a fixed delay, longer than the observed `percentile`
+    of time to first token (after `min_samples` observations, never below
+    `min_delay`). Hedges are capped at `max_ratio` of all requests (plus a
+    `burst` allowance), so hedging cannot inflate spend by more than that;
+    the losing stream is cancelled as soon as the other one produces its
+    first token. Shared by every call of the client that holds it.
+    """
+
+    def __init__(self, delay=None, percentile=95, min_samples=20, min_delay=0.5, max_ratio=0.05, burst=1,
+                 window=500):
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges_issued = 0
+        self.hedges_won = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build the policy described by OPENROUTER_HEDGE_* variables, or None unless OPENROUTER_HEDGE=on."""
+        if os.environ.get("OPENROUTER_HEDGE", "off").lower() not in ("on", "1", "true", "yes"):
+            return None
+        delay = os.environ.get("OPENROUTER_HEDGE_DELAY")
+        return cls(delay=float(delay) if delay else None,
+                   max_ratio=float(os.environ.get("OPENROUTER_HEDGE_BUDGET", 0.05)))
+
+    def threshold(self):
+        """Seconds without a first token before hedging, or None while there is no basis yet."""
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def observe(self, time_to_first_token):
+        if time_to_first_token is not None:
+            with self._lock:
+                self._samples.append(time_to_first_token)
+
+    def try_hedge(self):
+        """Take a hedge from the budget; False once hedges would exceed max_ratio of requests."""
+        with self._lock:
+            if self.hedges_issued + 1 > self.max_ratio * self.requests + self.burst:
+                return False
+            self.hedges_issued += 1
+            return True
+
+    def record_win(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def stats(self):
+        threshold = self.threshold()
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges_issued": self.hedges_issued,
+                "hedges_won": self.hedges_won,
+                "hedge_ratio": self.hedges_issued / self.requests if self.requests else 0.0,
+                "threshold": threshold,
+            }
+
+
+class _Racer(StreamObserver):
+    def __init__(self, race, name):
+        super().__init__(name)
+        self._race = race
+        self._name = name
+
+    def on_start(self):
+        self._race.event(self._name, "on_start", ())
+
+    def on_bytes(self, count):
+        self._race.event(self._name, "on_bytes", (count,))
+
+    def on_chunk(self, chunk_data):
+        self._race.event(self._name, "on_chunk", (chunk_data,))
+
+    def on_token(self, text):
+        self._race.event(self._name, "on_token", (text,))
+
+    def on_complete(self, text):
+        self._race.event(self._name, "on_complete", (text,))
+
+    def on_error(self, error):
+        self._race.event(self._name, "on_error", (error,))
+
+
+class HedgeRace:
+    """Lets a primary and a hedge stream race for one observer.
+
+    Until a hedge is started the primary's events go straight through.
+    After that each racer's events are held back until one of them produces
+    its first token (or completes): that racer wins, its held-back events
+    are flushed to the observer, the rest of its stream follows live, and
+    the other racer is cancelled through its registered cancel callback.
+    """
+
+    def __init__(self, observer, on_claim=None):
+        self.observer = observer
+        self.on_claim = on_claim
+        self.winner = None
+        self.hedged = False
+        self.closed = False
+        self.started_at = {}
+        self.first_token_at = {}
+        self._buffers = {}
+        self._cancel = {}
+        # Re-entrant so start_hedge's callback can register the hedge racer
+        self._lock = threading.RLock()
+
+    def racer(self, name, cancel=None):
+        with self._lock:
+            self.started_at[name] = time.perf_counter()
+            self._buffers[name] = []
+            if cancel is not None:
+                self._cancel[name] = cancel
+            if name != "primary":
+                self.hedged = True
+        return _Racer(self, name)
+
+    def set_cancel(self, name, cancel):
+        with self._lock:
+            self._cancel[name] = cancel
+
+    def start_hedge(self, start):
+        """Run `start()` unless the race is already decided or closed; returns its result or None."""
+        with self._lock:
+            if self.winner is not None or self.closed:
+                return None
+            return start()
+
+    def close(self):
+        """Stop further hedges from being started."""
+        with self._lock:
+            self.closed = True
+
+    def cancel(self, name):
+        with self._lock:
+            cancel = self._cancel.get(name)
+        if cancel is not None:
+            cancel()
+
+    def event(self, name, method, args):
+        flush, losers, claimed = [], [], False
+        with self._lock:
+            if self.winner is None:
+                if method in _CLAIMING_EVENTS:
+                    self.winner, claimed = name, True
+                    self.first_token_at[name] = time.perf_counter()
+                    flush = self._buffers.pop(name, [])
+                    if name != "primary":
+                        # The observer already saw the primary start
+                        flush = [event for event in flush if event[0] != "on_start"]
+                    losers = [cancel for other, cancel in self._cancel.items() if other != name]
+                elif self.hedged or name != "primary":
+                    self._buffers[name].append((method, args))
+                    return
+            elif self.winner != name:
+                return
+        # Only the winner gets past this point, so its events stay in order
+        for buffered_method, buffered_args in flush:
+            getattr(self.observer, buffered_method)(*buffered_args)
+        getattr(self.observer, method)(*args)
+        if claimed:
+            for cancel in losers:
+                cancel()
+            if self.on_claim is not None:
+                self.on_claim()
+
+    def fail(self, error):
+        """Report the error the race ends with when no racer ever won (held-back errors were dropped)."""
+        if self.hedged and self.winner is None:
+            self.observer.on_error(error)
+
+    def time_to_first_token(self, name):
+        if name not in self.first_token_at:
+            return None
+        return self.first_token_at[name] - self.started_at[name]
@@ -0,0 +1,418 @@
+"""Durable job queue in SQLite, and worker processes that generate plans from it.
+
+    python job_queue.py --db jobs.db enqueue briefs.jsonl
+    python job_queue.py --db jobs.db work --docs-dir plans --concurrency 4    # start as many as you like
+    python job_queue.py --db jobs.db stats [--prometheus]
+    python job_queue.py --db jobs.db results --output results.jsonl
+
+Briefs use the same fields as batch mode. Each worker process claims jobs
+under a lease that it renews with heartbeats while the plan runs. If a
+worker crashes or hangs, its lease expires and another worker picks the job
+up again, up to `max_attempts` times. A worker that loses a lease cancels
+that plan. Results are stored in the database, and documents are written to
+`--docs-dir`.
+
+The default WAL journal needs every process on the host that holds the
+database file. For workers on several machines, put the database and
+`--docs-dir` on a network filesystem with working POSIX locks and pass
+`--journal-mode DELETE` to every command. SQLite warns that many network
+filesystems lock unreliably, so use one host when in doubt.
+"""
+import os
+import json
+import time
+import uuid
+import signal
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+from batch_runner import Brief, iter_briefs, run_brief
+from cancellation import CancellationToken
+from logging_setup import configure_logging
+from marketing_team import MarketingTeam
+from stream_observers import NullObserver
+from usage_tracking import UsageReport
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+# WAL needs shared memory between processes on one host; DELETE is the rollback journal for shared storage
+JOURNAL_MODES = ("WAL", "DELETE")
+
+
+class Job:
+    """A claimed job: its id, the brief record and which attempt this is."""
+
+    def __init__(self, job_id, record, attempts):
+        self.id = job_id
+        self.record = record
+        self.attempts = attempts
+
+
+class JobQueue:
+    """Jobs in one SQLite file, safe to share between threads and processes.
+
+    claim() hands the oldest runnable job to one worker under a lease of
+    `lease_seconds`. Runnable means queued, or running under a lease that has
+    expired. The claimant keeps it with heartbeat() and ends it with
+    complete() or fail(). Both only succeed while the caller still holds the
+    lease, so a worker that was presumed dead cannot overwrite the result of
+    the worker that took over. A job whose lease has expired `max_attempts`
+    times is failed instead of claimed again.
+
+    `journal_mode` is "WAL" (the default, for processes on one host) or
+    "DELETE" for a database on storage shared by several hosts.
+    """
+
+    def __init__(self, path, lease_seconds=60.0, max_attempts=3, journal_mode="WAL"):
+        if journal_mode.upper() not in JOURNAL_MODES:
+            raise ValueError(f"Unknown journal mode {journal_mode!r}, expected one of {JOURNAL_MODES}")
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        # Every thread's connection, so close() can close them all
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        db = self._db()
+        db.execute(f"PRAGMA journal_mode={journal_mode.upper()}")
+        db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, record TEXT NOT NULL, "
+                   "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_expires REAL, "
+                   "enqueued_at REAL NOT NULL, started_at REAL, finished_at REAL, result TEXT, error TEXT)")
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, enqueued_at)")
+
+    def _db(self):
+        # One connection per thread; transactions are managed explicitly
+        db = getattr(self._local, "db", None)
+        if db is None or db not in self._connections:
+            # close() may close it from another thread
+            db = sqlite3.connect(self.path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            self._local.db = db
+            with self._connections_lock:
+                self._connections.add(db)
+        return db
+
+    def enqueue(self, record, job_id=None):
+        """Add a brief record; returns its id. Re-adding an id that is already queued or done does nothing."""
+        job_id = job_id or str(record.get('id') or '') or Brief.from_record(record).id
+        self._db().execute("INSERT OR IGNORE INTO jobs (id, record, status, enqueued_at) VALUES (?, ?, 'queued', ?)",
+                           (job_id, json.dumps(record, ensure_ascii=False), time.time()))
+        return job_id
+
+    def enqueue_many(self, records):
+        """Add many brief records in one transaction; returns how many were new."""
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            before = db.total_changes
+            for record in records:
+                job_id = str(record.get('id') or '') or Brief.from_record(record).id
+                db.execute("INSERT OR IGNORE INTO jobs (id, record, status, enqueued_at) "
+                           "VALUES (?, ?, 'queued', ?)", (job_id, json.dumps(record, ensure_ascii=False), now))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return db.total_changes - before
+
+    def claim(self, worker):
+        """Lease the oldest runnable job to `worker`; returns a Job, or None when there is none."""
+        db = self._db()
+        while True:
+            now = time.time()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute("SELECT id, record, attempts FROM jobs WHERE status = 'queued' "
+                                 "OR (status = 'running' AND lease_expires < ?) "
+                                 "ORDER BY enqueued_at, rowid LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                job_id, record, attempts = row
+                if attempts >= self.max_attempts:
+                    db.execute("UPDATE jobs SET status = 'failed', worker = NULL, finished_at = ?, error = ? "
+                               "WHERE id = ?", (now, f"Lease expired after {attempts} attempts", job_id))
+                    db.execute("COMMIT")
+                    logging.warning(f"Job {job_id} failed: its lease expired after {attempts} attempts")
+                    continue
+                db.execute("UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, attempts = ?, "
+                           "started_at = ? WHERE id = ?", (worker, now + self.lease_seconds, attempts + 1, now, job_id))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            return Job(job_id, json.loads(record), attempts + 1)
+
+    def heartbeat(self, job_id, worker):
+        """Extend the lease; returns False if `worker` no longer holds it."""
+        cursor = self._db().execute("UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? "
+                                    "AND status = 'running'", (time.time() + self.lease_seconds, job_id, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, result):
+        """Store the result and mark the job done; returns False if `worker` had lost the lease."""
+        cursor = self._db().execute("UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?, "
+                                    "lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+                                    (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error, result=None, retry=True):
+        """Put the job back in the queue (or fail it for good once out of attempts, or with retry=False).
+
+        Returns False if `worker` had lost the lease.
+        """
+        db = self._db()
+        row = db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        status = "queued" if retry and row is not None and row[0] < self.max_attempts else "failed"
+        cursor = db.execute("UPDATE jobs SET status = ?, error = ?, result = ?, finished_at = ?, "
+                            "lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+                            (status, error, json.dumps(result, ensure_ascii=False) if result else None,
+                             time.time() if status == "failed" else None, job_id, worker))
+        return cursor.rowcount == 1
+
+    def requeue_failed(self):
+        """Give every failed job a fresh set of attempts; returns how many were requeued."""
+        cursor = self._db().execute("UPDATE jobs SET status = 'queued', attempts = 0, worker = NULL, "
+                                    "finished_at = NULL WHERE status = 'failed'")
+        return cursor.rowcount
+
+    def results(self):
+        """Yield the stored result record of every finished job, oldest first."""
+        for job_id, status, result, error in self._db().execute(
+                "SELECT id, status, result, error FROM jobs WHERE status IN ('done', 'failed') ORDER BY finished_at"):
+            record = json.loads(result) if result else {"id": job_id, "status": "error"}
+            if error:
+                record["error"] = error
+            yield record
+
+    def stats(self):
+        """Queue depth and progress: jobs per status, expired leases, oldest queued job age, running jobs per worker."""
+        db = self._db()
+        now = time.time()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        expired = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running' AND lease_expires < ?",
+                             (now,)).fetchone()[0]
+        oldest = db.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        workers = dict(db.execute("SELECT worker, COUNT(*) FROM jobs WHERE status = 'running' AND lease_expires >= ? "
+                                  "GROUP BY worker", (now,)).fetchall())
+        return {"jobs": counts, "expired_leases": expired,
+                "oldest_queued_seconds": now - oldest if oldest is not None else 0.0, "workers": workers}
+
+    def to_prometheus(self, prefix="marketmind"):
+        """Render stats() in the Prometheus text exposition format."""
+        stats = self.stats()
+        lines = [f"# HELP {prefix}_queue_jobs Jobs in the queue by status.", f"# TYPE {prefix}_queue_jobs gauge"]
+        lines += [f'{prefix}_queue_jobs{{status="{status}"}} {count}' for status, count in stats["jobs"].items()]
+        lines += [f"# HELP {prefix}_queue_expired_leases Running jobs whose worker stopped renewing the lease.",
+                  f"# TYPE {prefix}_queue_expired_leases gauge",
+                  f"{prefix}_queue_expired_leases {stats['expired_leases']}",
+                  f"# HELP {prefix}_queue_oldest_queued_seconds Age of the oldest queued job.",
+                  f"# TYPE {prefix}_queue_oldest_queued_seconds gauge",
+                  f"{prefix}_queue_oldest_queued_seconds {stats['oldest_queued_seconds']:.3f}",
+                  f"# HELP {prefix}_queue_worker_jobs Jobs each worker is running.",
+                  f"# TYPE {prefix}_queue_worker_jobs gauge"]
+        lines += [f'{prefix}_queue_worker_jobs{{worker="{worker}"}} {count}'
+                  for worker, count in sorted(stats["workers"].items())]
+        return "\n".join(lines) + "\n"
+
+    def release(self):
+        """Close the calling thread's connection, for a thread that is done with the queue."""
+        db = getattr(self._local, "db", None)
+        self._local.db = None
+        if db is not None:
+            with self._connections_lock:
+                self._connections.discard(db)
+            db.close()
+
+    def close(self):
+        """Close the connections of every thread; a thread using the queue afterwards opens a new one."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for db in connections:
+            db.close()
+        self._local.db = None
+
+
+class QueueWorker:
+    """Runs plans from a JobQueue on `concurrency` threads, each with its own warm MarketingTeam.
+
+    A heartbeat thread renews the leases of running jobs every third of the
+    lease. When a renewal fails, the job belongs to another worker and its
+    plan is cancelled. Plans that end in an error or a timeout are put back
+    in the queue until the job runs out of attempts.
+    """
+
+    def __init__(self, job_queue, docs_dir, concurrency=2, worker_id=None, team_factory=None, poll_interval=1.0,
+                 plan_timeout=None):
+        self.queue = job_queue
+        self.docs_dir = docs_dir
+        self.concurrency = concurrency
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.team_factory = team_factory or (lambda: MarketingTeam(observer_factory=NullObserver, verbose=False,
+                                                                   plan_timeout=plan_timeout))
+        self.poll_interval = poll_interval
+        self.usage = UsageReport(plans=0)
+        self.stats = {"done": 0, "retried": 0, "failed": 0, "lost": 0}
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        # Set only once every plan has finished, so leases stay renewed while stop() lets them run out
+        self._idle = threading.Event()
+
+    def stop(self):
+        """Stop claiming jobs; running plans finish first."""
+        self._stop.set()
+
+    def run(self, drain=False):
+        """Work until stop() is called, or with `drain` until the queue has nothing left to claim."""
+        os.makedirs(self.docs_dir, exist_ok=True)
+        heartbeat = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+        heartbeat.start()
+        threads = [threading.Thread(target=self._loop, args=(drain,), name=f"queue-worker-{i}")
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._stop.set()
+        self._idle.set()
+        heartbeat.join()
+        logging.info(f"Worker {self.worker_id} stopped: {self.stats}")
+        return dict(self.stats)
+
+    def _loop(self, drain):
+        team = self.team_factory()
+        try:
+            while not self._stop.is_set():
+                try:
+                    job = self.queue.claim(self.worker_id)
+                    if job is not None:
+                        self._process(team, job)
+                        continue
+                except sqlite3.Error as e:
+                    # E.g. "database is locked" under heavy contention; a job left running is reclaimed once its
+                    # lease expires
+                    logging.warning(f"Job queue unavailable: {e}")
+                else:
+                    if drain:
+                        return
+                self._stop.wait(self.poll_interval)
+        finally:
+            self.queue.release()
+
+    def _process(self, team, job):
+        token = CancellationToken()
+        with self._lock:
+            self._running[job.id] = token
+        try:
+            brief = Brief.from_record({**job.record, "id": job.id})
+            result = run_brief(team, brief, self.docs_dir, self.usage, cancel_token=token)
+        except Exception as e:
+            logging.exception(f"Job {job.id} crashed")
+            result = {"id": job.id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+        result["worker"] = self.worker_id
+        result["attempt"] = job.attempts
+        if token.cancelled:
+            # The lease went to another worker, which now owns the job
+            outcome = "lost"
+            logging.warning(f"Job {job.id} was taken over by another worker after its lease expired")
+        elif result["status"] == "ok":
+            self.queue.complete(job.id, self.worker_id, result)
+            outcome = "done"
+        else:
+            error = result.get("error") or f"Plan {result['status']}"
+            self.queue.fail(job.id, self.worker_id, error, result)
+            outcome = "retried" if job.attempts < self.queue.max_attempts else "failed"
+        with self._lock:
+            self.stats[outcome] += 1
+        logging.info(f"Job {job.id} finished with status {result['status']} on attempt {job.attempts}")
+
+    def _heartbeat(self):
+        interval = self.queue.lease_seconds / 3
+        try:
+            while not self._idle.wait(interval):
+                with self._lock:
+                    running = list(self._running.items())
+                for job_id, token in running:
+                    try:
+                        renewed = self.queue.heartbeat(job_id, self.worker_id)
+                    except sqlite3.Error as e:
+                        # Keep the plan running; the next beat retries well before the lease runs out
+                        logging.warning(f"Renewing the lease of job {job_id} failed: {e}")
+                        continue
+                    if not renewed:
+                        token.cancel("lease lost to another worker")
+        finally:
+            self.queue.release()
+
+
+def brief_record(brief):
+    """The brief as a record Brief.from_record reads back unchanged."""
+    fields = {name: value for name, value in brief.additional_info.items() if name != 'additional_info'}
+    return {"id": brief.id, "product": brief.product, "brief": brief.additional_info.get('additional_info', ''),
+            **fields}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Durable job queue of marketing plan briefs.")
+    parser.add_argument("--db", default="jobs.db", help="SQLite file holding the queue")
+    parser.add_argument("--journal-mode", default="WAL", choices=JOURNAL_MODES, type=str.upper,
+                        help="WAL for workers on one host, DELETE for a database on storage shared by several hosts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="add the briefs of a JSONL or CSV file")
+    enqueue.add_argument("input")
+    work = commands.add_parser("work", help="run plans from the queue until stopped")
+    work.add_argument("--docs-dir", default="plans", help="(shared) directory for the generated Word documents")
+    work.add_argument("--concurrency", type=int, default=2, help="plans this worker runs at once")
+    work.add_argument("--lease", type=float, default=60.0, help="seconds a claimed job is leased between heartbeats")
+    work.add_argument("--max-attempts", type=int, default=3, help="attempts per job before it is failed")
+    work.add_argument("--poll-interval", type=float, default=1.0, help="seconds between polls of an empty queue")
+    work.add_argument("--plan-timeout", type=float, help="seconds a plan may take")
+    work.add_argument("--drain", action="store_true", help="exit once the queue is empty instead of polling")
+    work.add_argument("--log-file", help="write the log to this file instead of stderr")
+    stats = commands.add_parser("stats", help="print queue depth and progress")
+    stats.add_argument("--prometheus", action="store_true", help="print in Prometheus text format")
+    results = commands.add_parser("results", help="write the results of finished jobs as JSONL")
+    results.add_argument("--output", default="results.jsonl")
+    commands.add_parser("requeue-failed", help="give failed jobs a fresh set of attempts")
+    args = parser.parse_args()
+
+    if args.command == "enqueue":
+        added = JobQueue(args.db, journal_mode=args.journal_mode).enqueue_many(brief_record(brief) for brief in iter_briefs(args.input))
+        print(f"Queued {added} new briefs")
+    elif args.command == "work":
+        configure_logging(path=args.log_file)
+        if not os.getenv("OPENROUTER_API_KEY"):
+            parser.error("OPENROUTER_API_KEY is not set")
+        worker = QueueWorker(JobQueue(args.db, lease_seconds=args.lease, max_attempts=args.max_attempts,
+                                      journal_mode=args.journal_mode),
+                             args.docs_dir, concurrency=args.concurrency, poll_interval=args.poll_interval,
+                             plan_timeout=args.plan_timeout)
+        signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+        try:
+            print(json.dumps(worker.run(drain=args.drain)))
+        except KeyboardInterrupt:
+            worker.stop()
+    elif args.command == "stats":
+        job_queue = JobQueue(args.db, journal_mode=args.journal_mode)
+        if args.prometheus:
+            print(job_queue.to_prometheus(), end="")
+        else:
+            print(json.dumps(job_queue.stats(), indent=2))
+    elif args.command == "results":
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for record in JobQueue(args.db, journal_mode=args.journal_mode).results():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    elif args.command == "requeue-failed":
+        print(f"Requeued {JobQueue(args.db, journal_mode=args.journal_mode).requeue_failed()} failed jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import atexit
+import random
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(threadName)s - %(message)s'
+# Characters of an agent response kept in the debug log
+RESPONSE_PREVIEW_CHARS = 300
+
+_listener = None
+
+
+class TruncatingFilter(logging.Filter):
+    """Cuts log messages down to `max_chars`, so one huge message can't flood the log."""
+
+    def __init__(self, max_chars=2000):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record):
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            record.msg = f"{message[:self.max_chars]}... [{len(message) - self.max_chars} more chars]"
+            record.args = None
+        return True
+
+
+def configure_logging(level=None, path=None, max_message_chars=2000):
+    """Send the root logger through a queue, so logging never blocks on disk or terminal IO.
+
+    Callers only format and enqueue the record; a QueueListener thread
+    writes it to `path` (stderr by default). The level defaults to
+    OPENROUTER_LOG_LEVEL, or INFO. Messages longer than
+    `max_message_chars` are truncated. Calling it again replaces the
+    previous configuration.
+    """
+    global _listener
+    level = level or os.environ.get("OPENROUTER_LOG_LEVEL", "INFO").upper()
+    handler = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(TruncatingFilter(max_message_chars))
+
+    root = logging.getLogger()
+    stop_logging()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Write out the queued records and stop the listener thread started by configure_logging."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def log_response(label, text, sample_rate=None):
+    """Debug-log an agent response, shortened to RESPONSE_PREVIEW_CHARS.
+
+    Only a `sample_rate` share of responses is logged (OPENROUTER_LOG_SAMPLE,
+    all of them by default), and nothing is formatted unless debug logging
+    is on.
+    """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("OPENROUTER_LOG_SAMPLE", 1.0))
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    preview = text if len(text) <= RESPONSE_PREVIEW_CHARS else \
+        f"{text[:RESPONSE_PREVIEW_CHARS]}... [{len(text) - RESPONSE_PREVIEW_CHARS} more chars]"
+    logging.debug("%s response: %s", label, preview)
@@ -1,11 +1,28 @@
-import requests
-import os
-import json
-
-class MarketingAIAgent:
-    def __init__(self):
-        self.api_key = os.environ.get("OPENROUTER_API_KEY")
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+from base_ai_agent import BaseAIAgent
+from prompt_templates import PromptTemplate, respond_template
+
+CAMPAIGN_IDEA_TEMPLATE = PromptTemplate("campaign_idea", """
+Generate a comprehensive, innovative marketing campaign idea for the product named in the user message, using the strategy given there. Include specific tactics, channels, and a timeline for implementation. Consider the following aspects:
+1. Unique selling points of the product
+2. Target audience demographics and psychographics
+3. Competitive landscape
+4. Budget considerations
+5. Measurable KPIs for campaign success
+""")
+
+COMPETITORS_TEMPLATE = PromptTemplate("competitors", """
+Perform a detailed competitor analysis for the companies listed in the user message. For each competitor, provide strengths, weaknesses, and potential strategies to compete against them.
+""")
+
+BUDGET_TEMPLATE = PromptTemplate("budget_allocation", """
+Suggest a budget allocation for the total marketing budget given in the user message. Include at least 5 different marketing channels and provide a rationale for each allocation.
+""")
+
+RESPOND_TEMPLATE = respond_template("marketing")
+
+class MarketingAIAgent(BaseAIAgent):
+    def __init__(self, client=None, async_client=None, router=None):
+        super().__init__(client, async_client, router)
         self.strategies = {
             "Social Media Marketing": ["Facebook", "Instagram", "Twitter", "LinkedIn", "TikTok"],
             "Content Marketing": ["Blog posts", "Whitepapers", "Infographics", "Videos", "Podcasts"],
@@ -16,6 +33,15 @@ class MarketingAIAgent:
     
     def generate_campaign_idea(self, product, strategy=None, additional_info=None):
         """Generate a detailed marketing campaign idea."""
+        prompt, language = self._campaign_idea_prompt(product, strategy, additional_info)
+        return self.call_openrouter_api(prompt, language, template=CAMPAIGN_IDEA_TEMPLATE)
+
+    async def agenerate_campaign_idea(self, product, strategy=None, additional_info=None):
+        """Async version of generate_campaign_idea."""
+        prompt, language = self._campaign_idea_prompt(product, strategy, additional_info)
+        return await self.acall_openrouter_api(prompt, language, template=CAMPAIGN_IDEA_TEMPLATE)
+
+    def _campaign_idea_prompt(self, product, strategy, additional_info):
         language = 'english'
         if isinstance(additional_info, dict):
             language = additional_info.get('language', 'english')
@@ -23,61 +49,71 @@ class MarketingAIAgent:
         else:
             additional_context = additional_info or ''
 
-        prompt = f"Generate a comprehensive, innovative marketing campaign idea for {product} using {strategy if strategy else 'the most suitable marketing strategy'}. Include specific tactics, channels, and a timeline for implementation. Consider the following aspects:\n"
-        prompt += "1. Unique selling points of the product\n"
-        prompt += "2. Target audience demographics and psychographics\n"
-        prompt += "3. Competitive landscape\n"
-        prompt += "4. Budget considerations\n"
-        prompt += "5. Measurable KPIs for campaign success\n"
+        prompt = f"Product: {product}\nStrategy: {strategy if strategy else 'the most suitable marketing strategy'}\n"
         if additional_context:
             prompt += f"\nAdditional context: {additional_context}"
-        return self.call_openrouter_api(prompt, language)
+        return prompt, language
     
     def analyze_competitors(self, competitors):
         """Perform a competitor analysis."""
-        prompt = f"Perform a detailed competitor analysis for the following companies: {', '.join(competitors)}. For each competitor, provide strengths, weaknesses, and potential strategies to compete against them."
-        return self.call_openrouter_api(prompt)
+        return self.call_openrouter_api(self._competitors_prompt(competitors), template=COMPETITORS_TEMPLATE)
+
+    async def aanalyze_competitors(self, competitors):
+        """Async version of analyze_competitors."""
+        return await self.acall_openrouter_api(self._competitors_prompt(competitors), template=COMPETITORS_TEMPLATE)
+
+    def _competitors_prompt(self, competitors):
+        return f"Competitors: {', '.join(competitors)}"
+
+    def _competitor_tasks(self, competitors):
+        return {competitor: (self._competitors_prompt([competitor]), COMPETITORS_TEMPLATE) for competitor in competitors}
+
+    def analyze_each_competitor(self, competitors, mode='fan_out', concurrency=4):
+        """Analyze every competitor separately and return {competitor: analysis}.
+
+        See BaseAIAgent.call_many for the "fan_out" and "packed" modes.
+        """
+        return self.call_many(self._competitor_tasks(competitors), mode, concurrency)
+
+    async def aanalyze_each_competitor(self, competitors, mode='fan_out', concurrency=4):
+        """Async version of analyze_each_competitor."""
+        return await self.acall_many(self._competitor_tasks(competitors), mode, concurrency)
+
+    def _strategy_tasks(self, product, strategies, additional_info):
+        tasks, language = {}, 'english'
+        for strategy in (strategies or list(self.strategies)):
+            prompt, language = self._campaign_idea_prompt(product, strategy, additional_info)
+            tasks[strategy] = (prompt, CAMPAIGN_IDEA_TEMPLATE)
+        return tasks, language
+
+    def sweep_strategies(self, product, strategies=None, additional_info=None, mode='fan_out', concurrency=4):
+        """A campaign idea per strategy (all known strategies by default), keyed by strategy."""
+        tasks, language = self._strategy_tasks(product, strategies, additional_info)
+        return self.call_many(tasks, mode, concurrency, language)
+
+    async def asweep_strategies(self, product, strategies=None, additional_info=None, mode='fan_out', concurrency=4):
+        """Async version of sweep_strategies."""
+        tasks, language = self._strategy_tasks(product, strategies, additional_info)
+        return await self.acall_many(tasks, mode, concurrency, language)
     
     def suggest_budget_allocation(self, total_budget):
         """Suggest budget allocation for different marketing channels."""
-        prompt = f"Suggest a budget allocation for a total marketing budget of ${total_budget}. Include at least 5 different marketing channels and provide a rationale for each allocation."
-        return self.call_openrouter_api(prompt)
-
-    def call_openrouter_api(self, prompt, language='english'):
-        """Make a streaming API call to OpenRouter's Anthropic Claude-3.5-sonnet model."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "anthropic/claude-3.5-sonnet",
-            "messages": [{"role": "user", "content": f"Respond in {language}. {prompt}"}],
-            "stream": True
-        }
-        response = requests.post(self.base_url, headers=headers, json=data, stream=True)
-        if response.status_code == 200:
-            full_response = ""
-            for line in response.iter_lines():
-                if line:
-                    chunk = line.decode('utf-8').strip()
-                    if chunk.startswith("data: "):
-                        try:
-                            chunk_data = json.loads(chunk[6:])
-                            if 'choices' in chunk_data and chunk_data['choices']:
-                                if chunk_data['choices'][0]['finish_reason'] is None:
-                                    content = chunk_data['choices'][0]['delta'].get('content', '')
-                                    full_response += content
-                                    pass
-                        except json.JSONDecodeError as e:
-                            print(f"Error decoding JSON: {e}")
-                            print(f"Problematic chunk: {chunk}")
-                            continue
-            print()  # Print a newline at the end
-            return full_response if full_response else "No valid response received from the API."
-        else:
-            return f"Error: {response.status_code}, {response.text}"
+        return self.call_openrouter_api(self._budget_prompt(total_budget), template=BUDGET_TEMPLATE)
+
+    async def asuggest_budget_allocation(self, total_budget):
+        """Async version of suggest_budget_allocation."""
+        return await self.acall_openrouter_api(self._budget_prompt(total_budget), template=BUDGET_TEMPLATE)
+
+    def _budget_prompt(self, total_budget):
+        return f"Total marketing budget: ${total_budget}"
 
     def respond_to_agent(self, message):
         """Respond to messages from other agents."""
-        prompt = f"As a marketing AI agent, respond to the following message from another agent: {message}"
-        return self.call_openrouter_api(prompt)
+        return self.call_openrouter_api(self._respond_prompt(message), template=RESPOND_TEMPLATE)
+
+    async def arespond_to_agent(self, message):
+        """Async version of respond_to_agent."""
+        return await self.acall_openrouter_api(self._respond_prompt(message), template=RESPOND_TEMPLATE)
+
+    def _respond_prompt(self, message):
+        return f"Message from another agent: {message}"
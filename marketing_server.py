@@ -0,0 +1,420 @@
+"""Long-running HTTP service that generates marketing plans from a job queue.
+
+    python marketing_server.py --port 8000 --workers 4 --max-queue 32
+
+Each worker thread keeps one warm MarketingTeam, and all of them share the
+pooled default OpenRouter client. Endpoints:
+
+    POST /jobs                  submit a brief (same fields as batch mode); 202, or 429 when the queue is full
+    GET  /jobs/<id>             job status and usage
+    GET  /jobs/<id>/events      Server-Sent Events: stage starts, streamed tokens (while the job runs), stage and
+                                job completion
+    GET  /jobs/<id>/result      plan sections once the job is done
+    GET  /jobs/<id>/document    the generated .docx
+    DELETE /jobs/<id>           cancel a queued or running job; a running plan stops with its finished sections
+    GET  /health                queue depth and worker count
+    GET  /metrics               token usage of finished jobs in Prometheus text format
+"""
+import io
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import argparse
+import bisect
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from marketing_team import MarketingTeam
+from batch_runner import Brief
+from stream_observers import NullObserver, StreamObserver
+from usage_tracking import UsageReport
+from cancellation import CancellationToken
+from logging_setup import configure_logging
+
+DOCX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+class Job:
+    """One queued brief, its progress events and, once finished, its result."""
+
+    def __init__(self, brief):
+        self.id = uuid.uuid4().hex
+        self.brief = brief
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.sections = None
+        self.usage = UsageReport()
+        self.document = io.BytesIO()
+        self.error = None
+        # Cancelled by DELETE /jobs/<id>; stops the plan between or during stages
+        self.cancel_token = CancellationToken()
+        # Encoded SSE events and their sequence numbers; token events are dropped once the job finishes
+        self.events = []
+        self._sequence = []
+        self.last_event = 0
+        self._changed = threading.Condition(threading.RLock())
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "timed_out", "cancelled")
+
+    def publish(self, event, data):
+        """Record an event for current and future SSE subscribers."""
+        with self._changed:
+            self.last_event += 1
+            self.events.append(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self._sequence.append(self.last_event)
+            self._changed.notify_all()
+
+    def finish(self, status, event):
+        """Set the final status and publish `event` atomically, so subscribers never see one without the other.
+
+        The streamed tokens of a finished job are dropped from its history
+        (the plan is available from the result), so kept jobs only hold
+        their stage and completion events.
+        """
+        with self._changed:
+            self.status = status
+            self.finished_at = time.time()
+            self.publish(event, self.as_dict())
+            kept = [i for i, encoded in enumerate(self.events) if not encoded.startswith(b"event: token\n")]
+            self.events = [self.events[i] for i in kept]
+            self._sequence = [self._sequence[i] for i in kept]
+
+    def wait_for_events(self, seen, timeout):
+        """Block until there are events after number `seen` or the job finishes.
+
+        Returns the new events and the number of the last one, to pass as
+        `seen` next time.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.last_event > seen or self.finished, timeout)
+            start = bisect.bisect_right(self._sequence, seen)
+            return self.events[start:], self.last_event
+
+    def observer_factory(self, label):
+        return JobEventObserver(self, label)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "product": self.brief.product,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "usage": self.usage.totals(),
+        }
+
+
+class JobEventObserver(StreamObserver):
+    """Forwards one stage's stream events to the job's SSE subscribers."""
+
+    def __init__(self, job, label=""):
+        super().__init__(label)
+        self.job = job
+
+    def on_start(self):
+        self.job.publish("stage_start", {"stage": self.label})
+
+    def on_token(self, text):
+        self.job.publish("token", {"stage": self.label, "text": text})
+
+    def on_complete(self, text):
+        self.job.publish("stage_complete", {"stage": self.label})
+
+    def on_error(self, error):
+        self.job.error = f"{type(error).__name__}: {error}"
+        self.job.publish("stage_error", {"stage": self.label, "error": self.job.error})
+
+
+class MarketingServer:
+    """Job queue, worker pool and HTTP front end.
+
+    At most `max_queue` jobs wait for the `workers` threads; further
+    submissions get 429 with a Retry-After header. Only the most recent
+    `max_jobs` jobs are kept for status and result lookups.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8000, workers=4, max_queue=32, max_jobs=1000, team_factory=None,
+                 plan_timeout=None):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.team_factory = team_factory or (lambda: MarketingTeam(observer_factory=NullObserver, verbose=False,
+                                                                   plan_timeout=plan_timeout))
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.jobs = OrderedDict()
+        self.usage = UsageReport(plans=0)
+        self._jobs_lock = threading.Lock()
+        self._threads = []
+        self._httpd = ThreadingHTTPServer((host, port), _MarketingRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.app = self
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit(self, record):
+        """Queue a brief; returns the Job, or None when the queue is full. Raises ValueError for bad briefs."""
+        job = Job(Brief.from_record(record))
+        job.publish("queued", {"id": job.id})
+        with self._jobs_lock:
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                return None
+            self.jobs[job.id] = job
+            self._evict_finished()
+        return job
+
+    def _evict_finished(self):
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self.jobs.get(job_id)
+
+    def _worker(self):
+        # Each worker owns a warm team, so per-job state such as the observer factory is never shared
+        team = self.team_factory()
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            with job._changed:
+                cancelled = job.finished
+                if not cancelled:
+                    job.status = "running"
+            if cancelled:
+                # Cancelled while it was queued
+                self.queue.task_done()
+                continue
+            try:
+                self._run(team, job)
+            finally:
+                self.queue.task_done()
+
+    def _run(self, team, job):
+        job.started_at = time.time()
+        job.publish("job_start", {"id": job.id})
+        team.observer_factory = job.observer_factory
+        try:
+            job.sections = team.discuss_marketing_plan(job.brief.product, job.brief.additional_info,
+                                                       output_path=job.document, usage=job.usage,
+                                                       cancel_token=job.cancel_token)
+        except Exception as e:
+            logging.exception(f"Job {job.id} crashed")
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            team.observer_factory = NullObserver
+        self.usage.merge(job.usage)
+        if job.sections is not None and not job.sections.completed:
+            # Partial sections stay available from /result
+            job.error = f"Plan {job.sections.status.replace('_', ' ')}: {job.sections.error}"
+            job.finish(job.sections.status, "job_failed")
+        elif job.sections is not None:
+            job.finish("done", "job_complete")
+        else:
+            job.error = job.error or "Plan generation failed, see the server log"
+            job.finish("failed", "job_failed")
+        logging.info(f"Job {job.id} {job.status} in {job.finished_at - job.started_at:.2f}s")
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if it is unknown."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_token.cancel("cancelled by client")
+        with job._changed:
+            if job.status == "queued":
+                job.error = "Cancelled before the job started"
+                job.finish("cancelled", "job_failed")
+        return job
+
+    def start(self):
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logging.info(f"Marketing server listening on {self.url} with {self.workers} workers")
+        return self
+
+    def stop(self):
+        """Stop accepting requests, fail the jobs still queued and let the workers exit after their current job."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            job.error = "Server shut down before the job started"
+            job.finish("failed", "job_failed")
+            self.queue.task_done()
+        for _ in range(self.workers):
+            self.queue.put(None)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+class _MarketingRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # How often an idle event stream gets a keep-alive comment
+    keep_alive_interval = 15.0
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status_code, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status_code, message, headers=None):
+        self._send_json(status_code, {"error": message}, headers)
+
+    def do_POST(self):
+        app = self.server.app
+        if self.path.rstrip('/') != "/jobs":
+            return self._send_error(404, "Not found")
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            record = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(record, dict):
+                raise ValueError("Expected a JSON object")
+            job = app.submit(record)
+        except ValueError as e:
+            return self._send_error(400, str(e))
+        if job is None:
+            return self._send_error(429, "Job queue is full, retry later", {"Retry-After": "5"})
+        self._send_json(202, {**job.as_dict(), "links": {
+            "self": f"/jobs/{job.id}", "events": f"/jobs/{job.id}/events", "result": f"/jobs/{job.id}/result"}})
+
+    def do_GET(self):
+        app = self.server.app
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if parts == ["health"]:
+            return self._send_json(200, {"status": "ok", "queued": app.queue.qsize(), "workers": app.workers})
+        if parts == ["metrics"]:
+            body = app.usage.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if len(parts) not in (2, 3) or parts[0] != "jobs":
+            return self._send_error(404, "Not found")
+        job = app.get(parts[1])
+        if job is None:
+            return self._send_error(404, "Unknown job")
+        action = parts[2] if len(parts) == 3 else None
+        if action is None:
+            return self._send_json(200, job.as_dict())
+        if action == "events":
+            return self._stream_events(job)
+        if action == "result":
+            if not job.finished:
+                return self._send_json(202, job.as_dict())
+            if job.status == "failed":
+                return self._send_json(500, job.as_dict())
+            if job.status in ("timed_out", "cancelled"):
+                return self._send_json(200, {**job.as_dict(), "sections": job.sections or [],
+                                             "stages": job.usage.stages()})
+            return self._send_json(200, {**job.as_dict(), "sections": job.sections,
+                                         "stages": job.usage.stages()})
+        if action == "document":
+            if job.status != "done":
+                return self._send_error(409, f"Job is {job.status}")
+            body = job.document.getvalue()
+            self.send_response(200)
+            self.send_header("Content-Type", DOCX_CONTENT_TYPE)
+            self.send_header("Content-Disposition", f'attachment; filename="marketing_plan_{job.id}.docx"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        return self._send_error(404, "Not found")
+
+    def do_DELETE(self):
+        app = self.server.app
+        parts = [part for part in self.path.split('?')[0].split('/') if part]
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._send_error(404, "Not found")
+        job = app.cancel(parts[1])
+        if job is None:
+            return self._send_error(404, "Unknown job")
+        self._send_json(202, job.as_dict())
+
+    def _stream_events(self, job):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        seen = 0
+        try:
+            while True:
+                events, seen = job.wait_for_events(seen, self.keep_alive_interval)
+                if events:
+                    self.wfile.write(b"".join(events))
+                elif not job.finished:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+                if job.finished and seen == job.last_event:
+                    break
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug(f"Event stream client for job {job.id} disconnected")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve marketing plan generation over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4, help="plans generated at once")
+    parser.add_argument("--max-queue", type=int, default=32, help="queued jobs before submissions get 429")
+    parser.add_argument("--plan-timeout", type=float, help="seconds a plan may take before it stops with the "
+                                                           "sections finished so far")
+    parser.add_argument("--log-file", help="write the log to this file instead of stderr")
+    args = parser.parse_args()
+    configure_logging(path=args.log_file)
+
+    if not os.getenv("OPENROUTER_API_KEY"):
+        parser.error("OPENROUTER_API_KEY is not set")
+
+    server = MarketingServer(args.host, args.port, workers=args.workers, max_queue=args.max_queue,
+                             plan_timeout=args.plan_timeout).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,49 @@
 import os
 import json
 import logging
+import contextlib
 from dotenv import load_dotenv
 from marketing_ai_agent import MarketingAIAgent
 from sales_ai_agent import SalesAIAgent
 from strategy_ai_agent import StrategyAIAgent
 from analytics_ai_agent import AnalyticsAIAgent
-from docx import Document
-from docx.shared import Pt, RGBColor
-from docx.enum.style import WD_STYLE_TYPE
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from translation_ai_agent import TranslationAIAgent
 from colorama import init, Fore, Style
-from tqdm import tqdm
-import time
+from stream_observers import ConsoleProgressObserver, observe
+from openrouter_errors import OpenRouterError, OperationCancelled
+from usage_tracking import UsageReport, usage_scope
+from context_compactor import ContextCompactor
+from report_writer import ReportWriter, translated_report_path, unique_report_path
+from prompt_templates import PromptTemplate
+from model_router import get_default_router
+from response_cache import cache_bypassed
+from stage_store import STAGE_PARAMS, StageStore, stage_key, stage_params
+from cancellation import plan_token, stage_scope
+from batch_calls import fan_out
+from pipeline import PlanResult, cancelled_status, plan_attributes
+from tracing import current_span, span
+from brief_index import BriefIndex, brief_scope
+from logging_setup import configure_logging, log_response
+
+# Stages of the sequential discussion, in the order they run
+STAGE_ORDER = ("marketing", "sales", "strategy", "analytics", "final_marketing", "synthesis")
 
 # Initialize colorama
 init(autoreset=True)
 
-def loading_indicator(agent_name):
-    with tqdm(total=100, desc=f"{agent_name} thinking", bar_format="{l_bar}{bar}", colour="green") as pbar:
-        for i in range(100):
-            time.sleep(0.05)
-            pbar.update(1)
-
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-
-def create_styled_document(content, language='english'):
-    doc = Document()
-    
-    # Create and apply styles
-    title_style = doc.styles.add_style('CustomTitle', WD_STYLE_TYPE.PARAGRAPH)
-    title_style.font.name = 'Arial'
-    title_style.font.size = Pt(24)
-    title_style.font.color.rgb = RGBColor(0, 112, 192)  # Blue color
-    title_style.font.bold = True
-    title_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    heading_style = doc.styles.add_style('CustomHeading', WD_STYLE_TYPE.PARAGRAPH)
-    heading_style.font.name = 'Calibri'
-    heading_style.font.size = Pt(16)
-    heading_style.font.color.rgb = RGBColor(46, 116, 181)  # Dark blue color
-    heading_style.font.bold = True
-    
-    body_style = doc.styles.add_style('CustomBody', WD_STYLE_TYPE.PARAGRAPH)
-    body_style.font.name = 'Georgia'
-    body_style.font.size = Pt(11)
-    body_style.paragraph_format.space_after = Pt(12)
-    
-    # Add content to the document
-    title = "Marketing Team Discussion" if language == 'english' else "Marketing-Team-Diskussion"
-    doc.add_paragraph(title, style='CustomTitle')
-    
+def create_styled_document(content, language='english', filename=None):
+    """Write all sections at once; returns the filename (a fresh unique one by default)."""
+    if filename is None:
+        filename = unique_report_path(language)
+    writer = ReportWriter(filename, language, autosave=False)
     for section in content:
-        doc.add_paragraph(section['title'], style='CustomHeading')
-        doc.add_paragraph(section['content'], style='CustomBody')
-    
-    # Add page numbers
-    section = doc.sections[0]
-    footer = section.footer
-    footer_para = footer.paragraphs[0]
-    footer_para.text = ("Page " if language == 'english' else "Seite ") + "{ PAGE }"
-    footer_para.style = doc.styles['Footer']
-    footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Save the document
-    filename = 'marketing_plan.docx' if language == 'english' else 'marketingplan.docx'
-    doc.save(filename)
-    print(f"Marketing plan saved as '{filename}'")
+        writer.add_section(section['title'], section['content'])
+    writer.save()
+    logging.info(f"Marketing plan saved as '{filename}'")
+    return filename
 
 def check_api_key():
     api_key = os.getenv("OPENROUTER_API_KEY")
@@ -90,74 +63,269 @@ def check_api_key():
     return api_key
 
 class MarketingTeam:
-    def __init__(self):
-        self.marketing_agent = MarketingAIAgent()
-        self.sales_agent = SalesAIAgent()
-        self.strategy_agent = StrategyAIAgent()
-        self.analytics_agent = AnalyticsAIAgent()
-
-    def discuss_marketing_plan(self, product, additional_info=None):
-        print(f"{Fore.CYAN}Marketing Team discussing: {product}{Style.RESET_ALL}\n", flush=True)
+    def __init__(self, observer_factory=ConsoleProgressObserver, verbose=True, stage_retries=1,
+                 context_budget=800, compaction_mode='summarize', write_document=True, router=None,
+                 stage_store=None, plan_timeout=None, languages=None, profiler=None, brief_index=None):
+        # observer_factory(label) builds the StreamObserver that receives each stage's stream events
+        self.observer_factory = observer_factory
+        self.verbose = verbose
+        # How many times a stage is re-run after a retryable OpenRouterError outlasted the scheduler's retries
+        self.stage_retries = stage_retries
+        self.write_document = write_document
+        # ModelRouter picking the model per stage (the shared default router unless given)
+        self.router = router or get_default_router()
+        self.marketing_agent = MarketingAIAgent(router=self.router)
+        self.sales_agent = SalesAIAgent(router=self.router)
+        self.strategy_agent = StrategyAIAgent(router=self.router)
+        self.analytics_agent = AnalyticsAIAgent(router=self.router)
+        self.translation_agent = TranslationAIAgent(router=self.router)
+        # Earlier outputs longer than context_budget tokens are condensed before later stages see them (None disables)
+        self.compactor = ContextCompactor(context_budget, compaction_mode, agent=self.marketing_agent)
+        # UsageReport of the most recent discussion; pass `usage=` when sharing the team across threads
+        self.last_usage = None
+        # Stage outputs keyed by their inputs, so re-runs only recompute stages whose inputs changed
+        # (False turns this off)
+        self.stage_store = stage_store if stage_store is not None else StageStore.from_env()
+        self.context_budget = context_budget
+        self.compaction_mode = compaction_mode
+        # Seconds a discussion may take; each stage gets an even share of the time left (None for no limit)
+        self.plan_timeout = plan_timeout
+        # Output languages: the discussion runs once in the first, and the finished plan is translated into the rest
+        self.languages = list(languages) if languages else None
+        # PlanProfiler wrapped around every discussion (None to not profile)
+        self.profiler = profiler
+        # Past briefs and their stage outputs; a close enough match lets a run regenerate only the synthesis
+        # (off unless OPENROUTER_BRIEF_INDEX=on; False turns it off)
+        self.brief_index = brief_index if brief_index is not None else BriefIndex.from_env()
+
+    def _say(self, message):
+        if self.verbose:
+            print(message, flush=True)
+
+    def _stage_params(self, product, additional_info):
+        return stage_params(product, additional_info,
+                            {"context_budget": self.context_budget, "compaction_mode": self.compaction_mode},
+                            self.router)
+
+    def _run_stage(self, stage, label, call, usage, params=None, inputs=None, token=None, reused=None):
+        """Run one stage, re-running just that stage if it fails with a retryable error.
+
+        Every API call the stage makes is recorded in `usage` under `stage`.
+        Given the run's `params` and the stage's dependency `inputs`, an output
+        stored for the same inputs is reused instead, and a new output is
+        stored as soon as the stage finishes. With the plan's CancellationToken
+        the stage runs under its share of the remaining time. A stage found in
+        `reused` (outputs of a similar earlier brief) is taken from there.
+        """
+        with span("stage", stage=stage) as stage_span:
+            if reused and stage in reused:
+                logging.info(f"Starting from the '{stage}' output of a similar brief")
+                usage.record_reuse(stage)
+                stage_span.set_attribute("stage.similar_brief", True)
+                return reused[stage]
+            key = None
+            if self.stage_store and params is not None and not cache_bypassed():
+                key = stage_key(stage, STAGE_PARAMS[stage], params, inputs or {})
+                stored = self.stage_store.get(key)
+                if stored is not None:
+                    logging.info(f"Reusing the stored output of stage '{stage}'")
+                    usage.record_reuse(stage)
+                    stage_span.set_attribute("stage.reused", True)
+                    return stored
+            for attempt in range(self.stage_retries + 1):
+                stage_span.set_attribute("stage.attempts", attempt + 1)
+                try:
+                    with observe(self.observer_factory(label)), usage_scope(usage, stage), \
+                            stage_scope(token, len(STAGE_ORDER) - STAGE_ORDER.index(stage)):
+                        output = call()
+                    if key is not None:
+                        self.stage_store.put(key, stage, output)
+                    return output
+                except OpenRouterError as e:
+                    if not e.retryable or attempt == self.stage_retries:
+                        raise
+                    logging.warning(f"{label} failed with {type(e).__name__}, retrying the stage: {e}")
+
+    def _add_section(self, content, writer, title, text):
+        content.append({"title": title, "content": text})
+        if writer is not None:
+            writer.add_section(title, text)
+
+    def discuss_marketing_plan(self, product, additional_info=None, output_path=None, usage=None,
+                               cancel_token=None, languages=None):
+        """Run the discussion, write the Word document and return its sections as a PlanResult (None on failure).
+
+        Each section is appended to the document as soon as its stage
+        finishes, so a failed run still leaves the finished sections behind.
+        `output_path` may be a file path (a unique one by default) or a binary
+        stream such as io.BytesIO. Token usage, latency and retries of every call are rolled up per stage
+        into `usage` (a fresh UsageReport by default), also kept as `last_usage`.
+        When `plan_timeout` runs out or `cancel_token` is cancelled, the
+        in-flight stream is closed and the sections finished so far come back
+        with status "timed_out" or "cancelled".
+        With several output `languages` (the team's by default) the discussion
+        runs once in the first of them and the finished sections are
+        translated into the others concurrently, each into its own document;
+        see PlanResult.translations and PlanResult.documents.
+        Each run is traced as a "plan" span with a child span per stage, and
+        profiled when the team has a `profiler`.
+        """
+        usage = usage if usage is not None else UsageReport()
+        with span("plan", product=product, team="sequential") as plan_span, self._profiled():
+            result = self._discuss(product, additional_info, output_path, usage, cancel_token, languages)
+            plan_span.set_attributes(plan_attributes(result, usage))
+            return result
+
+    def _profiled(self):
+        return self.profiler.profile("plan") if self.profiler is not None else contextlib.nullcontext()
+
+    def _discuss(self, product, additional_info, output_path, usage, cancel_token, languages):
+        additional_info = additional_info or {}
+        languages = list(languages or self.languages or [])
+        if languages:
+            additional_info = {**additional_info, 'language': languages[0]}
+        self.last_usage = usage
+        self._say(f"{Fore.CYAN}Marketing Team discussing: {product}{Style.RESET_ALL}\n")
         logging.info(f"Starting marketing plan discussion for {product}")
 
         content = []
         language = additional_info.get('language', 'english')
+        params = self._stage_params(product, additional_info)
+        match = self._similar_brief(product, additional_info)
+        reused = match.outputs if match is not None else {}
+        writer = None
+        if self.write_document:
+            writer = ReportWriter(output_path if output_path is not None else unique_report_path(language), language)
+        token = plan_token(self.plan_timeout, cancel_token)
 
         try:
             # Marketing Agent's initial input
-            loading_indicator("Marketing Agent")
-            marketing_input = self.marketing_agent.generate_campaign_idea(product, additional_info=additional_info)
-            logging.debug(f"Marketing Agent response: {marketing_input}")
-            content.append({"title": "Initial Marketing Campaign Idea", "content": marketing_input})
-            print(f"{Fore.RED}Marketing Agent: {marketing_input}{Style.RESET_ALL}\n", flush=True)
+            marketing_input = self._run_stage("marketing", "Marketing Agent", lambda: self.marketing_agent.generate_campaign_idea(product, additional_info=additional_info), usage, params, token=token, reused=reused)
+            log_response("Marketing Agent", marketing_input)
+            self._add_section(content, writer, "Initial Marketing Campaign Idea", marketing_input)
+            self._say(f"{Fore.RED}Marketing Agent: {marketing_input}{Style.RESET_ALL}\n")
 
             # Sales Agent's response to Marketing
-            loading_indicator("Sales Agent")
-            sales_input = self.sales_agent.respond_to_agent(marketing_input, language=language)
-            logging.debug(f"Sales Agent response: {sales_input}")
-            content.append({"title": "Sales Agent Feedback", "content": sales_input})
-            print(f"{Fore.GREEN}Sales Agent: {sales_input}{Style.RESET_ALL}\n", flush=True)
+            sales_input = self._run_stage("sales", "Sales Agent", lambda: self.sales_agent.respond_to_agent(self.compactor.compact(marketing_input, language=language), language=language), usage, params, {"marketing": marketing_input}, token=token, reused=reused)
+            log_response("Sales Agent", sales_input)
+            self._add_section(content, writer, "Sales Agent Feedback", sales_input)
+            self._say(f"{Fore.GREEN}Sales Agent: {sales_input}{Style.RESET_ALL}\n")
 
             # Strategy Agent's input based on Marketing and Sales
-            loading_indicator("Strategy Agent")
-            strategy_input = self.strategy_agent.analyze_market_trends(product, f"{marketing_input}\n{sales_input}", language=language)
-            logging.debug(f"Strategy Agent response: {strategy_input}")
-            content.append({"title": "Market Trends Analysis", "content": strategy_input})
-            print(f"{Fore.YELLOW}Strategy Agent: {strategy_input}{Style.RESET_ALL}\n", flush=True)
+            strategy_input = self._run_stage("strategy", "Strategy Agent", lambda: self.strategy_agent.analyze_market_trends(product, self.compactor.join([marketing_input, sales_input], language), language=language), usage, params, {"marketing": marketing_input, "sales": sales_input}, token=token, reused=reused)
+            log_response("Strategy Agent", strategy_input)
+            self._add_section(content, writer, "Market Trends Analysis", strategy_input)
+            self._say(f"{Fore.YELLOW}Strategy Agent: {strategy_input}{Style.RESET_ALL}\n")
 
             # Analytics Agent's input based on all previous inputs
-            loading_indicator("Analytics Agent")
-            analytics_input = self.analytics_agent.analyze_target_audience(product, f"{marketing_input}\n{sales_input}\n{strategy_input}", language=language)
-            logging.debug(f"Analytics Agent response: {analytics_input}")
-            content.append({"title": "Target Audience Analysis", "content": analytics_input})
-            print(f"{Fore.MAGENTA}Analytics Agent: {analytics_input}{Style.RESET_ALL}\n", flush=True)
+            analytics_input = self._run_stage("analytics", "Analytics Agent", lambda: self.analytics_agent.analyze_target_audience(product, self.compactor.join([marketing_input, sales_input, strategy_input], language), language=language), usage, params, {"marketing": marketing_input, "sales": sales_input, "strategy": strategy_input}, token=token, reused=reused)
+            log_response("Analytics Agent", analytics_input)
+            self._add_section(content, writer, "Target Audience Analysis", analytics_input)
+            self._say(f"{Fore.MAGENTA}Analytics Agent: {analytics_input}{Style.RESET_ALL}\n")
 
             # Marketing Agent's final input based on all feedback
-            loading_indicator("Marketing Agent (Final)")
-            final_marketing_input = self.marketing_agent.generate_campaign_idea(product, additional_info={'input': f"{sales_input}\n{strategy_input}\n{analytics_input}", 'language': language})
-            logging.debug(f"Final Marketing Agent response: {final_marketing_input}")
-            content.append({"title": "Final Marketing Campaign Idea", "content": final_marketing_input})
-            print(f"{Fore.RED}Marketing Agent (Final): {final_marketing_input}{Style.RESET_ALL}\n", flush=True)
+            final_marketing_input = self._run_stage("final_marketing", "Marketing Agent (Final)", lambda: self.marketing_agent.generate_campaign_idea(product, additional_info={'input': self.compactor.join([sales_input, strategy_input, analytics_input], language), 'language': language}), usage, params, {"sales": sales_input, "strategy": strategy_input, "analytics": analytics_input}, token=token, reused=reused)
+            log_response("Final Marketing Agent", final_marketing_input)
+            self._add_section(content, writer, "Final Marketing Campaign Idea", final_marketing_input)
+            self._say(f"{Fore.RED}Marketing Agent (Final): {final_marketing_input}{Style.RESET_ALL}\n")
 
             # Final plan synthesis
-            loading_indicator("Final Plan Synthesis")
-            final_plan = self.synthesize_plan(final_marketing_input, sales_input, strategy_input, analytics_input, product, additional_info)
-            logging.debug(f"Final plan: {final_plan}")
-            content.append({"title": "Final Marketing Plan", "content": final_plan})
-            print(f"{Fore.BLUE}Final Marketing Plan: {final_plan}{Style.RESET_ALL}\n", flush=True)
+            final_plan = self._run_stage("synthesis", "Final Plan Synthesis", lambda: self.synthesize_plan(final_marketing_input, sales_input, strategy_input, analytics_input, product, additional_info), usage, params, {"final_marketing": final_marketing_input, "sales": sales_input, "strategy": strategy_input, "analytics": analytics_input}, token=token)
+            log_response("Final plan", final_plan)
+            self._add_section(content, writer, "Final Marketing Plan", final_plan)
+            self._say(f"{Fore.BLUE}Final Marketing Plan: {final_plan}{Style.RESET_ALL}\n")
 
-            # Create styled Word document
-            create_styled_document(content, language)
-            logging.info("Marketing plan discussion completed")
+            if writer is not None:
+                if not writer.autosave:
+                    writer.save()
+                self._say(f"Marketing plan saved as '{writer.target}'")
+            result = PlanResult(content)
+            if self.brief_index and match is None:
+                self.brief_index.add(additional_info, self._brief_scope(product, additional_info),
+                                     {"marketing": marketing_input, "sales": sales_input, "strategy": strategy_input,
+                                      "analytics": analytics_input, "final_marketing": final_marketing_input})
+            if len(languages) > 1:
+                self._translate(result, languages[0], languages[1:], output_path, usage, token)
+            totals = usage.totals()
+            self._say(f"Tokens used: {totals['total_tokens']} ({totals['prompt_tokens']} prompt, "
+                      f"{totals['cached_prompt_tokens']} of them from the prompt cache, "
+                      f"{totals['completion_tokens']} completion) across {totals['calls']} calls")
+            logging.info(f"Marketing plan discussion completed, usage: {totals}")
+            return result
 
+        except OperationCancelled as e:
+            status = cancelled_status(e)
+            logging.warning(f"Marketing plan discussion {status.replace('_', ' ')} after {len(content)} of "
+                            f"{len(STAGE_ORDER)} stages: {e}")
+            self._say(f"{Fore.RED}Stopped: the discussion {status.replace('_', ' ')} after {len(content)} "
+                      f"stages.{Style.RESET_ALL}")
+            self._keep_partial(writer)
+            return PlanResult(content, status, str(e))
         except Exception as e:
             logging.error(f"An error occurred during the marketing plan discussion: {str(e)}")
-            print(f"{Fore.RED}Error: An unexpected error occurred. Please check the logs for more information.{Style.RESET_ALL}")
+            self._say(f"{Fore.RED}Error: An unexpected error occurred. Please check the logs for more information.{Style.RESET_ALL}")
+            self._keep_partial(writer)
+            return None
+        finally:
+            if token is not None:
+                token.close()
+
+    def _brief_scope(self, product, additional_info):
+        return brief_scope(product, additional_info, {"context_budget": self.context_budget,
+                                                      "compaction_mode": self.compaction_mode})
+
+    def _similar_brief(self, product, additional_info):
+        """A similar earlier brief whose stage outputs this run can start from, or None."""
+        if not self.brief_index or cache_bypassed():
+            return None
+        match = self.brief_index.lookup(additional_info, self._brief_scope(product, additional_info))
+        if match is not None:
+            logging.info(f"Starting from the stage outputs of a similar brief (similarity {match.similarity:.3f})")
+            current_span().set_attribute("plan.similar_brief", round(match.similarity, 4))
+        return match
+
+    def _translate(self, result, pivot, languages, output_path, usage, token):
+        """Translate the finished plan into every language at once, writing each version's document."""
+        def translate(language):
+            try:
+                with observe(self.observer_factory(f"Translation ({language})")), usage_scope(usage, "translation"), \
+                        stage_scope(token, 1), span("stage", stage="translation", language=language):
+                    sections = self.translation_agent.translate_sections(result, language, source_language=pivot)
+            except Exception as e:
+                logging.error(f"Translating the marketing plan into {language} failed: {e}")
+                return PlanResult([], "failed", str(e)), None
+            document = None
+            if self.write_document:
+                document = create_styled_document(sections, language, translated_report_path(output_path, language))
+                self._say(f"Marketing plan ({language}) saved as '{document}'")
+            return PlanResult(sections), document
+
+        for language, (translation, document) in fan_out(translate, languages, len(languages)).items():
+            result.translations[language] = translation
+            if document is not None:
+                result.documents[language] = document
+
+    def _keep_partial(self, writer):
+        if writer is not None and writer.sections:
+            if not writer.autosave:
+                writer.save()
+            logging.info(f"Partial marketing plan with {writer.sections} sections kept at {writer.target!r}")
 
     def synthesize_plan(self, marketing, sales, strategy, analytics, product, additional_info):
         language = additional_info.get('language', 'english')
-        prompt = f"""
-        Synthesize a comprehensive marketing plan for {product} based on the following inputs:
+        marketing, sales, strategy, analytics = self.compactor.compact_all([marketing, sales, strategy, analytics], language)
+        prompt = build_synthesis_prompt(marketing, sales, strategy, analytics, product, additional_info)
+        return self.marketing_agent.call_openrouter_api(prompt, language=language, template=SYNTHESIS_TEMPLATE)
+
+SYNTHESIS_TEMPLATE = PromptTemplate("synthesis", """
+Synthesize a comprehensive marketing plan for the product named in the user message, based on the marketing,
+sales, strategy and analytics inputs given there. Provide a cohesive plan that incorporates insights from all
+agents, specifically tailored for the product, taking into account the additional information provided.
+""")
+
+def build_synthesis_prompt(marketing, sales, strategy, analytics, product, additional_info):
+    return f"""
+        Product: {product}
         Marketing: {marketing}
         Sales: {sales}
         Strategy: {strategy}
@@ -167,13 +335,10 @@ class MarketingTeam:
         Target Audience: {additional_info.get('target_audience', 'Not specified')}
         Marketing Goals: {additional_info.get('marketing_goals', 'Not specified')}
         Budget: {additional_info.get('budget', 'Not specified')}
-
-        Provide a cohesive plan that incorporates insights from all agents, specifically tailored for {product},
-        taking into account the additional information provided.
         """
-        return self.marketing_agent.call_openrouter_api(prompt, language=language)
 
 def main():
+    configure_logging()
     api_key = check_api_key()
     os.environ["OPENROUTER_API_KEY"] = api_key
     team = MarketingTeam()
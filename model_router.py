@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from openrouter_client import DEFAULT_MODEL
+from openrouter_errors import OpenRouterError
+from usage_tracking import current_stage, record_route
+
+# Models per tier, in order of preference; later entries are the alternates
+DEFAULT_TIERS = {
+    "flagship": [DEFAULT_MODEL, "openai/gpt-4o"],
+    "fast": ["anthropic/claude-3-haiku", "openai/gpt-4o-mini"],
+}
+
+# Route keys are template names (one per agent method, e.g. "sales_respond")
+# or pipeline stage names; a template route wins over a stage route.
+DEFAULT_ROUTES = {
+    "default": "flagship",
+    "sales_respond": "fast",
+    "compaction": "fast",
+}
+
+
+def _p95(values):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+class _ModelHealth:
+    """Rolling window of one model's recent calls."""
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.tripped_at = None
+        self.reason = None
+
+    def snapshot(self):
+        return {
+            "calls": len(self.outcomes),
+            "error_rate": self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0,
+            "p95_latency": _p95(self.latencies) if self.latencies else None,
+            "healthy": self.tripped_at is None,
+            "reason": self.reason,
+        }
+
+
+class ModelRouter:
+    """Chooses the model for each call from a per-stage tier and falls over to alternates.
+
+    `routes` maps a route key to a tier in `tiers`: the template name of the
+    agent method (e.g. "sales_respond"), the pipeline stage, or "default".
+    The router keeps a rolling window of `window` calls per model. Once a
+    model has `min_calls` of them and its p95 latency exceeds
+    `max_p95_latency` seconds, or its error rate exceeds `max_error_rate`,
+    it is skipped in favour of the next model of its tier for `cooldown`
+    seconds. Latency is time to first token where the stream reports it,
+    since total latency mostly reflects answer length. A call that fails
+    with a retryable OpenRouterError after the scheduler's own retries is
+    repeated on the next model of the tier; other errors are raised as they
+    are. Every decision is recorded in the active UsageReport.
+    """
+
+    def __init__(self, routes=None, tiers=None, max_p95_latency=None, max_error_rate=0.5, min_calls=5,
+                 window=50, cooldown=60.0):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.tiers = {tier: list(models) for tier, models in (tiers or DEFAULT_TIERS).items()}
+        unknown = set(self.routes.values()) - set(self.tiers)
+        if unknown:
+            raise ValueError(f"Routes refer to unknown tiers: {sorted(unknown)}")
+        self.max_p95_latency = max_p95_latency
+        self.max_error_rate = max_error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.cooldown = cooldown
+        self._health = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Load {"routes": {...}, "tiers": {...}} (both optional) plus thresholds from a JSON file."""
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(**{**config, **kwargs})
+
+    def config(self):
+        """The routes and tiers, in the form from_file reads."""
+        return {"routes": dict(self.routes), "tiers": {tier: list(models) for tier, models in self.tiers.items()}}
+
+    def tier_for(self, key=None, stage=None):
+        for candidate in (key, stage):
+            if candidate is not None and candidate in self.routes:
+                return self.routes[candidate]
+        return self.routes.get("default", next(iter(self.tiers)))
+
+    def _model_health(self, model):
+        if model not in self._health:
+            self._health[model] = _ModelHealth(self.window)
+        return self._health[model]
+
+    def _healthy(self, model):
+        with self._lock:
+            health = self._model_health(model)
+            if health.tripped_at is not None and time.monotonic() - health.tripped_at >= self.cooldown:
+                # Give the model a fresh window after its cooldown
+                self._health[model] = _ModelHealth(self.window)
+                return True
+            return health.tripped_at is None
+
+    def observe(self, model, latency=None, ok=True):
+        """Feed one call's outcome into the model's rolling window."""
+        with self._lock:
+            health = self._model_health(model)
+            health.outcomes.append(ok)
+            if latency is not None:
+                health.latencies.append(latency)
+            if health.tripped_at is not None or len(health.outcomes) < self.min_calls:
+                return
+            stats = health.snapshot()
+            if stats["error_rate"] > self.max_error_rate:
+                health.reason = f"error rate {stats['error_rate']:.0%} > {self.max_error_rate:.0%}"
+            elif (self.max_p95_latency is not None and stats["p95_latency"] is not None
+                  and stats["p95_latency"] > self.max_p95_latency):
+                health.reason = f"p95 latency {stats['p95_latency']:.2f}s > {self.max_p95_latency:.2f}s"
+            else:
+                return
+            health.tripped_at = time.monotonic()
+
+    def candidates(self, key=None, stage=None):
+        """(tier, models to try in order, models skipped as unhealthy) for one call."""
+        tier = self.tier_for(key, stage)
+        models = self.tiers[tier]
+        healthy = [model for model in models if self._healthy(model)]
+        skipped = [model for model in models if model not in healthy]
+        # With every model unhealthy, still try them all in order of preference
+        return tier, healthy + skipped, skipped
+
+    def health(self):
+        """Rolling statistics per model."""
+        with self._lock:
+            return {model: health.snapshot() for model, health in self._health.items()}
+
+    def _decision(self, key, tier, model, skipped, failed):
+        with self._lock:
+            skipped = [{"model": name, "reason": self._model_health(name).reason} for name in skipped]
+        return {"key": key, "tier": tier, "model": model, "skipped": skipped, "failed": failed}
+
+    def _observe_result(self, model, result):
+        if not getattr(result, 'cached', False):
+            latency = getattr(result, 'time_to_first_token', None) or getattr(result, 'latency', None)
+            self.observe(model, latency)
+
+    def call(self, send, key=None):
+        """Return `send(model)` for the routed model, moving on to alternates on retryable failures."""
+        stage = current_stage()
+        tier, models, skipped = self.candidates(key, stage)
+        failed = []
+        for i, model in enumerate(models):
+            try:
+                result = send(model)
+            except OpenRouterError as e:
+                if not e.retryable:
+                    raise
+                self.observe(model, ok=False)
+                if i == len(models) - 1:
+                    raise
+                failed.append({"model": model, "error": type(e).__name__})
+                continue
+            self._observe_result(model, result)
+            record_route(self._decision(key, tier, model, skipped, failed))
+            return result
+
+    async def acall(self, send, key=None):
+        """Async version of call: `send(model)` returns an awaitable."""
+        stage = current_stage()
+        tier, models, skipped = self.candidates(key, stage)
+        failed = []
+        for i, model in enumerate(models):
+            try:
+                result = await send(model)
+            except OpenRouterError as e:
+                if not e.retryable:
+                    raise
+                self.observe(model, ok=False)
+                if i == len(models) - 1:
+                    raise
+                failed.append({"model": model, "error": type(e).__name__})
+                continue
+            self._observe_result(model, result)
+            record_route(self._decision(key, tier, model, skipped, failed))
+            return result
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router():
+    """Return the process-wide router shared by the teams, creating it on first use.
+
+    Its configuration is read from the JSON file named by
+    OPENROUTER_ROUTING_CONFIG if that is set, so model health is pooled
+    across every team in the process.
+    """
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            path = os.environ.get("OPENROUTER_ROUTING_CONFIG")
+            _default_router = ModelRouter.from_file(path) if path else ModelRouter()
+        return _default_router
+
+
+def set_default_router(router):
+    """Swap the process-wide router; returns the previous one so callers can restore it."""
+    global _default_router
+    with _default_router_lock:
+        previous, _default_router = _default_router, router
+        return previous
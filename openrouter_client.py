@@ -0,0 +1,546 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+import contextvars
+import aiohttp
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from stream_observers import current_observer
+from response_cache import ResponseCache, cache_bypassed, cache_key, replay
+from openrouter_errors import APIConnectionError, error_from_status, parse_retry_after
+from sse_parser import ChatStreamParser, iter_deltas
+from request_scheduler import estimate_tokens, get_default_scheduler
+from usage_tracking import CompletionResult, record_completion
+from single_flight import AsyncSingleFlight, SingleFlight
+from hedging import HedgePolicy, HedgeRace
+from cancellation import current_token, run_with_token
+from tracing import completion_attributes, span
+from profiling import followed
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "anthropic/claude-3.5-sonnet"
+
+
+class StreamHandle:
+    """Lets another thread abort a sync stream, even one blocked reading the socket.
+
+    Closing a requests Response from another thread does not wake a blocked
+    read, so close() shuts the underlying socket down instead; the reader
+    then fails with a connection error and the connection is discarded.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self._response = None
+        self._lock = threading.Lock()
+
+    def attach(self, response):
+        """Track `response`; returns False (and aborts it) if the handle was already closed."""
+        with self._lock:
+            self._response = response
+            closed = self.closed
+        if closed:
+            _abort(response)
+        return not closed
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            response = self._response
+        if response is not None:
+            _abort(response)
+
+
+def _abort(response):
+    connection = getattr(response.raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _traced(chat_span, result):
+    chat_span.set_attributes(completion_attributes(result))
+    return result
+
+
+class _BaseClient:
+    """Configuration and request plumbing shared by the sync and async clients."""
+
+    def __init__(self, api_key, base_url, connect_timeout, read_timeout, cache, scheduler, single_flight,
+                 hedging):
+        self._api_key = api_key
+        self.base_url = base_url or os.environ.get("OPENROUTER_BASE_URL", DEFAULT_BASE_URL)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.cache = cache
+        self._scheduler = scheduler
+        # Coalesces identical concurrent requests into one upstream stream (None turns this off)
+        self.single_flight = single_flight
+        # Sends a second request for streams slow to start (see hedging.py; None turns this off)
+        self.hedging = hedging
+
+    @property
+    def api_key(self):
+        return self._api_key or os.environ.get("OPENROUTER_API_KEY")
+
+    @property
+    def scheduler(self):
+        """The client's own RequestScheduler if one was given, otherwise the shared default one."""
+        return self._scheduler or get_default_scheduler()
+
+    def _headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _payload(self, messages, model):
+        return {
+            "model": model,
+            "messages": messages,
+            "stream": True
+        }
+
+    def _active_cache(self, use_cache):
+        if self.cache is None or not use_cache or self.cache.bypass or cache_bypassed():
+            return None
+        return self.cache
+
+    def _active_single_flight(self, use_cache):
+        # A forced fresh completion should not share someone else's either
+        if self.single_flight is None or not use_cache or cache_bypassed():
+            return None
+        return self.single_flight
+
+    def _hedge_delay(self):
+        """Count an attempt against the hedge budget and return the delay before hedging it, or None."""
+        if self.hedging is None:
+            return None
+        self.hedging.record_request()
+        return self.hedging.threshold()
+
+    def _observe_first_token(self, parser, started):
+        if self.hedging is not None and parser.first_token_at:
+            self.hedging.observe(parser.first_token_at - started)
+
+    def _settle_race(self, race, hedges):
+        """Record the outcome of a hedged attempt in `hedges` and in the policy."""
+        winner = race.winner or "primary"
+        if winner == "hedge":
+            hedges["won"] += 1
+            self.hedging.record_win()
+        self.hedging.observe(race.time_to_first_token(winner))
+
+    def _cached_result(self, text, model, started):
+        result = CompletionResult(text, model=model, latency=time.perf_counter() - started, cached=True)
+        record_completion(result)
+        return result
+
+    def _coalesced_result(self, parser, text, model, started):
+        """Result for a caller that shared another caller's request; its tokens are billed to that caller."""
+        first_token = parser.first_token_at - started if parser.first_token_at else None
+        result = CompletionResult(text, response_id=parser.response_id, model=model,
+                                  time_to_first_token=max(0.0, first_token) if first_token is not None else None,
+                                  latency=time.perf_counter() - started, coalesced=True)
+        record_completion(result)
+        return result
+
+    def _result(self, parser, text, model, messages, started, attempts, hedges):
+        """Wrap a finished stream in a CompletionResult and record it in the active usage scope.
+
+        Token counts come from the usage block OpenRouter sends with the last
+        chunk; when it is missing they are estimated and flagged as such.
+        Prompt tokens the provider served from its prompt cache are reported
+        under `prompt_tokens_details.cached_tokens`.
+        """
+        usage = parser.usage or {}
+        estimated = not usage
+        result = CompletionResult(
+            text,
+            response_id=parser.response_id,
+            model=model,
+            prompt_tokens=usage.get('prompt_tokens') if usage else estimate_tokens(json.dumps(messages)),
+            completion_tokens=usage.get('completion_tokens') if usage else estimate_tokens(text),
+            cached_prompt_tokens=(usage.get('prompt_tokens_details') or {}).get('cached_tokens'),
+            time_to_first_token=parser.first_token_at - started if parser.first_token_at else None,
+            latency=time.perf_counter() - started,
+            retries=attempts - 1,
+            usage_estimated=estimated,
+            hedges_issued=hedges["issued"],
+            hedges_won=hedges["won"],
+        )
+        record_completion(result)
+        return result
+
+
+class OpenRouterClient(_BaseClient):
+    """Thread-safe OpenRouter client that keeps connections alive in a bounded pool.
+
+    All threads share one HTTPAdapter (and therefore one urllib3 pool manager),
+    while each thread gets its own lightweight Session on top of it. Every call
+    goes through a RequestScheduler (retries, rate limits, global concurrency),
+    and an optional ResponseCache answers repeated identical requests.
+    Identical requests made while one is still streaming share that stream
+    (see single_flight.py) unless `single_flight=False`. With a HedgePolicy
+    as `hedging`, an attempt that is slow to produce its first token is
+    raced against a second, identical request.
+    """
+
+    def __init__(self, api_key=None, base_url=None, connect_timeout=10.0, read_timeout=120.0,
+                 pool_connections=4, pool_maxsize=32, pool_block=True, cache=None, scheduler=None,
+                 single_flight=True, hedging=None):
+        super().__init__(api_key, base_url, connect_timeout, read_timeout, cache, scheduler,
+                         SingleFlight(max_workers=pool_maxsize) if single_flight is True else single_flight or None,
+                         hedging)
+        self.pool_maxsize = pool_maxsize
+        self._hedge_executor = None
+        # pool_connections is the number of per-host pools kept, pool_maxsize the
+        # number of keep-alive connections per host; pool_block bounds the pool.
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                    pool_block=pool_block)
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def _get_session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def stream_chat(self, messages, model=DEFAULT_MODEL, observer=None, language=None, use_cache=True):
+        """Stream a chat completion and return it as a CompletionResult.
+
+        The result is a str holding the concatenated response text, with the
+        response id, token usage, timings and retry count attached. Stream
+        events go to `observer`, or to the one installed with
+        stream_observers.observe(); cache hits are replayed to it. Raises an
+        OpenRouterError subclass once the scheduler gives up retrying. Each
+        call is traced as an "openrouter.chat" span.
+        """
+        with span("openrouter.chat", kind="client", **{"llm.model": model}) as chat_span:
+            return _traced(chat_span, self._stream_chat(messages, model, observer, language, use_cache))
+
+    def _stream_chat(self, messages, model, observer, language, use_cache):
+        started = time.perf_counter()
+        observer = observer or current_observer()
+        cache = self._active_cache(use_cache)
+        if cache is not None:
+            key = cache_key(model, language, messages)
+            cached = cache.get(key)
+            if cached is not None:
+                replay(cached, observer)
+                return self._cached_result(cached, model, started)
+
+        data = self._payload(messages, model)
+
+        def fetch(stream_observer):
+            attempts = 0
+            hedges = {"issued": 0, "won": 0}
+
+            def attempt():
+                nonlocal attempts
+                attempts += 1
+                return self._stream_attempt(data, stream_observer, hedges)
+
+            parser, text = self.scheduler.run(attempt, estimated_tokens=estimate_tokens(json.dumps(messages)))
+            self.scheduler.record_tokens(estimate_tokens(text))
+            if cache is not None and text:
+                cache.set(key, text)
+            return parser, text, attempts, hedges
+
+        single_flight = self._active_single_flight(use_cache)
+        if single_flight is None:
+            parser, text, attempts, hedges = fetch(observer)
+        else:
+            (parser, text, attempts, hedges), leader = single_flight.run(cache_key(model, language, messages), fetch, observer)
+            if not leader:
+                return self._coalesced_result(parser, text, model, started)
+        return self._result(parser, text, model, messages, started, attempts, hedges)
+
+    def _stream_attempt(self, data, observer, hedges):
+        """One scheduler attempt: a plain stream, or a primary/hedge race when hedging is on.
+
+        The primary streams in this thread; if it has no first token after the
+        policy's delay, a timer starts the hedge on the hedge pool. Whichever
+        produces a token first wins and the other is aborted. If the primary
+        fails before that, the hedge is waited for; if both fail, the
+        primary's error is raised.
+        """
+        delay = self._hedge_delay()
+        if delay is None:
+            started = time.perf_counter()
+            parser, text = self._stream_once(data, observer)
+            self._observe_first_token(parser, started)
+            return parser, text
+
+        race = HedgeRace(observer)
+        primary = StreamHandle()
+        hedge = {}
+
+        def start():
+            if self.hedging.try_hedge():
+                handle = StreamHandle()
+                # Copy the context so the hedge honours the caller's CancellationToken
+                hedge["future"] = self._hedge_pool().submit(contextvars.copy_context().run, followed,
+                                                            self._stream_once, data, race.racer("hedge", handle.close),
+                                                            handle)
+                hedges["issued"] += 1
+
+        timer = threading.Timer(delay, race.start_hedge, (start,))
+        timer.daemon = True
+        timer.start()
+        try:
+            result, error = self._stream_once(data, race.racer("primary", primary.close), primary), None
+        except Exception as e:
+            result, error = None, e
+        finally:
+            timer.cancel()
+            race.close()
+        future = hedge.get("future")
+        if future is not None and race.winner != "primary":
+            wait([future])
+        if race.winner == "hedge":
+            result = future.result()
+        elif error is not None:
+            race.fail(error)
+            raise error
+        self._settle_race(race, hedges)
+        return result
+
+    def _hedge_pool(self):
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self.pool_maxsize, thread_name_prefix="hedge")
+            return self._hedge_executor
+
+    def _stream_once(self, data, observer, handle=None):
+        """Stream one attempt. With a CancellationToken installed, its deadline caps the read timeout
+        and cancelling it aborts the stream at once."""
+        observer.on_start()
+        token = current_token()
+        unregister = None
+        if token is not None:
+            handle = handle or StreamHandle()
+            unregister = token.on_cancel(handle.close)
+        try:
+            try:
+                if token is not None:
+                    token.check()
+                response = self._get_session().post(self.base_url, headers=self._headers(), json=data,
+                                                    stream=True, timeout=self._timeout_for(token))
+                with response:
+                    if handle is not None and not handle.attach(response):
+                        raise APIConnectionError("Stream cancelled")
+                    if response.status_code >= 400:
+                        raise error_from_status(response.status_code, response.text,
+                                                parse_retry_after(response.headers.get('Retry-After')))
+                    parser = ChatStreamParser(observer)
+                    # Read to the end of the body (past [DONE]) so the connection goes back to the pool
+                    for _ in iter_deltas(response.iter_lines(), parser):
+                        pass
+            except requests.exceptions.RequestException as e:
+                raise APIConnectionError(f"Error: {e}") from e
+        except Exception as e:
+            error = token.error() if token is not None and token.expired() else e
+            observer.on_error(error)
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            if unregister is not None:
+                unregister()
+        return parser, parser.finish()
+
+    def _timeout_for(self, token):
+        remaining = token.remaining() if token is not None else None
+        if remaining is None:
+            return self.timeout
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+
+    def close(self):
+        """Close every per-thread session and release pooled connections."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self._adapter.close()
+        if self.single_flight is not None:
+            self.single_flight.close()
+        with self._lock:
+            executor, self._hedge_executor = self._hedge_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self._local = threading.local()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client():
+    """Return the process-wide client shared by all agents, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OpenRouterClient(cache=ResponseCache.from_env(), hedging=HedgePolicy.from_env())
+        return _default_client
+
+
+def set_default_client(client):
+    """Swap the process-wide client, e.g. for one pointed at a local fake server.
+
+    Returns the previously installed client so callers can restore it.
+    """
+    global _default_client
+    with _default_client_lock:
+        previous, _default_client = _default_client, client
+        return previous
+
+
+class AsyncOpenRouterClient(_BaseClient):
+    """asyncio counterpart of OpenRouterClient built on a pooled aiohttp session.
+
+    The session is bound to the event loop it was first used in, so create one
+    client per loop (e.g. per AsyncMarketingTeam run) and close it when done.
+    It shares the default RequestScheduler with the sync client, so limits
+    apply across threads and tasks alike.
+    """
+
+    def __init__(self, api_key=None, base_url=None, connect_timeout=10.0, read_timeout=120.0,
+                 pool_maxsize=100, pool_maxsize_per_host=32, cache=None, scheduler=None, single_flight=True,
+                 hedging=None):
+        super().__init__(api_key, base_url, connect_timeout, read_timeout, cache, scheduler,
+                         AsyncSingleFlight() if single_flight is True else single_flight or None, hedging)
+        self.pool_maxsize = pool_maxsize
+        self.pool_maxsize_per_host = pool_maxsize_per_host
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize, limit_per_host=self.pool_maxsize_per_host)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def stream_chat(self, messages, model=DEFAULT_MODEL, observer=None, language=None, use_cache=True):
+        """Async version of OpenRouterClient.stream_chat; cancelled as soon as the current CancellationToken is."""
+        with span("openrouter.chat", kind="client", **{"llm.model": model}) as chat_span:
+            return _traced(chat_span, await run_with_token(self._stream_chat(messages, model, observer, language,
+                                                                             use_cache)))
+
+    async def _stream_chat(self, messages, model, observer, language, use_cache):
+        started = time.perf_counter()
+        observer = observer or current_observer()
+        cache = self._active_cache(use_cache)
+        if cache is not None:
+            key = cache_key(model, language, messages)
+            cached = cache.get(key)
+            if cached is not None:
+                replay(cached, observer)
+                return self._cached_result(cached, model, started)
+
+        data = self._payload(messages, model)
+
+        async def fetch(stream_observer):
+            attempts = 0
+            hedges = {"issued": 0, "won": 0}
+
+            def attempt():
+                nonlocal attempts
+                attempts += 1
+                return self._stream_attempt(data, stream_observer, hedges)
+
+            parser, text = await self.scheduler.arun(attempt, estimated_tokens=estimate_tokens(json.dumps(messages)))
+            self.scheduler.record_tokens(estimate_tokens(text))
+            if cache is not None and text:
+                cache.set(key, text)
+            return parser, text, attempts, hedges
+
+        single_flight = self._active_single_flight(use_cache)
+        if single_flight is None:
+            parser, text, attempts, hedges = await fetch(observer)
+        else:
+            (parser, text, attempts, hedges), leader = await single_flight.run(cache_key(model, language, messages), fetch,
+                                                                       observer)
+            if not leader:
+                return self._coalesced_result(parser, text, model, started)
+        return self._result(parser, text, model, messages, started, attempts, hedges)
+
+    async def _stream_attempt(self, data, observer, hedges):
+        """Async version of OpenRouterClient._stream_attempt; the primary and the hedge are tasks."""
+        delay = self._hedge_delay()
+        if delay is None:
+            started = time.perf_counter()
+            parser, text = await self._stream_once(data, observer)
+            self._observe_first_token(parser, started)
+            return parser, text
+
+        claimed = asyncio.Event()
+        race = HedgeRace(observer, on_claim=claimed.set)
+        primary = asyncio.ensure_future(self._stream_once(data, race.racer("primary")))
+        race.set_cancel("primary", primary.cancel)
+        hedge = None
+        try:
+            waiter = asyncio.ensure_future(claimed.wait())
+            await asyncio.wait((primary, waiter), timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if not primary.done() and race.winner is None and self.hedging.try_hedge():
+                hedge = asyncio.ensure_future(self._stream_once(data, race.racer("hedge")))
+                race.set_cancel("hedge", hedge.cancel)
+                hedges["issued"] += 1
+            await asyncio.wait([task for task in (primary, hedge) if task is not None])
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+        if race.winner is None and primary.exception() is not None:
+            race.fail(primary.exception())
+        result = (hedge if race.winner == "hedge" else primary).result()
+        self._settle_race(race, hedges)
+        return result
+
+    async def _stream_once(self, data, observer):
+        observer.on_start()
+        try:
+            try:
+                async with self._get_session().post(self.base_url, headers=self._headers(), json=data) as response:
+                    if response.status >= 400:
+                        raise error_from_status(response.status, await response.text(),
+                                                parse_retry_after(response.headers.get('Retry-After')))
+                    parser = ChatStreamParser(observer)
+                    async for line in response.content:
+                        parser.feed_line(line.rstrip(b"\r\n"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise APIConnectionError(f"Error: {e}") from e
+        except Exception as e:
+            observer.on_error(e)
+            raise
+        return parser, parser.finish()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
@@ -0,0 +1,74 @@
+import time
+from email.utils import parsedate_to_datetime
+
+
+class OpenRouterError(Exception):
+    """Base class for failed OpenRouter calls.
+
+    `retryable` tells schedulers and orchestrators whether trying the same
+    request again can succeed.
+    """
+
+    retryable = False
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class APIConnectionError(OpenRouterError):
+    """The request could not be sent or the stream broke off (connection errors, timeouts)."""
+    retryable = True
+
+
+class RateLimitError(OpenRouterError):
+    """HTTP 429: too many requests or tokens."""
+    retryable = True
+
+
+class ServerError(OpenRouterError):
+    """HTTP 5xx, or an error event inside an otherwise successful stream."""
+    retryable = True
+
+
+class AuthenticationError(OpenRouterError):
+    """HTTP 401/403: missing or invalid API key, or no credits left."""
+
+
+class BadRequestError(OpenRouterError):
+    """Any other 4xx: the request itself is wrong and retrying will not help."""
+
+
+class OperationCancelled(OpenRouterError):
+    """The call was cancelled through its CancellationToken before it finished."""
+
+
+class DeadlineExceeded(OperationCancelled):
+    """The call ran out of time: its plan or stage deadline passed."""
+
+
+def parse_retry_after(value):
+    """Seconds to wait according to a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_from_status(status_code, body="", retry_after=None):
+    """Map an HTTP error status to the matching OpenRouterError."""
+    message = f"Error: {status_code}, {body}"
+    if status_code == 429:
+        return RateLimitError(message, status_code, retry_after)
+    if status_code in (401, 402, 403):
+        return AuthenticationError(message, status_code)
+    if status_code >= 500 or status_code == 408:
+        return ServerError(message, status_code, retry_after)
+    return BadRequestError(message, status_code)
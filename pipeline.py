@@ -0,0 +1,166 @@
+import asyncio
+import logging
+from response_cache import cache_bypassed
+from stage_store import stage_key
+from openrouter_errors import DeadlineExceeded
+
+
+class Stage:
+    """One step of the marketing pipeline.
+
+    `run` is a coroutine function that receives a dict of the outputs of the
+    stages named in `deps` and returns this stage's output. `params` names
+    the brief fields the stage reads besides those outputs.
+    """
+
+    def __init__(self, name, title, run, deps=(), params=()):
+        self.name = name
+        self.title = title
+        self.run = run
+        self.deps = tuple(deps)
+        self.params = tuple(params)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps!r})"
+
+
+class PlanResult(list):
+    """Sections of a plan run plus how the run ended.
+
+    `status` is "completed", or "timed_out" / "cancelled" for a run stopped
+    by its CancellationToken, in which case the list holds only the
+    sections finished before that and `error` says why ("failed" is used
+    for a translation that did not succeed). A plan produced in several
+    languages keeps one PlanResult per extra language in `translations` and
+    their documents in `documents`.
+    """
+
+    def __init__(self, sections=(), status="completed", error=None):
+        super().__init__(sections)
+        self.status = status
+        self.error = error
+        self.translations = {}
+        self.documents = {}
+
+    @property
+    def completed(self):
+        return self.status == "completed"
+
+
+def plan_attributes(result, usage):
+    """Span attributes summing up a plan run (`result` is None for a failed run)."""
+    totals = usage.totals()
+    return {
+        "plan.status": result.status if result is not None else "failed",
+        "plan.sections": len(result) if result is not None else 0,
+        "plan.languages": ",".join(result.translations) if result is not None and result.translations else None,
+        "llm.calls": totals["calls"],
+        "llm.prompt_tokens": totals["prompt_tokens"],
+        "llm.completion_tokens": totals["completion_tokens"],
+    }
+
+
+def cancelled_status(error):
+    """PlanResult status for an OperationCancelled error."""
+    return "timed_out" if isinstance(error, DeadlineExceeded) else "cancelled"
+
+
+def topological_order(stages):
+    """Return the stages sorted so that every stage comes after its dependencies."""
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+    ordered, done, visiting = [], set(), set()
+
+    def visit(stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Dependency cycle detected at stage '{stage.name}'")
+        visiting.add(stage.name)
+        for dep in stage.deps:
+            visit(by_name[dep])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def stage_depths(stages):
+    """Number of stages on the longest path from each stage to the end of the graph, itself included.
+
+    A stage's share of the plan deadline is the time left divided by its depth.
+    """
+    dependents = {stage.name: [] for stage in stages}
+    for stage in stages:
+        for dep in stage.deps:
+            dependents[dep].append(stage.name)
+    depths = {}
+    for stage in reversed(topological_order(stages)):
+        depths[stage.name] = 1 + max((depths[name] for name in dependents[stage.name]), default=0)
+    return depths
+
+
+async def _stored(output):
+    return output
+
+
+async def _run_and_store(stage, inputs, store, key):
+    output = await stage.run(inputs)
+    store.put(key, stage.name, output)
+    return output
+
+
+async def run_stage_graph(stages, on_stage_complete=None, store=None, params=None, on_stage_reused=None):
+    """Run a dependency graph of stages, starting each one as soon as its inputs are ready.
+
+    Independent stages run concurrently. `on_stage_complete(stage, output)` is
+    called as each stage finishes. With a StageStore, a stage whose declared
+    `params` (looked up in `params`) and dependency outputs match an earlier
+    run reuses that run's output (reported to `on_stage_reused(stage)`), and
+    every stage that does run is stored as soon as it finishes. Returns a dict of stage name to output; if a
+    stage raises, the remaining in-flight stages are cancelled and the error
+    propagates.
+    """
+    pending = {stage.name: stage for stage in topological_order(stages)}
+    results = {}
+    running = {}
+    if cache_bypassed():
+        store = None
+
+    try:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(dep in results for dep in stage.deps):
+                    inputs = {dep: results[dep] for dep in stage.deps}
+                    if store is None:
+                        coroutine = stage.run(inputs)
+                    else:
+                        key = stage_key(stage.name, stage.params, params or {}, inputs)
+                        output = store.get(key)
+                        if output is not None:
+                            logging.info(f"Reusing the stored output of stage '{stage.name}'")
+                            if on_stage_reused:
+                                on_stage_reused(stage)
+                            coroutine = _stored(output)
+                        else:
+                            coroutine = _run_and_store(stage, inputs, store, key)
+                    running[asyncio.ensure_future(coroutine)] = stage
+                    del pending[name]
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage = running.pop(task)
+                results[stage.name] = task.result()
+                if on_stage_complete:
+                    on_stage_complete(stage, results[stage.name])
+    finally:
+        for task in running:
+            task.cancel()
+    return results
@@ -0,0 +1,195 @@
+import os
+import sys
+import logging
+import time
+import cProfile
+import threading
+import itertools
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_MODES = ('cprofile', 'sample')
+# Sampling costs little enough to leave on under load, unlike cProfile
+DEFAULT_PROFILE_MODE = 'sample'
+
+# The sampling session of the plan running in this context, if it is being sampled
+_active_session = contextvars.ContextVar("profile_session", default=None)
+
+
+class PlanProfiler:
+    """Opt-in profiling of plan runs, one output file per run in `directory`.
+
+    Mode "cprofile" runs cProfile in the thread that runs the plan (for
+    AsyncMarketingTeam, the event loop thread) and saves pstats data as
+    `<name>-<n>.prof`. Mode "sample" (the default) records the stacks of the
+    plan's thread every `interval` seconds, together with those of the
+    threads working for it: fan-out workers, hedged requests and the
+    single-flight requests it started (see follow_thread()). It saves them
+    as folded stacks in `<name>-<n>.folded`, ready for flamegraph.pl or
+    speedscope. Concurrent
+    plans share one sampler thread per process, and each profile holds only
+    its own plan's threads (for AsyncMarketingTeam that is the event loop
+    thread, which plans running on the same loop share), so it costs little
+    enough to leave on under load.
+    """
+
+    def __init__(self, directory, mode=DEFAULT_PROFILE_MODE, interval=0.01):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}")
+        self.directory = directory
+        self.mode = mode
+        self.interval = interval
+        self._counter = itertools.count(1)
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        extension = ".prof" if self.mode == 'cprofile' else ".folded"
+        return os.path.join(self.directory, f"{name}-{os.getpid()}-{next(self._counter)}{extension}")
+
+    @contextmanager
+    def profile(self, name="plan"):
+        """Profile the enclosed block; yields the path the profile will be written to."""
+        path = self._path(name)
+        if self.mode == 'sample':
+            session = _SampleSession(self.interval)
+            reset = _active_session.set(session)
+            _sampler.add(session)
+            try:
+                with follow_thread():
+                    yield path
+            finally:
+                _sampler.remove(session)
+                _active_session.reset(reset)
+                session.save(path)
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler is already active in this thread (Python 3.12+ allows only one)
+            logging.warning(f"Not profiling {name}: {e}")
+            yield None
+            return
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            logging.info(f"Profile of {name} written to {path}")
+
+
+def current_session():
+    """The sampling session of the plan running in this context, or None; see follow_thread()."""
+    return _active_session.get()
+
+
+@contextmanager
+def follow_thread(session=None):
+    """Include the calling thread in the samples of a plan for the enclosed block.
+
+    The plan is the one whose context the thread runs in, for worker threads
+    started with a copy of the plan's context such as those of
+    batch_calls.fan_out() and of hedged requests. A thread serving a plan
+    outside its context, such as the single-flight upstream threads, passes
+    the `session` captured with current_session() instead. Does nothing
+    outside a sampled plan.
+    """
+    session = session or _active_session.get()
+    if session is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    with session.lock:
+        session.threads[thread_id] = session.threads.get(thread_id, 0) + 1
+    try:
+        yield
+    finally:
+        with session.lock:
+            session.threads[thread_id] -= 1
+            if not session.threads[thread_id]:
+                del session.threads[thread_id]
+
+
+def followed(function, *args):
+    """Call `function(*args)` inside follow_thread(); for submitting to a pool with a copy of the context."""
+    with follow_thread():
+        return function(*args)
+
+
+class _SampleSession:
+    """Folded stacks counted for the threads of one sampled plan."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        # Thread id -> how many follow_thread() blocks it is in
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        logging.info(f"{self.samples} stack samples written to {path}")
+
+
+class _StackSampler:
+    """One background thread sampling the stacks of every active session's threads.
+
+    It runs while at least one session is active, ticking at the shortest
+    interval among them, and folds each sampled thread's stack once per
+    tick however many sessions follow it.
+    """
+
+    def __init__(self):
+        self._sessions = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, session):
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, session):
+        with self._lock:
+            self._sessions.remove(session)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                interval = min(session.interval for session in self._sessions)
+            time.sleep(interval)
+            with self._lock:
+                sessions = list(self._sessions)
+            frames = sys._current_frames()
+            folded = {}
+            for session in sessions:
+                with session.lock:
+                    threads = list(session.threads)
+                session.samples += 1
+                for thread_id in threads:
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        if thread_id not in folded:
+                            folded[thread_id] = _fold(frame)
+                        session.stacks[folded[thread_id]] += 1
+
+
+_sampler = _StackSampler()
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
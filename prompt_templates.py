@@ -0,0 +1,37 @@
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+class PromptTemplate:
+    """Static agent instructions compiled once into a cacheable system message.
+
+    Only the per-request part (product, context, language) goes into the
+    trailing user message, so every call made with the same template starts
+    with a byte-identical prefix. The system block carries an Anthropic-style
+    `cache_control` breakpoint, which OpenRouter passes on so the provider can
+    serve that prefix from its prompt cache. Providers only cache prefixes
+    above a minimum length (1024 tokens for Claude Sonnet); shorter blocks
+    are billed normally, and the marker does no harm.
+    """
+
+    def __init__(self, name, instructions):
+        self.name = name
+        self.instructions = instructions.strip()
+        self.system_message = {
+            "role": "system",
+            "content": [{"type": "text", "text": self.instructions, "cache_control": CACHE_CONTROL}],
+        }
+
+    def messages(self, user_text, language='english'):
+        return [self.system_message, {"role": "user", "content": f"Respond in {language}. {user_text}"}]
+
+    def __repr__(self):
+        return f"PromptTemplate({self.name!r})"
+
+
+def respond_template(role):
+    """Template for an agent answering a message from another agent."""
+    return PromptTemplate(f"{role}_respond", f"""
+You are the {role} AI agent of a marketing team. The user message contains a message from another agent
+of the team. Respond to it from the {role} perspective: build on what is useful, challenge what is weak,
+and add concrete, actionable input.
+""")
@@ -0,0 +1,136 @@
+import io
+import os
+import uuid
+import logging
+import threading
+from datetime import datetime
+from functools import lru_cache
+from docx import Document
+from docx.shared import Pt, RGBColor
+from docx.enum.style import WD_STYLE_TYPE
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+REPORT_TITLES = {'english': "Marketing Team Discussion", 'german': "Marketing-Team-Diskussion"}
+PAGE_LABELS = {'english': "Page ", 'german': "Seite "}
+# Section headings of the plan in languages other than English
+SECTION_TITLES = {
+    'german': {
+        "Initial Marketing Campaign Idea": "Erste Idee für die Marketingkampagne",
+        "Sales Agent Feedback": "Rückmeldung des Vertriebsagenten",
+        "Market Trends Analysis": "Analyse der Markttrends",
+        "Target Audience Analysis": "Zielgruppenanalyse",
+        "Final Marketing Campaign Idea": "Finale Idee für die Marketingkampagne",
+        "Final Marketing Plan": "Finaler Marketingplan",
+    },
+}
+
+
+def localized_title(title, language):
+    """The heading `title` in `language`, or `title` itself when there is no translation for it."""
+    return SECTION_TITLES.get(language, {}).get(title, title)
+
+
+@lru_cache(maxsize=1)
+def _template_bytes():
+    """Serialized empty document with the report styles, built once per process."""
+    doc = Document()
+
+    title_style = doc.styles.add_style('CustomTitle', WD_STYLE_TYPE.PARAGRAPH)
+    title_style.font.name = 'Arial'
+    title_style.font.size = Pt(24)
+    title_style.font.color.rgb = RGBColor(0, 112, 192)  # Blue color
+    title_style.font.bold = True
+    title_style.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    heading_style = doc.styles.add_style('CustomHeading', WD_STYLE_TYPE.PARAGRAPH)
+    heading_style.font.name = 'Calibri'
+    heading_style.font.size = Pt(16)
+    heading_style.font.color.rgb = RGBColor(46, 116, 181)  # Dark blue color
+    heading_style.font.bold = True
+
+    body_style = doc.styles.add_style('CustomBody', WD_STYLE_TYPE.PARAGRAPH)
+    body_style.font.name = 'Georgia'
+    body_style.font.size = Pt(11)
+    body_style.paragraph_format.space_after = Pt(12)
+
+    footer_para = doc.sections[0].footer.paragraphs[0]
+    footer_para.style = doc.styles['Footer']
+    footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def unique_report_path(language='english', directory='.'):
+    """A fresh document path per plan, so concurrent or repeated runs never overwrite each other."""
+    prefix = 'marketing_plan' if language == 'english' else 'marketingplan'
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return os.path.join(directory, f"{prefix}_{stamp}_{uuid.uuid4().hex[:8]}.docx")
+
+
+def translated_report_path(output_path, language):
+    """Where the `language` version of the document written to `output_path` goes.
+
+    A path gets the language appended to its name; without one the version
+    gets a fresh unique path, and for a stream it goes to a new io.BytesIO.
+    """
+    if output_path is None:
+        return unique_report_path(language)
+    if isinstance(output_path, (str, os.PathLike)):
+        root, ext = os.path.splitext(os.fspath(output_path))
+        return f"{root}_{language}{ext or '.docx'}"
+    return io.BytesIO()
+
+
+class ReportWriter:
+    """Builds the plan document section by section as stages finish.
+
+    Starts from the pre-styled template and writes to a file path or a
+    writable binary stream such as io.BytesIO. With `autosave` (the default
+    for paths) the document is saved after every section, so the sections
+    finished before a later stage fails are kept on disk. Paths are replaced
+    atomically, so readers never see a half-written file.
+    """
+
+    def __init__(self, target, language='english', autosave=None):
+        self.target = target
+        self.language = language
+        self.autosave = isinstance(target, (str, os.PathLike)) if autosave is None else autosave
+        self.sections = 0
+        self._lock = threading.Lock()
+        self._doc = Document(io.BytesIO(_template_bytes()))
+        self._doc.add_paragraph(REPORT_TITLES.get(language, REPORT_TITLES['english']), style='CustomTitle')
+        footer_para = self._doc.sections[0].footer.paragraphs[0]
+        footer_para.text = PAGE_LABELS.get(language, PAGE_LABELS['english']) + "{ PAGE }"
+
+    def add_section(self, title, content):
+        """Append a heading and one body paragraph per paragraph of `content`."""
+        with self._lock:
+            self._doc.add_paragraph(title, style='CustomHeading')
+            for line in str(content).splitlines():
+                if line.strip():
+                    self._doc.add_paragraph(line.strip(), style='CustomBody')
+            self.sections += 1
+            if self.autosave:
+                self._save()
+
+    def save(self):
+        """Write the document as it stands and return the target."""
+        with self._lock:
+            self._save()
+        return self.target
+
+    def _save(self):
+        if isinstance(self.target, (str, os.PathLike)):
+            directory = os.path.dirname(os.fspath(self.target))
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{os.fspath(self.target)}.{uuid.uuid4().hex[:8]}.tmp"
+            self._doc.save(tmp_path)
+            os.replace(tmp_path, self.target)
+        else:
+            self.target.seek(0)
+            self.target.truncate()
+            self._doc.save(self.target)
+        logging.debug(f"Saved report with {self.sections} sections to {self.target!r}")
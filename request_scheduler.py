@@ -0,0 +1,212 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from openrouter_errors import OpenRouterError, OperationCancelled
+from cancellation import current_token
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token) used for rate limiting."""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    Callers reserve capacity up front and are told how long to wait before
+    using it, so the same bucket works for threads (time.sleep) and asyncio
+    tasks (asyncio.sleep).
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take `amount` tokens and return the number of seconds to wait before proceeding."""
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= amount
+            if self._level >= 0:
+                return 0.0
+            return -self._level / self.rate
+
+
+class RequestScheduler:
+    """Single gate every OpenRouter call goes through.
+
+    Applies a global concurrency limit shared by threads and asyncio tasks,
+    requests/min and tokens/min token buckets, and retries retryable
+    OpenRouterErrors with exponential backoff and full jitter, honouring
+    Retry-After when the server sends one.
+    """
+
+    def __init__(self, max_retries=4, base_delay=1.0, max_delay=30.0, max_concurrency=16,
+                 requests_per_minute=None, tokens_per_minute=None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._stats_lock = threading.Lock()
+        self.attempts = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+
+    @classmethod
+    def from_env(cls):
+        """Build a scheduler from the OPENROUTER_MAX_RETRIES/_MAX_CONCURRENCY/_RPM/_TPM variables."""
+        rpm = os.environ.get("OPENROUTER_RPM")
+        tpm = os.environ.get("OPENROUTER_TPM")
+        return cls(max_retries=int(os.environ.get("OPENROUTER_MAX_RETRIES", 4)),
+                   max_concurrency=int(os.environ.get("OPENROUTER_MAX_CONCURRENCY", 16)),
+                   requests_per_minute=float(rpm) if rpm else None,
+                   tokens_per_minute=float(tpm) if tpm else None)
+
+    def backoff_delay(self, attempt, error=None):
+        """Seconds to wait before retry number `attempt` (0-based)."""
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _throttle_delay(self, estimated_tokens):
+        delay = 0.0
+        if self.request_bucket:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket and estimated_tokens:
+            delay = max(delay, self.token_bucket.reserve(estimated_tokens))
+        if delay:
+            with self._stats_lock:
+                self.throttled_seconds += delay
+        return delay
+
+    def record_tokens(self, count):
+        """Charge tokens that were only known after the call (e.g. the completion) to the budget."""
+        if self.token_bucket and count:
+            self.token_bucket.reserve(count)
+
+    def _count_attempt(self):
+        with self._stats_lock:
+            self.attempts += 1
+
+    def _should_retry(self, error, attempt):
+        if not error.retryable or attempt >= self.max_retries:
+            return False
+        with self._stats_lock:
+            self.retries += 1
+        logging.warning(f"Retrying OpenRouter call after {type(error).__name__} (attempt {attempt + 1}): {error}")
+        return True
+
+    def run(self, call, estimated_tokens=0):
+        """Run `call()` under the scheduler's limits, retrying retryable errors.
+
+        Waits (throttling, a free slot, backoff) end early with
+        OperationCancelled when the current CancellationToken is cancelled.
+        """
+        token = current_token()
+        attempt = 0
+        while True:
+            delay = self._throttle_delay(estimated_tokens)
+            if delay:
+                self._sleep(delay, token)
+            self._acquire_blocking(token)
+            try:
+                self._count_attempt()
+                try:
+                    return call()
+                except OpenRouterError as e:
+                    error = e
+            finally:
+                self._semaphore.release()
+            if not self._should_retry(error, attempt):
+                raise error
+            self._sleep(self.backoff_delay(attempt, error), token)
+            attempt += 1
+
+    def _sleep(self, delay, token):
+        if token is None:
+            time.sleep(delay)
+        else:
+            token.wait(delay)
+
+    def _acquire_blocking(self, token):
+        if token is None:
+            self._semaphore.acquire()
+            return
+        while not self._semaphore.acquire(timeout=0.05):
+            token.check()
+        try:
+            token.check()
+        except OperationCancelled:
+            self._semaphore.release()
+            raise
+
+    async def arun(self, call, estimated_tokens=0):
+        """Async version of run: `call` is a coroutine function."""
+        token = current_token()
+        attempt = 0
+        while True:
+            if token is not None:
+                token.check()
+            delay = self._throttle_delay(estimated_tokens)
+            if delay:
+                await asyncio.sleep(delay)
+            await self._acquire()
+            self._count_attempt()
+            try:
+                return await call()
+            except OpenRouterError as e:
+                error = e
+            finally:
+                self._semaphore.release()
+            if not self._should_retry(error, attempt):
+                raise error
+            await asyncio.sleep(self.backoff_delay(attempt, error))
+            attempt += 1
+
+    async def _acquire(self):
+        # The semaphore is shared with threads, so poll it instead of blocking the loop
+        delay = 0.001
+        while not self._semaphore.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+
+
+def get_default_scheduler():
+    """Return the process-wide scheduler shared by every client, creating it on first use."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler.from_env()
+        return _default_scheduler
+
+
+def set_default_scheduler(scheduler):
+    """Swap the process-wide scheduler; returns the previous one."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        previous, _default_scheduler = _default_scheduler, scheduler
+        return previous
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def cache_key(model, language, messages):
+    """Content address of one completion request."""
+    payload = json.dumps({"model": model, "language": language, "messages": messages},
+                         sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier cache of completion texts: a bounded in-memory LRU plus an optional SQLite file.
+
+    Entries expire after `ttl` seconds (None keeps them forever). The on-disk
+    tier survives restarts and is shared by every process using the same file.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, db_path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+        self.bypass = False
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache described by OPENROUTER_CACHE_* variables, or None when OPENROUTER_CACHE=off."""
+        if os.environ.get("OPENROUTER_CACHE", "on").lower() in ("off", "0", "false", "no"):
+            return None
+        ttl = os.environ.get("OPENROUTER_CACHE_TTL")
+        return cls(max_entries=int(os.environ.get("OPENROUTER_CACHE_SIZE", 256)),
+                   ttl=float(ttl) if ttl else 3600,
+                   db_path=os.environ.get("OPENROUTER_CACHE_DB") or None)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """Return the cached text for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value, created = row
+                    if not self._expired(created):
+                        self._remember(key, value, created)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        created = time.time()
+        with self._lock:
+            self._remember(key, value, created)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                                 (key, value, created))
+                self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                                 (self.max_disk_entries,))
+                self._db.commit()
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "entries": len(self._memory),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+_bypass = contextvars.ContextVar("response_cache_bypass", default=False)
+
+
+def cache_bypassed():
+    return _bypass.get()
+
+
+@contextmanager
+def bypass_cache():
+    """Force fresh completions for every API call made inside the block."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def replay(text, observer):
+    """Feed a cached completion to a stream observer as if it had just been streamed."""
+    observer.on_start()
+    for token in re.findall(r'\S+\s*|\s+', text):
+        observer.on_bytes(len(token.encode('utf-8')))
+        observer.on_token(token)
+    observer.on_complete(text)
@@ -1,12 +1,40 @@
-import os
-import requests
-import json
-import logging
-
-class SalesAIAgent:
-    def __init__(self):
-        self.api_key = os.environ.get("OPENROUTER_API_KEY")
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+import asyncio
+from base_ai_agent import BaseAIAgent
+from prompt_templates import PromptTemplate, respond_template
+from sales_ingestion import SalesSummary, summarize_sales
+
+SALES_PITCH_TEMPLATE = PromptTemplate("sales_pitch", """
+Create a highly persuasive and tailored sales pitch for the product named in the user message. Your pitch should include:
+1. A compelling opening hook
+2. Clear articulation of the product's unique value proposition
+3. At least three key benefits, with specific examples or data points
+4. Anticipation and preemptive addressing of potential objections
+5. A strong, action-oriented close with a clear next step
+6. Incorporate storytelling elements to make the pitch more engaging and memorable
+
+Take into account any target audience, marketing goals and budget given in the user message.
+Ensure the pitch is adaptable for various communication channels (in-person, phone, email, video call).
+""")
+
+OBJECTION_TEMPLATE = PromptTemplate("objection", """
+Provide effective strategies to handle the type of sales objection named in the user message. Include specific examples and responses.
+""")
+
+FOLLOW_UP_TEMPLATE = PromptTemplate("follow_up", """
+Based on the summary of a sales interaction in the user message, suggest an effective follow-up strategy.
+""")
+
+SALES_PERFORMANCE_TEMPLATE = PromptTemplate("sales_performance", """
+Analyze the sales performance data in the user message and provide actionable insights.
+When the data is a pre-aggregated summary of a larger export, reason from its totals, growth rates,
+percentiles, outliers and cohort conversion rates rather than asking for the raw rows.
+""")
+
+RESPOND_TEMPLATE = respond_template("sales")
+
+class SalesAIAgent(BaseAIAgent):
+    def __init__(self, client=None, async_client=None, router=None):
+        super().__init__(client, async_client, router)
         self.sales_techniques = [
             "SPIN Selling",
             "Consultative Selling",
@@ -24,80 +52,122 @@ class SalesAIAgent:
 
     def generate_sales_pitch(self, product, additional_info=None):
         """Generate a sales pitch for a given product."""
-        prompt = f"Create a highly persuasive and tailored sales pitch for {product}. Your pitch should include:\n"
-        prompt += "1. A compelling opening hook\n"
-        prompt += "2. Clear articulation of the product's unique value proposition\n"
-        prompt += "3. At least three key benefits, with specific examples or data points\n"
-        prompt += "4. Anticipation and preemptive addressing of potential objections\n"
-        prompt += "5. A strong, action-oriented close with a clear next step\n"
-        prompt += "6. Incorporate storytelling elements to make the pitch more engaging and memorable\n"
+        return self.call_openrouter_api(self._sales_pitch_prompt(product, additional_info), template=SALES_PITCH_TEMPLATE)
+
+    async def agenerate_sales_pitch(self, product, additional_info=None):
+        """Async version of generate_sales_pitch."""
+        return await self.acall_openrouter_api(self._sales_pitch_prompt(product, additional_info), template=SALES_PITCH_TEMPLATE)
+
+    def _sales_pitch_prompt(self, product, additional_info):
+        prompt = f"Product: {product}\n"
         if additional_info:
-            prompt += f"\nConsider the following additional information:\n"
             prompt += f"Target Audience: {additional_info.get('target_audience', 'Not specified')}\n"
             prompt += f"Marketing Goals: {additional_info.get('marketing_goals', 'Not specified')}\n"
             prompt += f"Budget: {additional_info.get('budget', 'Not specified')}\n"
-        prompt += "\nEnsure the pitch is adaptable for various communication channels (in-person, phone, email, video call)."
-        return self.call_openrouter_api(prompt)
+        return prompt
 
     def handle_objection(self, objection_type):
         """Provide strategies to handle a specific type of sales objection."""
-        prompt = f"Provide effective strategies to handle the following type of sales objection: {objection_type}. Include specific examples and responses."
-        return self.call_openrouter_api(prompt)
+        return self.call_openrouter_api(self._objection_prompt(objection_type), template=OBJECTION_TEMPLATE)
+
+    async def ahandle_objection(self, objection_type):
+        """Async version of handle_objection."""
+        return await self.acall_openrouter_api(self._objection_prompt(objection_type), template=OBJECTION_TEMPLATE)
+
+    def _objection_prompt(self, objection_type):
+        return f"Objection type: {objection_type}"
+
+    def _objection_tasks(self, objection_types):
+        return {objection_type: (self._objection_prompt(objection_type), OBJECTION_TEMPLATE)
+                for objection_type in (objection_types or self.objection_types)}
+
+    def handle_objections(self, objection_types=None, mode='fan_out', concurrency=4):
+        """Strategies for several objection types (all known ones by default), keyed by type.
+
+        See BaseAIAgent.call_many for the "fan_out" and "packed" modes.
+        """
+        return self.call_many(self._objection_tasks(objection_types), mode, concurrency)
+
+    async def ahandle_objections(self, objection_types=None, mode='fan_out', concurrency=4):
+        """Async version of handle_objections."""
+        return await self.acall_many(self._objection_tasks(objection_types), mode, concurrency)
+
+    def _enablement_kit_tasks(self, product, additional_info, objection_types):
+        tasks = {"pitch": (self._sales_pitch_prompt(product, additional_info), SALES_PITCH_TEMPLATE)}
+        for objection_type, task in self._objection_tasks(objection_types).items():
+            tasks[f"objection: {objection_type}"] = task
+        return tasks
+
+    def build_sales_enablement_kit(self, product, additional_info=None, objection_types=None, mode='packed',
+                                   concurrency=4):
+        """A sales pitch plus objection-handling strategies, by default in a single round-trip.
+
+        Returns {"pitch": ..., "objections": {objection_type: ...}}.
+        """
+        results = self.call_many(self._enablement_kit_tasks(product, additional_info, objection_types), mode,
+                                 concurrency)
+        return self._enablement_kit(results)
+
+    async def abuild_sales_enablement_kit(self, product, additional_info=None, objection_types=None, mode='packed',
+                                          concurrency=4):
+        """Async version of build_sales_enablement_kit."""
+        results = await self.acall_many(self._enablement_kit_tasks(product, additional_info, objection_types), mode,
+                                        concurrency)
+        return self._enablement_kit(results)
+
+    def _enablement_kit(self, results):
+        pitch = results.pop("pitch")
+        return {"pitch": pitch, "objections": {key.split(": ", 1)[1]: value for key, value in results.items()}}
 
     def suggest_follow_up(self, interaction_summary):
         """Suggest a follow-up strategy based on a summary of the previous interaction."""
-        prompt = f"Based on the following summary of a sales interaction, suggest an effective follow-up strategy: {interaction_summary}"
-        return self.call_openrouter_api(prompt)
+        return self.call_openrouter_api(self._follow_up_prompt(interaction_summary), template=FOLLOW_UP_TEMPLATE)
+
+    async def asuggest_follow_up(self, interaction_summary):
+        """Async version of suggest_follow_up."""
+        return await self.acall_openrouter_api(self._follow_up_prompt(interaction_summary), template=FOLLOW_UP_TEMPLATE)
+
+    def _follow_up_prompt(self, interaction_summary):
+        return f"Interaction summary: {interaction_summary}"
 
     def analyze_sales_performance(self, sales_data):
         """Analyze sales performance data and provide insights."""
-        prompt = f"Analyze the following sales performance data and provide actionable insights: {sales_data}"
-        return self.call_openrouter_api(prompt)
-
-    def call_openrouter_api(self, prompt, language='english'):
-        """Make a streaming API call to OpenRouter's Anthropic Claude-3.5-sonnet model."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "anthropic/claude-3.5-sonnet",
-            "messages": [{"role": "user", "content": f"Respond in {language}. {prompt}"}],
-            "stream": True
-        }
-        try:
-            response = requests.post(self.base_url, headers=headers, json=data, stream=True)
-            response.raise_for_status()
-            full_response = ""
-            response_id = None
-            for line in response.iter_lines():
-                if line:
-                    chunk = line.decode('utf-8')
-                    if chunk.startswith("data: "):
-                        try:
-                            chunk_data = json.loads(chunk[6:])
-                            if 'id' in chunk_data and not response_id:
-                                response_id = chunk_data['id']
-                            if chunk_data['choices'][0]['finish_reason'] is None:
-                                content = chunk_data['choices'][0]['delta'].get('content', '')
-                                full_response += content
-                                pass
-                            elif 'usage' in chunk_data:
-                                print(f"Usage data: {chunk_data['usage']}")
-                        except json.JSONDecodeError as e:
-                            print(f"JSON decode error: {e}")
-                            print(f"Problematic chunk: {chunk}")
-                            continue
-            print()  # Print a newline at the end
-            print(f"Response ID: {response_id}")
-            return full_response
-        except requests.exceptions.RequestException as e:
-            print(f"API request error: {e}")
-            return f"Error: {str(e)}"
+        return self.call_openrouter_api(self._sales_performance_prompt(sales_data), template=SALES_PERFORMANCE_TEMPLATE)
+
+    async def aanalyze_sales_performance(self, sales_data):
+        """Async version of analyze_sales_performance."""
+        return await self.acall_openrouter_api(self._sales_performance_prompt(sales_data), template=SALES_PERFORMANCE_TEMPLATE)
+
+    def analyze_sales_file(self, path, columns=None, period='month', memory_map=False, max_groups=10):
+        """Analyze a CSV or Parquet sales export of any size.
+
+        The file is reduced locally to a SalesSummary (see sales_ingestion),
+        and only its bounded-size rendering goes to the model.
+        """
+        summary = summarize_sales(path, columns, period, memory_map=memory_map)
+        return self.call_openrouter_api(self._sales_performance_prompt(summary, max_groups),
+                                        template=SALES_PERFORMANCE_TEMPLATE)
+
+    async def aanalyze_sales_file(self, path, columns=None, period='month', memory_map=False, max_groups=10):
+        """Async version of analyze_sales_file; the file is aggregated in a worker thread."""
+        summary = await asyncio.to_thread(summarize_sales, path, columns, period, memory_map=memory_map)
+        return await self.acall_openrouter_api(self._sales_performance_prompt(summary, max_groups),
+                                               template=SALES_PERFORMANCE_TEMPLATE)
+
+    def _sales_performance_prompt(self, sales_data, max_groups=10):
+        if isinstance(sales_data, SalesSummary):
+            return f"Sales performance summary:\n{sales_data.to_prompt(max_groups=max_groups)}"
+        return f"Sales performance data: {sales_data}"
 
     def respond_to_agent(self, message, language='english'):
         """Respond to messages from other agents."""
-        prompt = f"As a sales AI agent, respond to the following message from another agent: {message}"
-        return self.call_openrouter_api(prompt, language=language)
+        return self.call_openrouter_api(self._respond_prompt(message), language=language, template=RESPOND_TEMPLATE)
+
+    async def arespond_to_agent(self, message, language='english'):
+        """Async version of respond_to_agent."""
+        return await self.acall_openrouter_api(self._respond_prompt(message), language=language, template=RESPOND_TEMPLATE)
+
+    def _respond_prompt(self, message):
+        return f"Message from another agent: {message}"
 
 # Note: main() function removed as it's no longer needed in this file
@@ -0,0 +1,399 @@
+import csv
+import mmap
+import heapq
+import numpy as np
+
+# Logical column -> header name in the export; every column but `amount` is optional
+DEFAULT_COLUMNS = {
+    "amount": "amount",
+    "rep": "rep",
+    "region": "region",
+    "date": "date",
+    "cohort": "cohort",
+    "converted": "converted",
+}
+PERIODS = ("day", "month", "quarter", "year")
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+TRUTHY = ("1", "true", "yes", "y", "won", "converted", "closed won")
+_KEY_SEPARATOR = "\x1f"
+
+
+def _valid_dates(dates, period):
+    """Mask of the ISO date strings that have the parts `period` needs (YYYY for a year up to YYYY-MM-DD for a day)."""
+    # Code points of the first 10 characters, one row per date (0 past the end of shorter strings)
+    codes = np.ascontiguousarray(dates.astype('U10')).view(np.uint32).reshape(len(dates), 10).astype(np.int64)
+    digits = (codes >= ord('0')) & (codes <= ord('9'))
+    valid = digits[:, :4].all(axis=1)
+    if period == "year":
+        return valid
+    month = (codes[:, 5] - ord('0')) * 10 + codes[:, 6] - ord('0')
+    valid &= (codes[:, 4] == ord('-')) & digits[:, 5] & digits[:, 6] & (month >= 1) & (month <= 12)
+    if period != "day":
+        return valid
+    day = (codes[:, 8] - ord('0')) * 10 + codes[:, 9] - ord('0')
+    return valid & (codes[:, 7] == ord('-')) & digits[:, 8] & digits[:, 9] & (day >= 1) & (day <= 31)
+
+
+def _period_keys(dates, period):
+    """Vectorized period labels for ISO date strings (YYYY-MM-DD...)."""
+    dates = dates.astype('U10')
+    if period == "day":
+        return dates
+    if period == "year":
+        return dates.astype('U4')
+    months = dates.astype('U7')
+    if period == "month":
+        return months
+    month_numbers = np.char.partition(months, '-')[:, 2].astype(int)
+    return np.char.add(np.char.add(months.astype('U4'), '-Q'), ((month_numbers - 1) // 3 + 1).astype('U1'))
+
+
+def _parse_amounts(values):
+    """Float amounts, with NaN for cells that are empty or not numbers."""
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except ValueError:
+        amounts = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                amounts[i] = float(value)
+            except ValueError:
+                amounts[i] = np.nan
+        return amounts
+
+
+def _lines(path, memory_map):
+    """Decoded lines of a text file, read through a memory map when `memory_map` is set."""
+    if not memory_map:
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from f
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for line in iter(mapped.readline, b""):
+            yield line.decode('utf-8')
+
+
+def iter_csv_chunks(path, columns=None, chunk_rows=100_000, memory_map=False):
+    """Yield the mapped `columns` of a CSV export as dicts of NumPy arrays, `chunk_rows` rows at a time.
+
+    Only one chunk is held in memory at once, whatever the file size.
+    """
+    columns = columns or DEFAULT_COLUMNS
+    reader = csv.reader(_lines(path, memory_map))
+    header = next(reader, None)
+    if header is None:
+        return
+    positions = {name: header.index(column) for name, column in columns.items() if column in header}
+    if "amount" not in positions:
+        raise ValueError(f"{path} has no '{columns['amount']}' column")
+    rows = []
+    for row in reader:
+        if row:
+            rows.append(row)
+        if len(rows) >= chunk_rows:
+            yield _csv_chunk(rows, positions)
+            rows = []
+    if rows:
+        yield _csv_chunk(rows, positions)
+
+
+def _csv_chunk(rows, positions):
+    width = max(positions.values()) + 1
+    cells = [row + [""] * (width - len(row)) if len(row) < width else row for row in rows]
+    chunk = {}
+    for name, position in positions.items():
+        values = [row[position] for row in cells]
+        chunk[name] = _parse_amounts(values) if name == "amount" else np.array(values, dtype=str)
+    return chunk
+
+
+def iter_parquet_chunks(path, columns=None, chunk_rows=100_000, memory_map=False):
+    """Yield a Parquet export in record batches like iter_csv_chunks; needs the optional pyarrow package."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading Parquet files needs pyarrow (pip install pyarrow)") from e
+    columns = columns or DEFAULT_COLUMNS
+    parquet = pq.ParquetFile(path, memory_map=memory_map)
+    available = set(parquet.schema_arrow.names)
+    selected = {name: column for name, column in columns.items() if column in available}
+    if "amount" not in selected:
+        raise ValueError(f"{path} has no '{columns['amount']}' column")
+    for batch in parquet.iter_batches(batch_size=chunk_rows, columns=list(selected.values())):
+        chunk = {}
+        for name, column in selected.items():
+            values = batch.column(column).to_numpy(zero_copy_only=False)
+            if name == "amount":
+                chunk[name] = values.astype(np.float64)
+            elif np.issubdtype(values.dtype, np.datetime64):
+                chunk[name] = np.datetime_as_string(values, unit='D')
+            else:
+                chunk[name] = values.astype(str)
+        yield chunk
+
+
+def iter_sales_chunks(path, columns=None, chunk_rows=100_000, memory_map=False):
+    """Chunks of a CSV or (by extension) Parquet sales export."""
+    if str(path).lower().endswith((".parquet", ".pq")):
+        return iter_parquet_chunks(path, columns, chunk_rows, memory_map)
+    return iter_csv_chunks(path, columns, chunk_rows, memory_map)
+
+
+class _Reservoir:
+    """Fixed-size uniform sample of a stream of values (Algorithm R, applied a chunk at a time)."""
+
+    def __init__(self, size, seed=0):
+        self.values = np.empty(size)
+        self.filled = 0
+        self.seen = 0
+        self._random = np.random.default_rng(seed)
+
+    def add(self, values):
+        take = min(len(self.values) - self.filled, len(values))
+        self.values[self.filled:self.filled + take] = values[:take]
+        self.filled += take
+        self.seen += take
+        rest = values[take:]
+        if not len(rest):
+            return
+        positions = self.seen + np.arange(1, len(rest) + 1)
+        slots = (self._random.random(len(rest)) * positions).astype(np.int64)
+        keep = slots < len(self.values)
+        self.values[slots[keep]] = rest[keep]
+        self.seen += len(rest)
+
+    def sample(self):
+        return self.values[:self.filled]
+
+
+class SalesAggregator:
+    """Streaming aggregates of a sales export, updated one chunk of NumPy arrays at a time.
+
+    Memory depends on the number of distinct reps, regions, periods and
+    cohorts, never on the number of rows: totals are grouped per chunk with
+    np.unique/np.bincount, percentiles and outlier fences come from a
+    fixed-size reservoir sample, and only the `extremes` largest and
+    smallest transactions are kept.
+    """
+
+    def __init__(self, period="month", sample_size=100_000, extremes=5, seed=0):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}', expected one of {', '.join(PERIODS)}")
+        self.period = period
+        self.extremes = extremes
+        self.rows = 0
+        self.skipped_rows = 0
+        self.invalid_dates = 0
+        self.missing_cohorts = 0
+        self.total = 0.0
+        self.sum_squares = 0.0
+        self.groups = {}
+        self.cohorts = {}
+        self._reservoir = _Reservoir(sample_size, seed)
+        self._largest = []
+        self._smallest = []
+
+    def add(self, chunk):
+        amount = chunk["amount"]
+        valid = ~np.isnan(amount)
+        if not valid.all():
+            self.skipped_rows += int((~valid).sum())
+            chunk = {name: values[valid] for name, values in chunk.items()}
+            amount = chunk["amount"]
+        if not len(amount):
+            return
+        self.rows += len(amount)
+        self.total += float(amount.sum())
+        self.sum_squares += float(np.dot(amount, amount))
+        self._reservoir.add(amount)
+
+        keys = {name: chunk[name] for name in ("rep", "region") if name in chunk}
+        for dimension, values in keys.items():
+            self._group(self.groups.setdefault(dimension, {}), values, amount)
+        if "date" in chunk:
+            # Rows without a usable date still count towards the totals, just not towards any period
+            dated = _valid_dates(chunk["date"], self.period)
+            self.invalid_dates += int(len(dated) - dated.sum())
+            if dated.any():
+                periods = _period_keys(chunk["date"][dated], self.period)
+                self._group(self.groups.setdefault("period", {}), periods, amount[dated])
+                if "region" in chunk:
+                    self._group(self.groups.setdefault("region_period", {}),
+                                np.char.add(np.char.add(chunk["region"][dated], _KEY_SEPARATOR), periods),
+                                amount[dated])
+        if "cohort" in chunk and "converted" in chunk:
+            # Like undated rows, rows with a blank cohort are left out of the cohort figures and counted
+            cohorts = np.char.strip(chunk["cohort"])
+            known = cohorts != ""
+            self.missing_cohorts += int(len(known) - known.sum())
+            if known.any():
+                converted = np.isin(np.char.lower(np.char.strip(chunk["converted"][known])), TRUTHY)
+                self._group(self.cohorts, cohorts[known], converted.astype(np.float64))
+        self._keep_extremes(chunk, amount)
+
+    def _group(self, totals, keys, weights):
+        unique, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=weights)
+        counts = np.bincount(inverse)
+        for key, value, count in zip(unique.tolist(), sums.tolist(), counts.tolist()):
+            current = totals.get(key)
+            if current is None:
+                totals[key] = [value, count]
+            else:
+                current[0] += value
+                current[1] += count
+
+    def _keep_extremes(self, chunk, amount):
+        k = min(self.extremes, len(amount))
+        if not k:
+            return
+        labels = [chunk[name] for name in ("date", "rep", "region") if name in chunk]
+        for heap, indices, sign in ((self._largest, np.argpartition(-amount, k - 1)[:k], 1),
+                                    (self._smallest, np.argpartition(amount, k - 1)[:k], -1)):
+            for i in indices.tolist():
+                entry = (sign * float(amount[i]), " / ".join(str(values[i]) for values in labels))
+                if len(heap) < self.extremes:
+                    heapq.heappush(heap, entry)
+                else:
+                    heapq.heappushpop(heap, entry)
+
+    def summary(self):
+        """The aggregates as a SalesSummary."""
+        sample = self._reservoir.sample()
+        percentiles = dict(zip(PERCENTILES, np.percentile(sample, PERCENTILES).tolist())) if len(sample) else {}
+        mean = self.total / self.rows if self.rows else 0.0
+        variance = max(0.0, self.sum_squares / self.rows - mean * mean) if self.rows else 0.0
+        outliers = {}
+        if len(sample):
+            q1, q3 = percentiles[25], percentiles[75]
+            low, high = q1 - 3 * (q3 - q1), q3 + 3 * (q3 - q1)
+            share = float(((sample < low) | (sample > high)).mean())
+            outliers = {"low_fence": low, "high_fence": high, "estimated_rows": round(share * self.rows)}
+        return SalesSummary(
+            rows=self.rows,
+            skipped_rows=self.skipped_rows,
+            invalid_dates=self.invalid_dates,
+            missing_cohorts=self.missing_cohorts,
+            total=self.total,
+            mean=mean,
+            std=variance ** 0.5,
+            percentiles=percentiles,
+            period=self.period,
+            groups={dimension: {key: tuple(value) for key, value in totals.items()}
+                    for dimension, totals in self.groups.items()},
+            cohorts={key: tuple(value) for key, value in self.cohorts.items()},
+            largest=sorted(((amount, label) for amount, label in self._largest), reverse=True),
+            smallest=sorted((-amount, label) for amount, label in self._smallest),
+            outliers=outliers,
+        )
+
+
+class SalesSummary:
+    """Statistical summary of a sales export; to_prompt() renders a bounded-size version for the model."""
+
+    def __init__(self, rows, skipped_rows, total, mean, std, percentiles, period, groups, cohorts, largest,
+                 smallest, outliers, invalid_dates=0, missing_cohorts=0):
+        self.rows = rows
+        self.skipped_rows = skipped_rows
+        # Rows with a valid amount but no usable date, left out of the per-period figures
+        self.invalid_dates = invalid_dates
+        # Rows with a blank cohort, left out of the conversion figures
+        self.missing_cohorts = missing_cohorts
+        self.total = total
+        self.mean = mean
+        self.std = std
+        self.percentiles = percentiles
+        self.period = period
+        self.groups = groups
+        self.cohorts = cohorts
+        self.largest = largest
+        self.smallest = smallest
+        self.outliers = outliers
+
+    def period_totals(self):
+        """[(period, total, growth vs. the previous period or None)] in chronological order."""
+        totals = sorted((key, value[0]) for key, value in self.groups.get("period", {}).items())
+        result = []
+        for i, (period, total) in enumerate(totals):
+            previous = totals[i - 1][1] if i else None
+            result.append((period, total, (total - previous) / previous if previous else None))
+        return result
+
+    def region_growth(self):
+        """{region: growth from the second-to-last to the last period}, for regions present in both."""
+        periods = [period for period, _, _ in self.period_totals()]
+        if len(periods) < 2:
+            return {}
+        last, previous = periods[-1], periods[-2]
+        by_region = {}
+        for key, (total, _) in self.groups.get("region_period", {}).items():
+            region, period = key.split(_KEY_SEPARATOR)
+            by_region.setdefault(region, {})[period] = total
+        return {region: (totals[last] - totals[previous]) / totals[previous]
+                for region, totals in by_region.items() if totals.get(previous) and last in totals}
+
+    def to_dict(self):
+        return {
+            "rows": self.rows, "skipped_rows": self.skipped_rows, "invalid_dates": self.invalid_dates,
+            "missing_cohorts": self.missing_cohorts, "total": self.total, "mean": self.mean, "std": self.std, "percentiles": self.percentiles,
+            "period": self.period, "period_totals": self.period_totals(), "region_growth": self.region_growth(),
+            "groups": {dimension: dict(totals) for dimension, totals in self.groups.items()
+                       if dimension != "region_period"},
+            "cohort_conversion": {key: converted / count for key, (converted, count) in self.cohorts.items()},
+            "largest": self.largest, "smallest": self.smallest, "outliers": self.outliers,
+        }
+
+    def to_prompt(self, max_groups=10, max_periods=12):
+        """Compact text for the model: at most `max_groups` entries per dimension and the last `max_periods` periods."""
+        lines = [f"Transactions: {self.rows:,} ({self.skipped_rows:,} rows without a valid amount skipped)",
+                 f"Revenue: total {self.total:,.2f}, mean {self.mean:,.2f}, std {self.std:,.2f}"]
+        if self.percentiles:
+            lines.append("Deal size percentiles: " + ", ".join(f"p{p} {value:,.2f}"
+                                                               for p, value in self.percentiles.items()))
+        periods = self.period_totals()[-max_periods:]
+        if periods:
+            lines.append(f"Revenue per {self.period} (growth vs. previous):")
+            lines.extend(f"  {period}: {total:,.2f}" + (f" ({growth:+.1%})" if growth is not None else "")
+                         for period, total, growth in periods)
+        if self.invalid_dates:
+            lines.append(f"  ({self.invalid_dates:,} deals without a valid date are not in any {self.period})")
+        for dimension, label in (("region", "Regions"), ("rep", "Reps")):
+            totals = self.groups.get(dimension)
+            if totals:
+                ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+                lines.append(f"{label} by revenue (top {min(max_groups, len(ranked))} of {len(ranked)}):")
+                lines.extend(f"  {key}: {total:,.2f} ({f'{total / self.total:.1%}' if self.total else 'n/a'} of "
+                             f"revenue, {count:,} deals)" for key, (total, count) in ranked[:max_groups])
+        growth = sorted(self.region_growth().items(), key=lambda item: item[1])
+        if growth:
+            shown = growth[:max_groups // 2] + growth[-(max_groups - max_groups // 2):] \
+                if len(growth) > max_groups else growth
+            lines.append("Region growth in the last period: " + ", ".join(f"{region} {rate:+.1%}"
+                                                                          for region, rate in shown))
+        if self.cohorts:
+            ranked = sorted(self.cohorts.items())[-max_groups:]
+            lines.append("Conversion by cohort: " + ", ".join(f"{cohort} {converted / count:.1%} of {count:,}"
+                                                              for cohort, (converted, count) in ranked))
+            if self.missing_cohorts:
+                lines.append(f"  ({self.missing_cohorts:,} deals without a cohort are not in any cohort)")
+        if self.outliers:
+            lines.append(f"Outliers: about {self.outliers['estimated_rows']:,} deals outside "
+                         f"[{self.outliers['low_fence']:,.2f}, {self.outliers['high_fence']:,.2f}]")
+        if self.largest:
+            lines.append("Largest deals: " + "; ".join(f"{amount:,.2f} ({label})" if label else f"{amount:,.2f}"
+                                                       for amount, label in self.largest))
+        if self.smallest:
+            lines.append("Smallest deals: " + "; ".join(f"{amount:,.2f} ({label})" if label else f"{amount:,.2f}"
+                                                        for amount, label in self.smallest))
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.to_prompt()
+
+
+def summarize_sales(path, columns=None, period="month", chunk_rows=100_000, memory_map=False, sample_size=100_000):
+    """Stream a CSV or Parquet sales export through a SalesAggregator and return its SalesSummary."""
+    aggregator = SalesAggregator(period=period, sample_size=sample_size)
+    for chunk in iter_sales_chunks(path, columns, chunk_rows, memory_map):
+        aggregator.add(chunk)
+    return aggregator.summary()
@@ -0,0 +1,301 @@
+import os
+import re
+import csv
+import json
+import hashlib
+import logging
+from batch_calls import afan_out, fan_out, parse_json_object
+from openrouter_errors import OpenRouterError, OperationCancelled
+from prompt_templates import PromptTemplate
+
+LABELS = ("positive", "neutral", "negative")
+
+BULK_SENTIMENT_TEMPLATE = PromptTemplate("bulk_sentiment", """
+The user message holds a JSON object that maps item keys to short texts such as product reviews or social media
+posts. Classify the sentiment of each text as positive, neutral or negative, and score it from -1 (most negative)
+to 1 (most positive). Reply with a single JSON object that maps each key, exactly as given, to an object of the
+form {"label": "positive", "score": 0.8}. Reply with the JSON object only.
+""")
+
+POSITIVE_WORDS = frozenset("""
+amazing awesome beautiful best brilliant excellent exceptional fantastic fast favorite favourite flawless glad
+good great happy impressed impressive love loved lovely outstanding perfect pleased recommend recommended reliable
+satisfied smooth superb wonderful worth
+""".split())
+NEGATIVE_WORDS = frozenset("""
+angry annoying awful bad broken buggy cheap complaint defective disappointed disappointing frustrating garbage
+hate hated horrible poor refund return returned rude scam slow terrible unacceptable unhappy useless waste worse
+worst
+""".split())
+NEGATORS = frozenset("not no never nothing hardly barely isn't wasn't don't doesn't didn't can't won't".split())
+CONTRAST_WORDS = frozenset("but however although though yet except".split())
+
+_WORD = re.compile(r"[a-z']+")
+_NON_WORD = re.compile(r"[^\w\s]")
+
+
+def text_hash(text):
+    """Hash of a text after lowercasing and dropping punctuation and extra whitespace."""
+    return hashlib.sha1(" ".join(_NON_WORD.sub(" ", text.lower()).split()).encode("utf-8")).hexdigest()
+
+
+class LexiconScorer:
+    """Fast local sentiment for the obvious cases; anything it is unsure of is left to the model.
+
+    A text is scored only when it has at least `min_hits` lexicon words of
+    one polarity, none of the other, no negation and no contrast ("but",
+    "however"); score() returns None for everything else.
+    """
+
+    def __init__(self, positive=POSITIVE_WORDS, negative=NEGATIVE_WORDS, min_hits=2):
+        self.positive = positive
+        self.negative = negative
+        self.min_hits = min_hits
+
+    def score(self, text):
+        """(label, score) for an unambiguous text, otherwise None."""
+        words = _WORD.findall(text.lower())
+        if any(word in NEGATORS or word in CONTRAST_WORDS for word in words):
+            return None
+        positive = sum(word in self.positive for word in words)
+        negative = sum(word in self.negative for word in words)
+        if positive and negative:
+            return None
+        hits = positive or negative
+        if hits < self.min_hits:
+            return None
+        strength = min(1.0, 0.25 * (hits + 1))
+        return ("positive", strength) if positive else ("negative", -strength)
+
+
+def iter_texts(path, text_field="text", id_field="id", on_error=None):
+    """Stream (id, text) pairs from a .jsonl/.ndjson, .csv or plain text file (one text per line).
+
+    Records without an id are numbered by their position in the file. A
+    malformed JSON line (invalid JSON, or not an object) is skipped:
+    `on_error("<file name>:<line>", error)` is called for it if given,
+    otherwise it is logged.
+    """
+    lower = str(path).lower()
+    name = os.path.basename(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        if lower.endswith((".jsonl", ".ndjson")):
+            # JSON lines are parsed one at a time below, so a bad line only loses itself
+            records = ((number, line) for number, line in enumerate(f, 1) if line.strip())
+        elif lower.endswith(".csv"):
+            reader = csv.DictReader(f)
+            records = ((reader.line_num, record) for record in reader)
+        else:
+            records = ((number, {text_field: line.rstrip("\r\n")}) for number, line in enumerate(f, 1) if line.strip())
+        for i, (line_number, record) in enumerate(records):
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                if not isinstance(record, dict):
+                    raise ValueError(f"Expected a JSON object, got {type(record).__name__}")
+            except ValueError as e:
+                if on_error is None:
+                    logging.warning(f"Skipping invalid record {name}:{line_number}: {e}")
+                else:
+                    on_error(f"{name}:{line_number}", e)
+                continue
+            text = record.get(text_field)
+            if text:
+                yield record.get(id_field, i), text
+
+
+class SentimentStats:
+    """Running sentiment distribution over every scored text, duplicates included."""
+
+    BINS = 10
+
+    def __init__(self):
+        self.total = 0
+        self.unique = 0
+        self.labels = dict.fromkeys(LABELS, 0)
+        self.sources = {}
+        self.score_sum = 0.0
+        self.histogram = [0] * self.BINS
+
+    def add(self, result, duplicate):
+        self.total += 1
+        self.unique += not duplicate
+        self.sources[result["source"]] = self.sources.get(result["source"], 0) + 1
+        if result["label"] is None:
+            return
+        self.labels[result["label"]] += 1
+        self.score_sum += result["score"]
+        self.histogram[min(self.BINS - 1, int((result["score"] + 1) / 2 * self.BINS))] += 1
+
+    @property
+    def scored(self):
+        return sum(self.labels.values())
+
+    def distribution(self):
+        """{label: share of the scored texts}."""
+        return {label: count / self.scored if self.scored else 0.0 for label, count in self.labels.items()}
+
+    def mean_score(self):
+        return self.score_sum / self.scored if self.scored else 0.0
+
+    def to_dict(self):
+        return {"total": self.total, "unique": self.unique, "labels": dict(self.labels),
+                "distribution": self.distribution(), "mean_score": self.mean_score(),
+                "sources": dict(self.sources), "histogram": list(self.histogram)}
+
+    def to_prompt(self):
+        """A few lines describing the distribution, for the target-audience analysis."""
+        shares = ", ".join(f"{label} {share:.1%}" for label, share in self.distribution().items())
+        width = 2 / self.BINS
+        histogram = ", ".join(f"[{-1 + i * width:+.1f}, {-1 + (i + 1) * width:+.1f}): {count:,}"
+                              for i, count in enumerate(self.histogram))
+        return (f"Customer sentiment over {self.total:,} texts ({self.unique:,} unique): {shares}; "
+                f"mean score {self.mean_score():+.2f} on a -1 to 1 scale.\nScore histogram: {histogram}")
+
+    def __str__(self):
+        return self.to_prompt()
+
+
+def parse_labels(text, keys):
+    """{key: (label, score)} for the well-formed entries of a bulk sentiment answer."""
+    answers = parse_json_object(text)
+    results = {}
+    for key in keys:
+        answer = answers.get(key)
+        if not isinstance(answer, dict) or str(answer.get("label", "")).lower() not in LABELS:
+            continue
+        try:
+            score = max(-1.0, min(1.0, float(answer.get("score", 0.0))))
+        except (TypeError, ValueError):
+            continue
+        results[key] = (answer["label"].lower(), score)
+    return results
+
+
+class SentimentPipeline:
+    """Bulk sentiment scoring of a stream of texts through an agent's API calls.
+
+    Texts are deduplicated by text_hash, obvious ones are scored by the
+    lexicon, and the rest are sent `batch_size` per structured-JSON request,
+    with at most `concurrency` requests in flight. Results are written to
+    `output` (a text file object, one JSON record per input text, in input
+    order) as each round of requests finishes.
+    """
+
+    def __init__(self, agent, lexicon=None, batch_size=40, concurrency=4, max_text_chars=1000, language='english'):
+        self.agent = agent
+        self.lexicon = lexicon
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_text_chars = max_text_chars
+        self.language = language
+        # text_hash -> result; grows with the number of unique texts only
+        self._results = {}
+
+    def run(self, texts, output=None):
+        """Score every (id, text) in `texts` and return the SentimentStats."""
+        stats = SentimentStats()
+        for pending, records in self._rounds(texts):
+            batches = self._batches(pending)
+            for results in fan_out(lambda i: self._score_batch(batches[i]), range(len(batches)),
+                                   self.concurrency).values():
+                self._results.update(results)
+            self._write(records, output, stats)
+        return stats
+
+    async def arun(self, texts, output=None):
+        """Async version of run."""
+        stats = SentimentStats()
+        for pending, records in self._rounds(texts):
+            batches = self._batches(pending)
+
+            async def _score(i):
+                return await self._ascore_batch(batches[i])
+
+            for results in (await afan_out(_score, range(len(batches)), self.concurrency)).values():
+                self._results.update(results)
+            self._write(records, output, stats)
+        return stats
+
+    def _rounds(self, texts):
+        """Yield ({hash: text} for the model, [(id, hash, duplicate)]) once a round of requests is full.
+
+        Records already settled by the lexicon or an earlier duplicate are
+        held back only until the round they are waiting on finishes, so
+        the output keeps the input order.
+        """
+        round_size = self.batch_size * max(1, self.concurrency)
+        pending, records = {}, []
+        for record_id, text in texts:
+            key = text_hash(text)
+            duplicate = key in self._results or key in pending
+            if not duplicate:
+                scored = self.lexicon.score(text) if self.lexicon else None
+                if scored:
+                    self._results[key] = {"label": scored[0], "score": scored[1], "source": "lexicon"}
+                else:
+                    pending[key] = text[:self.max_text_chars]
+            records.append((record_id, key, duplicate))
+            if len(pending) >= round_size or len(records) >= 8 * round_size:
+                yield pending, records
+                pending, records = {}, []
+        if records:
+            yield pending, records
+
+    def _batches(self, pending):
+        items = list(pending.items())
+        return [dict(items[i:i + self.batch_size]) for i in range(0, len(items), self.batch_size)]
+
+    def _batch_prompt(self, batch):
+        return json.dumps({str(i): text for i, text in enumerate(batch.values())}, ensure_ascii=False, indent=2)
+
+    def _score_batch(self, batch):
+        try:
+            answer = self.agent.call_openrouter_api(self._batch_prompt(batch), self.language,
+                                                    BULK_SENTIMENT_TEMPLATE)
+        except OperationCancelled:
+            raise
+        except OpenRouterError as e:
+            logging.warning(f"Sentiment batch of {len(batch)} texts failed: {e}")
+            return self._settle(batch, {}, failed=True)
+        results = self._settle(batch, parse_labels(answer, map(str, range(len(batch)))))
+        missing = {key: batch[key] for key, result in results.items() if result["label"] is None}
+        if missing and len(missing) < len(batch):
+            results.update(self._score_batch(missing))
+        return results
+
+    async def _ascore_batch(self, batch):
+        try:
+            answer = await self.agent.acall_openrouter_api(self._batch_prompt(batch), self.language,
+                                                           BULK_SENTIMENT_TEMPLATE)
+        except OperationCancelled:
+            raise
+        except OpenRouterError as e:
+            logging.warning(f"Sentiment batch of {len(batch)} texts failed: {e}")
+            return self._settle(batch, {}, failed=True)
+        results = self._settle(batch, parse_labels(answer, map(str, range(len(batch)))))
+        missing = {key: batch[key] for key, result in results.items() if result["label"] is None}
+        if missing and len(missing) < len(batch):
+            results.update(await self._ascore_batch(missing))
+        return results
+
+    def _settle(self, batch, labels, failed=False):
+        """Results for a batch; items without a label are marked "failed" or "unparsed"."""
+        results = {}
+        for i, key in enumerate(batch):
+            if str(i) in labels:
+                label, score = labels[str(i)]
+                results[key] = {"label": label, "score": score, "source": "model"}
+            else:
+                results[key] = {"label": None, "score": None, "source": "failed" if failed else "unparsed"}
+        return results
+
+    def _write(self, records, output, stats):
+        for record_id, key, duplicate in records:
+            result = self._results[key]
+            stats.add(result, duplicate)
+            if output is not None:
+                output.write(json.dumps({"id": record_id, **result, "duplicate": duplicate},
+                                        ensure_ascii=False) + "\n")
+        if output is not None:
+            output.flush()
@@ -0,0 +1,238 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from stream_observers import StreamObserver
+from cancellation import CancellationToken, cancel_scope, current_token
+from profiling import current_session, follow_thread
+
+_DONE = object()
+
+
+class _FlightRecorder(StreamObserver):
+    """Observer handed to the upstream stream; publishes every event to the flight."""
+
+    def __init__(self, publish):
+        super().__init__()
+        self._publish = publish
+
+    def on_start(self):
+        self._publish("on_start", ())
+
+    def on_bytes(self, count):
+        self._publish("on_bytes", (count,))
+
+    def on_chunk(self, chunk_data):
+        self._publish("on_chunk", (chunk_data,))
+
+    def on_token(self, text):
+        self._publish("on_token", (text,))
+
+    def on_complete(self, text):
+        self._publish("on_complete", (text,))
+
+    def on_error(self, error):
+        self._publish("on_error", (error,))
+
+
+class _Flight:
+    """One upstream request and the stream events it has produced so far."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.value = None
+        self.error = None
+        self.cond = threading.Condition()
+        self.subscribers = 0
+        # Cancels the upstream request once every subscriber has left
+        self.token = CancellationToken()
+
+    def publish(self, method, args):
+        with self.cond:
+            self.events.append((method, args))
+            self.cond.notify_all()
+
+    def finish(self, value=None, error=None):
+        with self.cond:
+            self.value, self.error, self.done = value, error, True
+            self.cond.notify_all()
+
+    def _wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def follow(self, observer, token=None):
+        """Replay the events seen so far to `observer`, then the rest as they arrive.
+
+        Raises the token's error as soon as `token` is cancelled.
+        """
+        unregister = token.on_cancel(self._wake) if token is not None else None
+        try:
+            index = 0
+            while True:
+                with self.cond:
+                    while index == len(self.events) and not self.done:
+                        if token is not None:
+                            token.check()
+                        self.cond.wait()
+                    batch = self.events[index:]
+                    index += len(batch)
+                    finished = self.done and index == len(self.events)
+                for method, args in batch:
+                    getattr(observer, method)(*args)
+                if finished:
+                    break
+        finally:
+            if unregister is not None:
+                unregister()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """Coalesces identical concurrent requests made from threads into one upstream call.
+
+    The first caller for a key starts `fetch(observer)` on a small pool of
+    upstream threads; every caller with the same key while it is in flight,
+    the first included, subscribes to it. Subscribers get the full event
+    sequence (replayed up to where the stream is, then live) on their own
+    observer and in their own thread, so a subscriber that fails or leaves
+    early does not affect the stream the others are reading; once every
+    subscriber has left, the upstream request is cancelled.
+    """
+
+    def __init__(self, max_workers=32):
+        self.max_workers = max_workers
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self.flights = 0
+        self.coalesced = 0
+
+    def _fly(self, key, flight, fetch, session):
+        try:
+            # Sampled as part of the plan of the caller that started the request
+            with follow_thread(session), cancel_scope(flight.token):
+                value, error = fetch(_FlightRecorder(flight.publish)), None
+        except BaseException as e:
+            value, error = None, e
+        with self._lock:
+            # Later callers start a fresh request (or hit the response cache)
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(value, error)
+
+    def run(self, key, fetch, observer):
+        """Return (fetch's result, whether this caller started the upstream request)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix="single-flight")
+                self.flights += 1
+                self._executor.submit(self._fly, key, flight, fetch, current_session())
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+        try:
+            return flight.follow(observer, current_token()), leader
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+                abandoned = not flight.done and not flight.subscribers
+                if abandoned and self._flights.get(key) is flight:
+                    del self._flights[key]
+            if abandoned:
+                flight.token.cancel("no subscribers left")
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+class _AsyncFlight:
+    def __init__(self):
+        self.events = []
+        self.queues = []
+        self.done = False
+        self.value = None
+        self.error = None
+        self.task = None
+
+    def publish(self, method, args):
+        self.events.append((method, args))
+        for queue in self.queues:
+            queue.put_nowait((method, args))
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        for event in self.events:
+            queue.put_nowait(event)
+        if self.done:
+            queue.put_nowait(_DONE)
+        self.queues.append(queue)
+        return queue
+
+    def finish(self, value=None, error=None):
+        self.value, self.error, self.done = value, error, True
+        for queue in self.queues:
+            queue.put_nowait(_DONE)
+
+
+class AsyncSingleFlight:
+    """asyncio version of SingleFlight.
+
+    The upstream request runs in its own task, so cancelling a subscriber
+    only unsubscribes it; the request is cancelled once no subscriber is
+    left.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.flights = 0
+        self.coalesced = 0
+
+    async def _fly(self, key, flight, fetch):
+        try:
+            # Shared by every subscriber, so the leader's deadline must not apply to it
+            with cancel_scope(None):
+                value, error = await fetch(_FlightRecorder(flight.publish)), None
+        except BaseException as e:
+            value, error = None, e
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        flight.finish(value, error)
+
+    async def run(self, key, fetch, observer):
+        """Return (fetch's result, whether this caller started the upstream request)."""
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = self._flights[key] = _AsyncFlight()
+            self.flights += 1
+            flight.task = asyncio.ensure_future(self._fly(key, flight, fetch))
+        else:
+            self.coalesced += 1
+        queue = flight.subscribe()
+        try:
+            while True:
+                event = await queue.get()
+                if event is _DONE:
+                    break
+                method, args = event
+                getattr(observer, method)(*args)
+        finally:
+            flight.queues.remove(queue)
+            if not flight.done and not flight.queues:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value, leader
@@ -0,0 +1,126 @@
+import json
+import time
+import logging
+from openrouter_errors import ServerError
+from stream_observers import NullObserver
+
+# raw_decode skips the per-call wrapper and trailing-whitespace regex of json.loads
+_raw_decode = json.JSONDecoder().raw_decode
+
+class ChatStreamParser:
+    """Turns an OpenAI-style chat completion SSE stream into content deltas.
+
+    Both OpenRouter clients feed it every line of the response body, the
+    sync one through `iter_deltas`. Comment lines (OpenRouter keep-alives
+    such as ": OPENROUTER PROCESSING") and fields other than `data:` are
+    skipped without decoding; multi-line
+    `data:` fields are joined with newlines as the SSE spec requires, and
+    events after the `[DONE]` sentinel are ignored. Deltas are collected in
+    a list and joined once in `text` instead of growing a string per delta.
+    Every line, parsed chunk and delta is reported to `observer`; an error
+    event raises ServerError.
+    """
+
+    def __init__(self, observer=None):
+        self.observer = observer or NullObserver()
+        # Skip the per-line observer calls entirely when nobody is listening
+        self._notify = type(self.observer) is not NullObserver
+        self.response_id = None
+        self.usage = None
+        self.finish_reason = None
+        self.done = False
+        self.first_token_at = None
+        # Data lines of the current event; a plain bytes value in the common single-line case
+        self._pending = None
+        self._parts = []
+
+    def feed_line(self, line):
+        """Consume one line (without its newline) and return the content delta it completed, if any."""
+        if line:
+            if self._notify:
+                self.observer.on_bytes(len(line))
+            if line[:5] == b"data:":
+                data = line[6:] if line[5:6] == b" " else line[5:]
+                if self._pending is None:
+                    self._pending = data
+                elif isinstance(self._pending, list):
+                    self._pending.append(data)
+                else:
+                    self._pending = [self._pending, data]
+            return None
+        return self._dispatch() if self._pending is not None else None
+
+    def close(self):
+        """Handle any trailing event that was not followed by a blank line."""
+        return self._dispatch() if self._pending is not None else None
+
+    def _dispatch(self):
+        data, self._pending = self._pending, None
+        if self.done:
+            # The clients read past [DONE] so the connection can be reused
+            return None
+        if isinstance(data, list):
+            data = b"\n".join(data)
+        if data == b"[DONE]":
+            self.done = True
+            return None
+        try:
+            # json.loads on bytes re-detects the encoding every call; decoding first is faster
+            chunk_data = _raw_decode(data.decode('utf-8').strip())[0]
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON decode error: {e}")
+            logging.error(f"Problematic chunk: {data!r}")
+            return None
+        if self._notify:
+            self.observer.on_chunk(chunk_data)
+        if 'error' in chunk_data:
+            raise ServerError(f"Error: stream error event {chunk_data['error']}")
+        if self.response_id is None:
+            self.response_id = chunk_data.get('id')
+        if chunk_data.get('usage'):
+            self.usage = chunk_data['usage']
+        choices = chunk_data.get('choices')
+        if not choices:
+            return None
+        choice = choices[0]
+        if choice.get('finish_reason') is not None:
+            self.finish_reason = choice['finish_reason']
+        delta = choice.get('delta')
+        content = delta.get('content') if delta else None
+        if not content:
+            return None
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self._parts.append(content)
+        if self._notify:
+            self.observer.on_token(content)
+        return content
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def finish(self):
+        """Flush the parser, report completion and return the full response text."""
+        self.close()
+        logging.debug("Response %s finished, usage: %s", self.response_id, self.usage)
+        text = self.text
+        self.observer.on_complete(text)
+        return text
+
+
+def iter_deltas(lines, parser=None):
+    """Yield content deltas from an iterable of SSE lines as soon as each one is complete.
+
+    Reads every line, including any after the `[DONE]` sentinel, so a pooled
+    connection is drained before it is reused. Pass a ChatStreamParser to read
+    the response id, usage and full text once the generator is exhausted.
+    """
+    parser = parser or ChatStreamParser()
+    for line in lines:
+        delta = parser.feed_line(line)
+        if delta:
+            yield delta
+    delta = parser.close()
+    if delta:
+        yield delta
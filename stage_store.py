@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from base_ai_agent import NO_RESPONSE
+
+# Brief fields each pipeline stage reads; a stage's stored output is reused
+# as long as these and the outputs of its dependencies are unchanged.
+STAGE_PARAMS = {
+    "marketing": ("product", "language", "input"),
+    "sales": ("language",),
+    "strategy": ("product", "language"),
+    "analytics": ("product", "language"),
+    "final_marketing": ("product", "language"),
+    "synthesis": ("product", "language", "target_audience", "marketing_goals", "budget"),
+}
+
+
+def stage_params(product, additional_info, config=None, router=None):
+    """Everything a stage may read from a brief, plus team settings that shape every stage's output.
+
+    With the team's ModelRouter, its routes and tiers are part of the
+    settings, so changing which model serves a stage recomputes it.
+    """
+    config = dict(config or {})
+    if router is not None:
+        config["routing"] = router.config()
+    params = {"product": product, "config": config}
+    params.update({name: value for name, value in additional_info.items()})
+    params.setdefault("language", 'english')
+    return params
+
+
+def stage_key(name, fields, params, inputs):
+    """Content address of one stage run: its name, the brief `fields` it reads and its dependency outputs."""
+    declared = ("config",) + tuple(fields)
+    payload = json.dumps({"stage": name, "params": {field: params.get(field) for field in declared},
+                          "inputs": {dep: str(output) for dep, output in inputs.items()}},
+                         sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class StageStore:
+    """Stage outputs keyed by stage_key: a bounded in-memory LRU plus an optional SQLite file.
+
+    Every finished stage is written straight away, so running a brief again
+    after a crash or an edit picks up every stage whose inputs did not change
+    and recomputes only the rest. Outputs older than `ttl` seconds are not
+    reused, and an output holding the placeholder of a failed call is never
+    stored.
+    """
+
+    def __init__(self, db_path=None, max_entries=1024, ttl=None):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (output, created)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS stages (key TEXT PRIMARY KEY, stage TEXT NOT NULL, "
+                             "output TEXT NOT NULL, created REAL NOT NULL)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build the store described by OPENROUTER_STAGE_* variables, or None when OPENROUTER_STAGE_STORE=off."""
+        if os.environ.get("OPENROUTER_STAGE_STORE", "on").lower() in ("off", "0", "false", "no"):
+            return None
+        ttl = float(os.environ.get("OPENROUTER_STAGE_TTL", 24 * 3600))
+        return cls(db_path=os.environ.get("OPENROUTER_STAGE_DB") or None,
+                   max_entries=int(os.environ.get("OPENROUTER_STAGE_STORE_SIZE", 1024)),
+                   ttl=ttl if ttl > 0 else None)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, key):
+        """Return the stored output for `key`, or None."""
+        with self._lock:
+            if key in self._memory:
+                output, created = self._memory[key]
+                if not self._expired(created):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return output
+                del self._memory[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT output, created FROM stages WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, stage, output):
+        """Store `output` under `key`, unless it holds the placeholder of a call that returned nothing."""
+        output = str(output)
+        if NO_RESPONSE in output:
+            return
+        created = time.time()
+        with self._lock:
+            self._remember(key, output, created)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO stages (key, stage, output, created) VALUES (?, ?, ?, ?)",
+                                 (key, stage, output, created))
+                self._db.commit()
+
+    def _remember(self, key, output, created):
+        self._memory[key] = (output, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM stages")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,159 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from tqdm import tqdm
+
+
+class StreamObserver:
+    """Receives events from a streaming completion as they arrive.
+
+    Every hook is a no-op, so the base class doubles as the null observer for
+    batch and server callers that do not want progress output.
+    """
+
+    def __init__(self, label=""):
+        self.label = label
+
+    def on_start(self):
+        pass
+
+    def on_bytes(self, count):
+        pass
+
+    def on_chunk(self, chunk_data):
+        pass
+
+    def on_token(self, text):
+        pass
+
+    def on_complete(self, text):
+        pass
+
+    def on_error(self, error):
+        pass
+
+
+NullObserver = StreamObserver
+
+
+class MetricsObserver(StreamObserver):
+    """Records time-to-first-token, throughput and byte/chunk counts for one stream.
+
+    Each content delta counts as one token, which matches how OpenRouter
+    streams completions closely enough for progress reporting.
+    """
+
+    def __init__(self, label=""):
+        super().__init__(label)
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.bytes_received = 0
+        self.chunks = 0
+        self.tokens = 0
+        self.error = None
+
+    def on_start(self):
+        self.started_at = time.perf_counter()
+
+    def on_bytes(self, count):
+        self.bytes_received += count
+
+    def on_chunk(self, chunk_data):
+        self.chunks += 1
+
+    def on_token(self, text):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.tokens += 1
+
+    def on_complete(self, text):
+        self.finished_at = time.perf_counter()
+
+    def on_error(self, error):
+        self.finished_at = time.perf_counter()
+        self.error = error
+
+    @property
+    def time_to_first_token(self):
+        if self.started_at is None or self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token_at is None:
+            return 0.0
+        streaming = (self.finished_at or time.perf_counter()) - self.first_token_at
+        return self.tokens / streaming if streaming > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "label": self.label,
+            "time_to_first_token": self.time_to_first_token,
+            "elapsed": self.elapsed,
+            "tokens": self.tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "chunks": self.chunks,
+            "bytes": self.bytes_received,
+        }
+
+
+class ConsoleProgressObserver(MetricsObserver):
+    """Live CLI progress: a tqdm counter of streamed tokens with tokens/sec and TTFT."""
+
+    def __init__(self, label=""):
+        super().__init__(label)
+        self._bar = None
+
+    def on_start(self):
+        super().on_start()
+        self._bar = tqdm(desc=f"{self.label} thinking", unit="tok", colour="green", leave=False)
+        self._bar.set_postfix_str("waiting for first token")
+
+    def on_token(self, text):
+        first = self.first_token_at is None
+        super().on_token(text)
+        if self._bar is not None:
+            self._bar.update(1)
+            if first:
+                self._bar.set_postfix_str(f"TTFT {self.time_to_first_token:.2f}s")
+
+    def on_complete(self, text):
+        super().on_complete(text)
+        self._close(f"{self.label}: {self.tokens} tokens, TTFT {self.time_to_first_token or 0:.2f}s, "
+                    f"{self.tokens_per_second:.1f} tok/s")
+
+    def on_error(self, error):
+        super().on_error(error)
+        self._close(f"{self.label}: failed after {self.elapsed:.2f}s")
+
+    def _close(self, summary):
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+            tqdm.write(summary)
+
+
+_current_observer = contextvars.ContextVar("stream_observer", default=None)
+
+
+def current_observer():
+    """Return the observer installed for the current thread or task, or a null observer."""
+    return _current_observer.get() or NullObserver()
+
+
+@contextmanager
+def observe(observer):
+    """Route stream events of every API call made inside the block to `observer`."""
+    token = _current_observer.set(observer)
+    try:
+        yield observer
+    finally:
+        _current_observer.reset(token)
@@ -0,0 +1,83 @@
+import io
+import asyncio
+import time
+import unittest
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient
+from async_marketing_team import AsyncMarketingTeam
+from pipeline import Stage, run_stage_graph, topological_order
+from docx import Document
+
+class TestStageGraph(unittest.TestCase):
+    def test_independent_stages_run_concurrently(self):
+        def sleeper(name):
+            async def run(inputs):
+                await asyncio.sleep(0.2)
+                return name + "".join(inputs.values())
+            return run
+
+        stages = [
+            Stage("a", "A", sleeper("a")),
+            Stage("b", "B", sleeper("b"), deps=("a",)),
+            Stage("c", "C", sleeper("c"), deps=("a",)),
+            Stage("d", "D", sleeper("d"), deps=("b", "c")),
+        ]
+        start = time.perf_counter()
+        results = asyncio.run(run_stage_graph(stages))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(results["d"], "dbaca")
+        self.assertLess(elapsed, 0.75)
+
+    def test_cycles_and_unknown_deps_are_rejected(self):
+        async def noop(inputs):
+            return ""
+        with self.assertRaises(ValueError):
+            topological_order([Stage("a", "A", noop, deps=("b",)), Stage("b", "B", noop, deps=("a",))])
+        with self.assertRaises(ValueError):
+            topological_order([Stage("a", "A", noop, deps=("missing",))])
+
+class TestAsyncMarketingTeam(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Agent output", first_token_delay=0.1).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def run_team(self, fan_out):
+        async def _run():
+            client = AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url)
+            async with AsyncMarketingTeam(client=client, fan_out=fan_out, write_document=False, verbose=False) as team:
+                start = time.perf_counter()
+                content = await team.discuss_marketing_plan("Test Product", {'language': 'english'})
+                return content, time.perf_counter() - start
+        return asyncio.run(_run())
+
+    def test_sequential_graph_produces_all_sections(self):
+        content, _ = self.run_team(fan_out=False)
+        self.assertEqual([section['title'] for section in content], [
+            "Initial Marketing Campaign Idea", "Sales Agent Feedback", "Market Trends Analysis",
+            "Target Audience Analysis", "Final Marketing Campaign Idea", "Final Marketing Plan"])
+        self.assertTrue(all(section['content'] == "Agent output" for section in content))
+        self.assertEqual(len(self.server.requests), 6)
+
+    def test_fan_out_is_faster_than_sequential_graph(self):
+        _, sequential = self.run_team(fan_out=False)
+        content, fan_out = self.run_team(fan_out=True)
+        self.assertEqual(len(content), 6)
+        self.assertLess(fan_out, sequential - 0.1)
+
+    def test_document_sections_keep_stage_order(self):
+        async def _run():
+            client = AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url)
+            async with AsyncMarketingTeam(client=client, fan_out=True, verbose=False) as team:
+                await team.discuss_marketing_plan("Test Product", {'language': 'english'}, output_path=stream)
+        stream = io.BytesIO()
+        asyncio.run(_run())
+        headings = [p.text for p in Document(io.BytesIO(stream.getvalue())).paragraphs if p.style.name == "CustomHeading"]
+        self.assertEqual(headings, [
+            "Initial Marketing Campaign Idea", "Sales Agent Feedback", "Market Trends Analysis",
+            "Target Audience Analysis", "Final Marketing Campaign Idea", "Final Marketing Plan"])
+
+if __name__ == '__main__':
+    unittest.main()
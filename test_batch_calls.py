@@ -0,0 +1,51 @@
+import json
+import asyncio
+import unittest
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient
+from sales_ai_agent import SalesAIAgent
+from marketing_ai_agent import MarketingAIAgent
+from batch_calls import unpack_response
+
+class TestBatchCalls(unittest.TestCase):
+    def agent(self, server, cls=SalesAIAgent):
+        client = OpenRouterClient(api_key="test-key", base_url=server.url)
+        self.addCleanup(client.close)
+        return cls(client=client, async_client=AsyncOpenRouterClient(api_key="test-key", base_url=server.url))
+
+    def test_fan_out_keeps_item_order(self):
+        with FakeOpenRouterServer(response_text="Strategy", chunk_delay=0.01) as server:
+            agent = self.agent(server)
+            results = agent.handle_objections(concurrency=3)
+            async_results = asyncio.run(agent.ahandle_objections(["Price", "Time"], concurrency=2))
+        self.assertEqual(list(results), agent.objection_types)
+        self.assertEqual(set(results.values()), {"Strategy"})
+        self.assertEqual(list(async_results), ["Price", "Time"])
+        self.assertEqual(len(server.requests), 7)
+
+    def test_packed_request_is_split_per_item(self):
+        answer = json.dumps({"pitch": "Buy it", **{f"objection: {t}": f"Handle {t}" for t in ["Price", "Time"]}})
+        with FakeOpenRouterServer(response_text=f"```json\n{answer}\n```") as server:
+            kit = self.agent(server).build_sales_enablement_kit("Widget", objection_types=["Price", "Time"])
+        self.assertEqual(kit, {"pitch": "Buy it", "objections": {"Price": "Handle Price", "Time": "Handle Time"}})
+        self.assertEqual(len(server.requests), 1)
+        system = server.requests[0]['messages'][0]['content'][0]
+        self.assertIn("cache_control", system)
+        self.assertIn("JSON object", system['text'])
+
+    def test_items_missing_from_packed_answer_are_requested_individually(self):
+        responses = [json.dumps({"Acme": "Strong brand"}), "Cheap prices"]
+        with FakeOpenRouterServer(responses=responses) as server:
+            results = self.agent(server, MarketingAIAgent).analyze_each_competitor(["Acme", "Globex"], mode='packed')
+        self.assertEqual(results, {"Acme": "Strong brand", "Globex": "Cheap prices"})
+        self.assertEqual(len(server.requests), 2)
+
+    def test_unpack_tolerates_prose_and_bad_json(self):
+        self.assertEqual(unpack_response('Here you go: {"a": "x", "b": ["y"]} Done.', ["a", "b", "c"]),
+                         {"a": "x", "b": '[\n  "y"\n]'})
+        self.assertEqual(unpack_response("not json", ["a"]), {})
+        with self.assertRaises(ValueError):
+            SalesAIAgent().handle_objections(mode='bulk')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient, set_default_client
+from batch_runner import Brief, iter_briefs, run_batch
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        # Every brief gets the same fake answers, so stored stage outputs and
+        # in-flight requests would be shared between briefs
+        env = mock.patch.dict(os.environ, {"OPENROUTER_STAGE_STORE": "off"})
+        env.start()
+        self.addCleanup(env.stop)
+        self.server = FakeOpenRouterServer(response_text="Plan section").start()
+        self.client = OpenRouterClient(api_key="test-key", base_url=self.server.url, single_flight=False)
+        self.previous_client = set_default_client(self.client)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.tmp.name, "briefs.jsonl")
+        self.output_path = os.path.join(self.tmp.name, "results.jsonl")
+        self.docs_dir = os.path.join(self.tmp.name, "plans")
+        with open(self.input_path, "w") as f:
+            for i in range(5):
+                f.write(json.dumps({"id": f"brief-{i}", "brief": f"Product {i}. Sell more.", "budget": "$1000"}) + "\n")
+
+    def tearDown(self):
+        set_default_client(self.previous_client)
+        self.client.close()
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def read_results(self):
+        with open(self.output_path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_run_batch_writes_results_and_documents(self):
+        stats = run_batch(self.input_path, self.output_path, self.docs_dir, concurrency=3)
+
+        self.assertEqual(stats, {"completed": 5, "failed": 0, "skipped": 0})
+        results = self.read_results()
+        self.assertEqual(sorted(result["id"] for result in results), [f"brief-{i}" for i in range(5)])
+        self.assertTrue(all(result["status"] == "ok" for result in results))
+        self.assertTrue(all(result["usage"]["totals"]["calls"] == 6 for result in results))
+        self.assertEqual(len({result["document"] for result in results}), 5)
+        self.assertTrue(all(os.path.exists(result["document"]) for result in results))
+        self.assertEqual(len(self.server.requests), 30)
+
+    def test_resumed_run_skips_completed_briefs(self):
+        with open(self.output_path + ".checkpoint", "w") as f:
+            f.write("brief-0\nbrief-3\n")
+
+        stats = run_batch(self.input_path, self.output_path, self.docs_dir, concurrency=2)
+
+        self.assertEqual(stats, {"completed": 3, "failed": 0, "skipped": 2})
+        self.assertEqual(len(self.server.requests), 18)
+        stats = run_batch(self.input_path, self.output_path, self.docs_dir, concurrency=2)
+        self.assertEqual(stats, {"completed": 0, "failed": 0, "skipped": 5})
+
+    def test_malformed_records_are_reported_and_skipped(self):
+        with open(self.input_path, "a") as f:
+            f.write('{"id": "broken", "brief": \n')
+            f.write(json.dumps({"id": "empty", "budget": "$5"}) + "\n")
+            f.write('["not", "an", "object"]\n')
+            f.write(json.dumps({"id": "brief-5", "brief": "Product 5. Sell more."}) + "\n")
+
+        stats = run_batch(self.input_path, self.output_path, self.docs_dir, concurrency=2)
+
+        self.assertEqual(stats, {"completed": 6, "failed": 3, "skipped": 0})
+        errors = {result["id"]: result["error"] for result in self.read_results() if result["status"] == "error"}
+        self.assertEqual(sorted(errors), ["briefs.jsonl:6", "briefs.jsonl:8", "empty"])
+        self.assertTrue(errors["empty"].startswith("Invalid brief: Brief has neither a product nor brief text"))
+
+    def test_csv_briefs_and_derived_fields(self):
+        csv_path = os.path.join(self.tmp.name, "briefs.csv")
+        with open(csv_path, "w") as f:
+            f.write("brief,language,marketing_goals\n")
+            f.write("\"Eco Bottle. Reusable bottle for hikers.\",German,Awareness\n")
+        brief = next(iter_briefs(csv_path))
+        self.assertEqual(brief.product, "Eco Bottle")
+        self.assertEqual(brief.additional_info["language"], "german")
+        self.assertEqual(brief.additional_info["marketing_goals"], "Awareness")
+        self.assertEqual(brief.id, Brief.from_record({"brief": "Eco Bottle. Reusable bottle for hikers.", "language": "German", "marketing_goals": "Awareness"}).id)
+
+if __name__ == '__main__':
+    unittest.main()
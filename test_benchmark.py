@@ -0,0 +1,50 @@
+import os
+import json
+import tempfile
+import unittest
+import requests
+from fake_openrouter_server import FakeOpenRouterServer
+from benchmark import compare, latency_summary, percentile
+
+class TestBenchmarkHelpers(unittest.TestCase):
+    def test_percentiles(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50.5)
+        self.assertAlmostEqual(percentile(values, 99), 99.01)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertEqual(latency_summary([])["count"], 0)
+
+    def test_compare_flags_regressions_only(self):
+        baseline = {"scenarios": {"batch_c4": {"latency": {"p50": 1.0, "p95": 2.0, "p99": 2.0},
+                                               "throughput_plans_per_second": 4.0}}}
+        results = {"scenarios": {"batch_c4": {"latency": {"p50": 1.05, "p95": 3.0, "p99": 2.0},
+                                              "throughput_plans_per_second": 2.0}}}
+        regressions = compare(results, baseline, 0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("batch_c4 p95"))
+        self.assertTrue(regressions[1].startswith("batch_c4 throughput"))
+
+class TestFakeServerKnobs(unittest.TestCase):
+    def post(self, server):
+        return requests.post(server.url, json={"messages": []})
+
+    def test_injected_error_rates(self):
+        with FakeOpenRouterServer(error_rate=0.3, rate_limit_rate=0.3, retry_after=2, seed=1) as server:
+            statuses = [self.post(server).status_code for _ in range(60)]
+        self.assertTrue(10 < statuses.count(429) < 30)
+        self.assertTrue(10 < statuses.count(500) < 30)
+        self.assertIn(200, statuses)
+
+    def test_recorded_completions_are_replayed(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "recording.jsonl")
+            with open(path, "w") as f:
+                f.write(json.dumps({"text": "first"}) + "\n" + json.dumps({"text": "second"}) + "\n")
+            with FakeOpenRouterServer.from_recording(path, tokens_per_second=1000) as server:
+                bodies = [self.post(server).text for _ in range(3)]
+        self.assertIn('"first"', bodies[0])
+        self.assertIn('"second"', bodies[1])
+        self.assertIn('"first"', bodies[2])
+
+if __name__ == '__main__':
+    unittest.main()
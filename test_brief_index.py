@@ -0,0 +1,108 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from brief_index import BriefIndex, brief_scope, embed_brief
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient, set_default_client
+from marketing_team import MarketingTeam
+from async_marketing_team import AsyncMarketingTeam
+from stream_observers import NullObserver
+
+BRIEF = {'language': 'english', 'target_audience': 'Young professionals in large cities',
+         'marketing_goals': 'Grow brand awareness and drive app downloads in the first quarter',
+         'budget': '$50,000'}
+REWORDED = {**BRIEF, 'marketing_goals': 'Drive app downloads and build brand awareness during Q1'}
+NEW_AUDIENCE = {**BRIEF, 'target_audience': 'Parents of toddlers in rural areas'}
+OTHER = {'language': 'english', 'target_audience': 'Retired gardeners', 'marketing_goals': 'Sell seed kits',
+         'budget': '$2,000'}
+OUTPUTS = {"marketing": "Idea", "sales": "Feedback", "strategy": "Trends", "analytics": "Audience",
+           "final_marketing": "Final idea", "synthesis": "Plan"}
+
+class TestBriefIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_embeddings_separate_rewordings_from_other_briefs(self):
+        brief = embed_brief(BRIEF)
+        self.assertGreater(float(brief @ embed_brief(REWORDED)), 0.82)
+        self.assertLess(float(brief @ embed_brief(NEW_AUDIENCE)), 0.7)
+        self.assertLess(float(brief @ embed_brief(OTHER)), 0.3)
+        scope = brief_scope("FitTrack app", BRIEF)
+        self.assertEqual(scope, brief_scope("  fittrack  App", REWORDED))
+        self.assertNotEqual(scope, brief_scope("SleepWell app", BRIEF))
+        self.assertNotEqual(scope, brief_scope("FitTrack app", {**BRIEF, 'language': 'german'}))
+        self.assertNotEqual(scope, brief_scope("FitTrack app", {**BRIEF, 'budget': '$500,000'}))
+
+    def test_only_the_same_product_is_reused(self):
+        index = BriefIndex()
+        index.add(BRIEF, brief_scope("FitTrack app", BRIEF), OUTPUTS)
+        # A different product with identical fields misses; a reworded goal for the same product hits
+        self.assertIsNone(index.lookup(BRIEF, brief_scope("SleepWell app", BRIEF)))
+        self.assertIsNotNone(index.lookup(REWORDED, brief_scope("FitTrack app", REWORDED)))
+        self.assertIsNone(index.lookup(NEW_AUDIENCE, brief_scope("FitTrack app", NEW_AUDIENCE)))
+
+    def test_lookup_eviction_and_persistence(self):
+        path = os.path.join(self.tmp.name, "briefs.db")
+        index = BriefIndex(db_path=path, max_entries=2)
+        scope = brief_scope("FitTrack app", BRIEF)
+        index.add(BRIEF, scope, OUTPUTS)
+        match = index.lookup(REWORDED, scope)
+        self.assertEqual(match.outputs, {stage: text for stage, text in OUTPUTS.items() if stage != "synthesis"})
+        self.assertIsNone(index.lookup(REWORDED, brief_scope("FitTrack app", {**BRIEF, 'language': 'german'})))
+        index.add(OTHER, scope, OUTPUTS)
+        self.assertIsNotNone(index.lookup(BRIEF, scope))
+        index.add({'target_audience': 'Students'}, scope, OUTPUTS)
+        self.assertEqual(index.stats(), {"entries": 2, "hits": 2, "misses": 1, "evictions": 1, "hit_rate": 2 / 3})
+        index.close()
+
+        # The most recently used briefs survive a restart; SeedBox was the least recently used and got evicted
+        reloaded = BriefIndex(db_path=path, max_entries=2)
+        self.assertIsNotNone(reloaded.lookup(BRIEF, scope))
+        self.assertIsNone(reloaded.lookup(OTHER, scope))
+        reloaded.close()
+
+class TestSimilarBriefReuse(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Agent output").start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_similar_brief_only_regenerates_the_synthesis(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url, cache=None, single_flight=False)
+        previous = set_default_client(client)
+        try:
+            team = MarketingTeam(observer_factory=NullObserver, verbose=False, write_document=False,
+                                 stage_store=False, brief_index=BriefIndex())
+            team.discuss_marketing_plan("FitTrack app", BRIEF)
+            self.assertEqual(len(self.server.requests), 6)
+            content = team.discuss_marketing_plan("FitTrack app", REWORDED)
+        finally:
+            set_default_client(previous)
+            client.close()
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertIn("during Q1", self.server.requests[-1]["messages"][-1]["content"])
+        self.assertEqual(len(content), 6)
+        self.assertEqual(team.last_usage.totals()["stage_reuses"], 5)
+        self.assertEqual(team.brief_index.stats()["hit_rate"], 0.5)
+
+    def test_async_team_reuses_similar_briefs(self):
+        async def _run():
+            client = AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url, cache=None)
+            async with AsyncMarketingTeam(client=client, write_document=False, verbose=False, stage_store=False,
+                                          brief_index=BriefIndex()) as team:
+                await team.discuss_marketing_plan("FitTrack app", BRIEF)
+                await team.discuss_marketing_plan("FitTrack app", REWORDED)
+                # A different output language or product never matches
+                await team.discuss_marketing_plan("FitTrack app", {**REWORDED, 'language': 'german'})
+                await team.discuss_marketing_plan("SleepWell app", BRIEF)
+
+        asyncio.run(_run())
+        self.assertEqual(len(self.server.requests), 6 + 1 + 6 + 6)
+
+if __name__ == '__main__':
+    unittest.main()
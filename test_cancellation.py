@@ -0,0 +1,119 @@
+import time
+import asyncio
+import threading
+import unittest
+from cancellation import CancellationToken, cancel_scope
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient, set_default_client
+from openrouter_errors import DeadlineExceeded, OperationCancelled
+from marketing_team import MarketingTeam
+from async_marketing_team import AsyncMarketingTeam
+from stream_observers import NullObserver
+
+MESSAGES = [{"role": "user", "content": "Respond in english. Analyze market trends."}]
+
+class TestCancellationToken(unittest.TestCase):
+    def test_deadline_fires_callbacks_and_children_follow_the_parent(self):
+        parent = CancellationToken(0.1)
+        child = parent.child(10)
+        fired = threading.Event()
+        child.on_cancel(fired.set)
+        self.assertTrue(fired.wait(1.0))
+        self.assertLessEqual(child.deadline, parent.deadline)
+        with self.assertRaises(DeadlineExceeded):
+            child.check()
+
+    def test_cancel_reason_is_reported(self):
+        token = CancellationToken()
+        token.cancel("user pressed stop")
+        with self.assertRaises(OperationCancelled) as raised:
+            token.check()
+        self.assertNotIsInstance(raised.exception, DeadlineExceeded)
+        self.assertFalse(raised.exception.retryable)
+
+class TestCancelledStreams(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Trends: short video, creator commerce").start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_deadline_aborts_a_hung_stream(self):
+        self.server.stall_next(5.0)
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url)
+        started = time.perf_counter()
+        with cancel_scope(CancellationToken(0.3)), self.assertRaises(DeadlineExceeded):
+            client.stream_chat(MESSAGES, observer=NullObserver())
+        self.assertLess(time.perf_counter() - started, 1.5)
+        # The client stays usable after the aborted stream
+        self.assertEqual(client.stream_chat(MESSAGES, observer=NullObserver()), "Trends: short video, creator commerce")
+        client.close()
+
+    def test_cancel_from_another_thread(self):
+        self.server.stall_next(5.0)
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url)
+        token = CancellationToken()
+        threading.Timer(0.2, token.cancel).start()
+        started = time.perf_counter()
+        with cancel_scope(token), self.assertRaises(OperationCancelled):
+            client.stream_chat(MESSAGES, observer=NullObserver())
+        self.assertLess(time.perf_counter() - started, 1.5)
+        client.close()
+
+    def test_async_deadline_aborts_a_hung_stream(self):
+        self.server.stall_next(5.0)
+
+        async def _run():
+            async with AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url) as client:
+                with cancel_scope(CancellationToken(0.3)):
+                    await client.stream_chat(MESSAGES, observer=NullObserver())
+
+        started = time.perf_counter()
+        with self.assertRaises(DeadlineExceeded):
+            asyncio.run(_run())
+        self.assertLess(time.perf_counter() - started, 1.5)
+
+class TestPlanDeadline(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Agent output").start()
+        # The first two stages answer at once, the third hangs
+        self.server.stall_next(0.0, times=2)
+        self.server.stall_next(5.0)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_timed_out_plan_returns_the_finished_sections(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url, single_flight=False)
+        previous = set_default_client(client)
+        try:
+            team = MarketingTeam(observer_factory=NullObserver, verbose=False, write_document=False,
+                                 stage_store=False, plan_timeout=1.5)
+            started = time.perf_counter()
+            content = team.discuss_marketing_plan("Test Product", {'language': 'english'})
+        finally:
+            set_default_client(previous)
+            client.close()
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertEqual(content.status, "timed_out")
+        self.assertEqual([section['title'] for section in content],
+                         ["Initial Marketing Campaign Idea", "Sales Agent Feedback"])
+
+    def test_async_plan_is_cancelled_through_its_token(self):
+        async def _run():
+            client = AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url)
+            async with AsyncMarketingTeam(client=client, write_document=False, verbose=False,
+                                          stage_store=False) as team:
+                token = CancellationToken()
+                asyncio.get_running_loop().call_later(0.5, token.cancel)
+                return await team.discuss_marketing_plan("Test Product", {'language': 'english'},
+                                                         cancel_token=token)
+
+        started = time.perf_counter()
+        content = asyncio.run(_run())
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertEqual(content.status, "cancelled")
+        self.assertEqual(len(content), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from context_compactor import ContextCompactor, truncate_to_tokens
+from marketing_team import MarketingTeam
+from request_scheduler import estimate_tokens
+
+LONG_TEXT = "word " * 2000
+
+class TestContextCompactor(unittest.TestCase):
+    def setUp(self):
+        self.agent = MagicMock()
+        self.agent.call_openrouter_api.return_value = "Short summary"
+        self.agent.acall_openrouter_api = AsyncMock(return_value="Async summary")
+
+    def test_short_text_passes_through(self):
+        compactor = ContextCompactor(max_tokens=100, agent=self.agent)
+        self.assertEqual(compactor.join(["first", "second"]), "first\nsecond")
+        self.agent.call_openrouter_api.assert_not_called()
+
+    def test_long_output_is_summarized_once(self):
+        compactor = ContextCompactor(max_tokens=100, agent=self.agent)
+        self.assertEqual(compactor.compact(LONG_TEXT, language='german'), "Short summary")
+        self.assertEqual(compactor.join([LONG_TEXT, "other"], 'german'), "Short summary\nother")
+        self.agent.call_openrouter_api.assert_called_once()
+        self.assertEqual(self.agent.call_openrouter_api.call_args[1], {'language': 'german', 'route': 'compaction'})
+
+        self.assertEqual(asyncio.run(compactor.acompact("x" * 1000)), "Async summary")
+        self.assertEqual(asyncio.run(compactor.acompact("x" * 1000)), "Async summary")
+        self.agent.acall_openrouter_api.assert_awaited_once()
+
+    def test_truncate_mode_stays_within_budget(self):
+        compactor = ContextCompactor(max_tokens=50, mode='truncate', agent=self.agent)
+        compacted = compactor.compact(LONG_TEXT)
+        self.assertLessEqual(estimate_tokens(compacted), 52)
+        self.assertTrue(compacted.endswith("[...]"))
+        self.assertEqual(truncate_to_tokens("short", 50), "short")
+        self.agent.call_openrouter_api.assert_not_called()
+        with self.assertRaises(ValueError):
+            ContextCompactor(mode='shorten')
+
+    def test_later_stages_get_bounded_context(self):
+        team = MarketingTeam(verbose=False, context_budget=100, compaction_mode='truncate', write_document=False)
+        team.marketing_agent.generate_campaign_idea = MagicMock(return_value=LONG_TEXT)
+        team.sales_agent.respond_to_agent = MagicMock(return_value=LONG_TEXT)
+        team.strategy_agent.analyze_market_trends = MagicMock(return_value=LONG_TEXT)
+        team.analytics_agent.analyze_target_audience = MagicMock(return_value=LONG_TEXT)
+        team.marketing_agent.call_openrouter_api = MagicMock(return_value="Plan")
+
+        team.discuss_marketing_plan("Test Product", {'language': 'english'})
+
+        context = team.analytics_agent.analyze_target_audience.call_args[0][1]
+        self.assertLessEqual(estimate_tokens(context), 3 * 102)
+        synthesis_prompt = team.marketing_agent.call_openrouter_api.call_args[0][0]
+        self.assertLess(estimate_tokens(synthesis_prompt), 4 * 102 + 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import time
+import asyncio
+import unittest
+from fake_openrouter_server import FakeOpenRouterServer
+from hedging import HedgePolicy
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient
+from stream_observers import MetricsObserver
+from usage_tracking import UsageReport, usage_scope
+
+MESSAGES = [{"role": "user", "content": "Respond in english. Describe the target audience."}]
+
+class TestHedgePolicy(unittest.TestCase):
+    def test_threshold_adapts_to_observed_first_token_times(self):
+        policy = HedgePolicy(min_samples=10, min_delay=0.05)
+        self.assertIsNone(policy.threshold())
+        for i in range(100):
+            policy.observe(0.01 * (i + 1))
+        self.assertAlmostEqual(policy.threshold(), 0.96)
+        self.assertEqual(HedgePolicy(delay=0.3).threshold(), 0.3)
+
+    def test_budget_caps_hedges_to_a_share_of_requests(self):
+        policy = HedgePolicy(delay=0.1, max_ratio=0.05, burst=1)
+        issued = 0
+        for _ in range(100):
+            policy.record_request()
+            issued += policy.try_hedge()
+        self.assertEqual(issued, 6)
+        self.assertLessEqual(policy.stats()["hedge_ratio"], 0.06)
+
+class TestHedgedStreams(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Audience: busy parents in cities", chunk_size=4).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_slow_primary_loses_to_the_hedge(self):
+        self.server.stall_next(2.0)
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url,
+                                  hedging=HedgePolicy(delay=0.1))
+        observer = MetricsObserver()
+        usage = UsageReport()
+        started = time.perf_counter()
+        with usage_scope(usage, "analytics"):
+            result = client.stream_chat(MESSAGES, observer=observer)
+        elapsed = time.perf_counter() - started
+        client.close()
+
+        self.assertEqual(result, "Audience: busy parents in cities")
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual((result.hedges_issued, result.hedges_won), (1, 1))
+        self.assertEqual(len(self.server.requests), 2)
+        # The observer sees one stream, not both
+        self.assertEqual(observer.tokens, 8)
+        totals = usage.totals()
+        self.assertEqual((totals["hedges_issued"], totals["hedges_won"]), (1, 1))
+        self.assertEqual(client.hedging.stats()["hedges_won"], 1)
+
+    def test_fast_primary_is_not_hedged(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url,
+                                  hedging=HedgePolicy(delay=0.5))
+        result = client.stream_chat(MESSAGES, observer=MetricsObserver())
+        client.close()
+        self.assertEqual((result.hedges_issued, result.hedges_won), (0, 0))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_async_slow_primary_loses_to_the_hedge(self):
+        self.server.stall_next(2.0)
+
+        async def _run():
+            async with AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url,
+                                             hedging=HedgePolicy(delay=0.1)) as client:
+                observer = MetricsObserver()
+                started = time.perf_counter()
+                result = await client.stream_chat(MESSAGES, observer=observer)
+                return result, observer, time.perf_counter() - started
+
+        result, observer, elapsed = asyncio.run(_run())
+        self.assertEqual(result, "Audience: busy parents in cities")
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual((result.hedges_issued, result.hedges_won), (1, 1))
+        self.assertEqual(observer.tokens, 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+import sqlite3
+import threading
+import unittest
+from unittest.mock import patch
+from contextlib import redirect_stdout
+from fake_openrouter_server import FakeOpenRouterServer
+import job_queue
+from job_queue import JobQueue, QueueWorker
+from pipeline import PlanResult
+
+class _FailingTeam:
+    def discuss_marketing_plan(self, product, additional_info=None, **kwargs):
+        return None
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "jobs.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_expired_lease_moves_the_job_to_another_worker(self):
+        queue = JobQueue(self.path, lease_seconds=0.2, max_attempts=2)
+        queue.enqueue({"id": "brief-1", "product": "Widget"})
+        first = queue.claim("worker-a")
+        self.assertEqual((first.id, first.attempts), ("brief-1", 1))
+        self.assertIsNone(queue.claim("worker-b"))
+        self.assertEqual(queue.stats()["workers"], {"worker-a": 1})
+
+        # worker-a stops heartbeating, as if it had crashed
+        time.sleep(0.3)
+        self.assertEqual(queue.stats()["expired_leases"], 1)
+        second = queue.claim("worker-b")
+        self.assertEqual((second.id, second.attempts), ("brief-1", 2))
+        self.assertFalse(queue.heartbeat("brief-1", "worker-a"))
+        self.assertFalse(queue.complete("brief-1", "worker-a", {"status": "ok"}))
+        self.assertTrue(queue.complete("brief-1", "worker-b", {"id": "brief-1", "status": "ok"}))
+        self.assertEqual(queue.stats()["jobs"], {"queued": 0, "running": 0, "done": 1, "failed": 0})
+
+        # A job whose lease keeps expiring is failed once it is out of attempts
+        queue.enqueue({"id": "brief-2", "product": "Gadget"})
+        queue.claim("worker-a")
+        time.sleep(0.3)
+        queue.claim("worker-b")
+        time.sleep(0.3)
+        self.assertIsNone(queue.claim("worker-c"))
+        failed = [record for record in queue.results() if record["id"] == "brief-2"]
+        self.assertEqual(failed[0]["error"], "Lease expired after 2 attempts")
+        self.assertIn('marketmind_queue_jobs{status="failed"} 1', queue.to_prometheus())
+
+    def test_failed_plans_are_retried_until_out_of_attempts(self):
+        queue = JobQueue(self.path, max_attempts=2)
+        queue.enqueue_many([{"id": "brief-1", "product": "Widget"}])
+        worker = QueueWorker(queue, os.path.join(self.tmp.name, "plans"), concurrency=1, team_factory=_FailingTeam)
+        self.assertEqual(worker.run(drain=True), {"done": 0, "retried": 1, "failed": 1, "lost": 0})
+        self.assertEqual(queue.stats()["jobs"]["failed"], 1)
+        self.assertEqual(queue.requeue_failed(), 1)
+        self.assertEqual(queue.stats()["jobs"]["queued"], 1)
+
+    def test_heartbeat_survives_a_locked_database(self):
+        queue = JobQueue(self.path, lease_seconds=0.3, journal_mode="delete")
+        self.assertEqual(queue._db().execute("PRAGMA journal_mode").fetchone()[0], "delete")
+        queue.enqueue({"id": "brief-1", "product": "Widget"})
+        expired = []
+
+        class SlowTeam:
+            def discuss_marketing_plan(self, product, additional_info=None, **kwargs):
+                time.sleep(0.6)
+                expired.append(queue.stats()["expired_leases"])
+                return PlanResult([("Plan", "Text")])
+
+        worker = QueueWorker(queue, os.path.join(self.tmp.name, "plans"), concurrency=1, team_factory=SlowTeam)
+        renew = queue.heartbeat
+        failures = iter([sqlite3.OperationalError("database is locked")])
+
+        def flaky_heartbeat(job_id, worker_id):
+            error = next(failures, None)
+            if error is not None:
+                raise error
+            return renew(job_id, worker_id)
+
+        with patch.object(queue, "heartbeat", side_effect=flaky_heartbeat):
+            self.assertEqual(worker.run(drain=True), {"done": 1, "retried": 0, "failed": 0, "lost": 0})
+        # Later heartbeats kept the lease alive for the whole plan
+        self.assertEqual(expired, [0])
+        self.assertEqual([record["attempt"] for record in queue.results()], [1])
+
+    def test_worker_threads_close_their_connections(self):
+        queue = JobQueue(self.path)
+        queue.enqueue_many([{"id": f"brief-{i}", "product": "Widget"} for i in range(3)])
+        worker = QueueWorker(queue, os.path.join(self.tmp.name, "plans"), concurrency=2, team_factory=_FailingTeam)
+        worker.run(drain=True)
+        # Only the test thread's own connection is left open
+        self.assertEqual(len(queue._connections), 1)
+
+        other = threading.Thread(target=queue.stats)
+        other.start()
+        other.join()
+        connections = list(queue._connections)
+        self.assertEqual(len(connections), 2)
+        queue.close()
+        for db in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                db.execute("SELECT 1")
+        # The queue stays usable after close()
+        self.assertEqual(queue.stats()["jobs"]["failed"], 3)
+        queue.close()
+
+    def test_enqueue_command_skips_malformed_records(self):
+        briefs = os.path.join(self.tmp.name, "briefs.jsonl")
+        with open(briefs, "w") as f:
+            f.write('{"id": "brief-1", "product": "Widget"}\n{not json\n{"id": "empty"}\n'
+                    '{"id": "brief-2", "product": "Gadget"}\n')
+        output = io.StringIO()
+        with patch.object(sys, "argv", ["job_queue.py", "--db", self.path, "enqueue", briefs]), \
+                redirect_stdout(output), self.assertLogs(level="WARNING") as logs:
+            job_queue.main()
+        self.assertEqual(output.getvalue(), "Queued 2 new briefs\n")
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn("Skipping invalid brief briefs.jsonl:2", logs.output[0])
+        self.assertIn("Skipping invalid brief empty", logs.output[1])
+        queue = JobQueue(self.path)
+        self.assertEqual(queue.stats()["jobs"]["queued"], 2)
+        queue.close()
+
+class TestWorkerProcesses(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Plan section").start()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_several_processes_drain_one_queue(self):
+        db = os.path.join(self.tmp.name, "jobs.db")
+        docs = os.path.join(self.tmp.name, "plans")
+        queue = JobQueue(db)
+        self.assertEqual(queue.enqueue_many({"id": f"brief-{i}", "brief": f"Product {i}. Sell more."}
+                                            for i in range(6)), 6)
+        env = {**os.environ, "OPENROUTER_API_KEY": "test-key", "OPENROUTER_BASE_URL": self.server.url,
+               "OPENROUTER_STAGE_STORE": "off", "OPENROUTER_CACHE": "off"}
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "job_queue.py")
+        workers = [subprocess.Popen([sys.executable, script, "--db", db, "work", "--drain", "--concurrency", "2",
+                                     "--docs-dir", docs], env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                   for _ in range(2)]
+        outputs = [json.loads(worker.communicate(timeout=60)[0]) for worker in workers]
+
+        self.assertEqual(sum(output["done"] for output in outputs), 6)
+        self.assertEqual(queue.stats()["jobs"], {"queued": 0, "running": 0, "done": 6, "failed": 0})
+        results = list(queue.results())
+        self.assertEqual(sorted(result["id"] for result in results), [f"brief-{i}" for i in range(6)])
+        self.assertTrue(all(os.path.exists(result["document"]) for result in results))
+
+if __name__ == '__main__':
+    unittest.main()
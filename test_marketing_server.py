@@ -0,0 +1,79 @@
+import io
+import json
+import unittest
+import requests
+from docx import Document
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient, set_default_client
+from marketing_server import MarketingServer
+
+class TestMarketingServer(unittest.TestCase):
+    def setUp(self):
+        self.fake = FakeOpenRouterServer(response_text="Streamed agent output", first_token_delay=0.02).start()
+        self.client = OpenRouterClient(api_key="test-key", base_url=self.fake.url)
+        self.previous_client = set_default_client(self.client)
+
+    def tearDown(self):
+        set_default_client(self.previous_client)
+        self.client.close()
+        self.fake.stop()
+
+    def read_events(self, response):
+        events, name = [], None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                name = line[7:]
+            elif line.startswith("data: "):
+                events.append((name, json.loads(line[6:])))
+        return events
+
+    def test_job_streams_tokens_and_returns_result(self):
+        with MarketingServer(port=0, workers=2) as server:
+            response = requests.post(f"{server.url}/jobs", json={"brief": "Eco Bottle. Reusable bottle.", "budget": "$500"})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()["id"]
+
+            with requests.get(f"{server.url}/jobs/{job_id}/events", stream=True, timeout=10) as stream:
+                events = self.read_events(stream)
+            names = [name for name, _ in events]
+            self.assertEqual(names[0], "queued")
+            self.assertEqual(names[-1], "job_complete")
+            self.assertEqual(names.count("stage_complete"), 6)
+            tokens = "".join(data["text"] for name, data in events if name == "token" and data["stage"] == "Sales Agent")
+            self.assertEqual(tokens, "Streamed agent output")
+
+            # A finished job keeps its stage and completion events but not the streamed tokens
+            with requests.get(f"{server.url}/jobs/{job_id}/events", stream=True, timeout=10) as stream:
+                replayed = [name for name, _ in self.read_events(stream)]
+            self.assertEqual(replayed, [name for name in names if name != "token"])
+
+            result = requests.get(f"{server.url}/jobs/{job_id}/result").json()
+            self.assertEqual(result["status"], "done")
+            self.assertEqual(result["product"], "Eco Bottle")
+            self.assertEqual(len(result["sections"]), 6)
+            self.assertEqual(result["usage"]["calls"], 6)
+
+            document = requests.get(f"{server.url}/jobs/{job_id}/document")
+            headings = [p.text for p in Document(io.BytesIO(document.content)).paragraphs if p.style.name == "CustomHeading"]
+            self.assertEqual(len(headings), 6)
+            self.assertIn('marketmind_plans_total 1', requests.get(f"{server.url}/metrics").text)
+
+    def test_full_queue_returns_429(self):
+        self.fake.first_token_delay = 0.2
+        with MarketingServer(port=0, workers=1, max_queue=1) as server:
+            statuses = [requests.post(f"{server.url}/jobs", json={"product": f"Product {i}"}).status_code
+                        for i in range(4)]
+            self.assertIn(429, statuses)
+            self.assertEqual(statuses[0], 202)
+            self.assertEqual(requests.post(f"{server.url}/jobs", json={"language": "english"}).status_code, 400)
+            self.assertEqual(requests.get(f"{server.url}/jobs/missing").status_code, 404)
+            self.assertEqual(requests.get(f"{server.url}/health").json()["workers"], 1)
+
+            # Stop the running plan so it cannot outlive this test and call the next test's default client
+            for job in list(server.jobs.values()):
+                server.cancel(job.id)
+                while not job.finished:
+                    job.wait_for_events(job.last_event, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,8 +10,8 @@ class TestMarketingTeam(unittest.TestCase):
     def setUp(self):
         self.marketing_team = MarketingTeam()
 
-    @patch('marketing_team.create_styled_document')
-    def test_discuss_marketing_plan(self, mock_create_styled_document):
+    @patch('marketing_team.ReportWriter')
+    def test_discuss_marketing_plan(self, mock_report_writer):
         # Mock the AI agents' methods
         self.marketing_team.marketing_agent.generate_campaign_idea = MagicMock(return_value="Marketing Campaign Idea")
         self.marketing_team.sales_agent.respond_to_agent = MagicMock(return_value="Sales Feedback")
@@ -26,23 +26,23 @@ class TestMarketingTeam(unittest.TestCase):
 
         # Assert that all methods were called with correct arguments
         self.marketing_team.marketing_agent.generate_campaign_idea.assert_any_call(product, additional_info=additional_info)
-        self.marketing_team.marketing_agent.generate_campaign_idea.assert_any_call(product, additional_info="Sales Feedback\nMarket Trends Analysis\nTarget Audience Analysis")
+        self.marketing_team.marketing_agent.generate_campaign_idea.assert_any_call(product, additional_info={'input': "Sales Feedback\nMarket Trends Analysis\nTarget Audience Analysis", 'language': 'english'})
         self.marketing_team.sales_agent.respond_to_agent.assert_called_with("Marketing Campaign Idea", language='english')
         self.marketing_team.strategy_agent.analyze_market_trends.assert_called_with(product, "Marketing Campaign Idea\nSales Feedback", language='english')
         self.marketing_team.analytics_agent.analyze_target_audience.assert_called_with(product, "Marketing Campaign Idea\nSales Feedback\nMarket Trends Analysis", language='english')
-        self.marketing_team.marketing_agent.generate_campaign_idea.assert_called_with(product, additional_info="Sales Feedback\nMarket Trends Analysis\nTarget Audience Analysis")
+        self.marketing_team.marketing_agent.generate_campaign_idea.assert_called_with(product, additional_info={'input': "Sales Feedback\nMarket Trends Analysis\nTarget Audience Analysis", 'language': 'english'})
         self.marketing_team.synthesize_plan.assert_called_with("Marketing Campaign Idea", "Sales Feedback", "Market Trends Analysis", "Target Audience Analysis", product, additional_info)
 
-        # Assert that create_styled_document was called with correct arguments
-        mock_create_styled_document.assert_called_once()
-        call_args = mock_create_styled_document.call_args[0][0]
+        # Assert that every section was appended to the document as its stage finished
+        mock_report_writer.assert_called_once()
+        call_args = [call[0] for call in mock_report_writer.return_value.add_section.call_args_list]
         self.assertEqual(len(call_args), 6)
-        self.assertEqual(call_args[0]['title'], "Initial Marketing Campaign Idea")
-        self.assertEqual(call_args[1]['title'], "Sales Agent Feedback")
-        self.assertEqual(call_args[2]['title'], "Market Trends Analysis")
-        self.assertEqual(call_args[3]['title'], "Target Audience Analysis")
-        self.assertEqual(call_args[4]['title'], "Final Marketing Campaign Idea")
-        self.assertEqual(call_args[5]['title'], "Final Marketing Plan")
+        self.assertEqual(call_args[0][0], "Initial Marketing Campaign Idea")
+        self.assertEqual(call_args[1][0], "Sales Agent Feedback")
+        self.assertEqual(call_args[2][0], "Market Trends Analysis")
+        self.assertEqual(call_args[3][0], "Target Audience Analysis")
+        self.assertEqual(call_args[4][0], "Final Marketing Campaign Idea")
+        self.assertEqual(call_args[5][0], "Final Marketing Plan")
 
     def test_synthesize_plan(self):
         # Test the synthesize_plan method
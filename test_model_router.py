@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient, set_default_client
+from openrouter_errors import AuthenticationError, ServerError
+from marketing_team import MarketingTeam
+from model_router import ModelRouter
+from stream_observers import NullObserver
+from usage_tracking import CompletionResult, UsageReport, usage_scope
+
+TIERS = {"flagship": ["big-a", "big-b"], "fast": ["small-a", "small-b"]}
+
+class TestModelRouter(unittest.TestCase):
+    def test_template_route_wins_over_stage_route(self):
+        router = ModelRouter(routes={"default": "flagship", "sales": "fast", "objection": "flagship"}, tiers=TIERS)
+        self.assertEqual(router.tier_for("sales_respond", "sales"), "fast")
+        self.assertEqual(router.tier_for("objection", "sales"), "flagship")
+        self.assertEqual(router.tier_for(None, "synthesis"), "flagship")
+        with self.assertRaises(ValueError):
+            ModelRouter(routes={"default": "medium"}, tiers=TIERS)
+
+    def test_retryable_failure_falls_over_and_is_recorded(self):
+        router = ModelRouter(routes={"default": "fast"}, tiers=TIERS)
+        sent = []
+
+        def send(model):
+            sent.append(model)
+            if model == "small-a":
+                raise ServerError("Error: 500")
+            return CompletionResult("ok", model=model)
+
+        usage = UsageReport()
+        with usage_scope(usage, "sales"):
+            self.assertEqual(router.call(send, "sales_respond"), "ok")
+        self.assertEqual(sent, ["small-a", "small-b"])
+        route = usage.to_dict()["routes"][0]
+        self.assertEqual((route["stage"], route["tier"], route["model"]), ("sales", "fast", "small-b"))
+        self.assertEqual((route["calls"], route["failed"], route["errors"]), (1, {"small-a": 1}, {"ServerError": 1}))
+
+
+        def unauthorized(model):
+            raise AuthenticationError("Error: 401")
+        with self.assertRaises(AuthenticationError):
+            router.call(unauthorized)
+        self.assertEqual(router.health()["small-a"]["calls"], 1)
+
+        # Repeated decisions are counted, in this report and in the reports it is merged into
+        with usage_scope(usage, "sales"):
+            router.call(send, "sales_respond")
+        batch = UsageReport(plans=0)
+        batch.merge(usage)
+        batch.merge(usage)
+        self.assertEqual(len(batch.routes()), 1)
+        self.assertEqual((batch.routes()[0]["calls"], batch.routes()[0]["failed"]), (4, {"small-a": 4}))
+
+    def test_slow_model_is_skipped_until_cooldown_ends(self):
+        router = ModelRouter(routes={"default": "flagship"}, tiers=TIERS, max_p95_latency=1.0, min_calls=3,
+                             cooldown=0.0)
+        for latency in (0.2, 3.0, 3.0):
+            router.observe("big-a", latency)
+        self.assertFalse(router.health()["big-a"]["healthy"])
+        router.cooldown = 60.0
+        tier, models, skipped = router.candidates()
+        self.assertEqual((models, skipped), (["big-b", "big-a"], ["big-a"]))
+        router.cooldown = 0.0
+        self.assertEqual(router.candidates()[1], ["big-a", "big-b"])
+
+    def test_team_routes_critique_stage_to_fast_tier(self):
+        with FakeOpenRouterServer() as server:
+            client = OpenRouterClient(api_key="test-key", base_url=server.url)
+            previous = set_default_client(client)
+            try:
+                router = ModelRouter(routes={"default": "flagship", "sales_respond": "fast"}, tiers=TIERS)
+                team = MarketingTeam(observer_factory=NullObserver, verbose=False, router=router)
+                with tempfile.TemporaryDirectory() as tmp:
+                    team.discuss_marketing_plan("Test Product", {'language': 'english'},
+                                                output_path=os.path.join(tmp, "plan.docx"))
+            finally:
+                set_default_client(previous)
+                client.close()
+        self.assertEqual([request['model'] for request in server.requests],
+                         ["big-a", "small-a", "big-a", "big-a", "big-a", "big-a"])
+        routes = {route["stage"]: route["model"] for route in team.last_usage.routes()}
+        self.assertEqual(routes["sales"], "small-a")
+        self.assertEqual(routes["synthesis"], "big-a")
+
+if __name__ == '__main__':
+    unittest.main()
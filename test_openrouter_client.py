@@ -0,0 +1,76 @@
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient, get_default_client, set_default_client
+from sales_ai_agent import SalesAIAgent
+from marketing_ai_agent import MarketingAIAgent
+from stream_observers import MetricsObserver, observe
+from openrouter_errors import APIConnectionError
+from request_scheduler import RequestScheduler
+
+class TestOpenRouterClient(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Hello from the fake server").start()
+        self.client = OpenRouterClient(api_key="test-key", base_url=self.server.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_stream_chat_returns_full_text(self):
+        result = self.client.stream_chat([{"role": "user", "content": "Hi"}])
+        self.assertEqual(result, "Hello from the fake server")
+        self.assertEqual(self.server.requests[0]['model'], "anthropic/claude-3.5-sonnet")
+        self.assertTrue(self.server.requests[0]['stream'])
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.client.stream_chat([{"role": "user", "content": "Hi"}])
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(self.server.client_addresses), 1)
+
+    def test_pool_is_shared_across_threads(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url, pool_maxsize=2)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: client.stream_chat([{"role": "user", "content": "Hi"}]), range(24)))
+        client.close()
+        self.assertEqual(len(set(results)), 1)
+        self.assertLessEqual(len(self.server.client_addresses), 2)
+
+    def test_timeouts_are_passed_to_requests(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url, connect_timeout=1.5, read_timeout=30)
+        with patch('requests.Session.post', wraps=client._get_session().post) as mock_post:
+            client.stream_chat([{"role": "user", "content": "Hi"}])
+        self.assertEqual(mock_post.call_args[1]['timeout'], (1.5, 30))
+        client.close()
+
+    def test_observer_receives_stream_events(self):
+        observer = MetricsObserver("test")
+        with observe(observer):
+            self.client.stream_chat([{"role": "user", "content": "Hi"}])
+        self.assertEqual(observer.tokens, 4)
+        self.assertGreaterEqual(observer.chunks, 5)
+        self.assertGreater(observer.bytes_received, len("Hello from the fake server"))
+        self.assertIsNotNone(observer.time_to_first_token)
+        self.assertLessEqual(observer.time_to_first_token, observer.elapsed)
+        self.assertIsNone(observer.error)
+
+    def test_default_client_can_be_swapped(self):
+        previous = set_default_client(self.client)
+        try:
+            self.assertIs(get_default_client(), self.client)
+            self.assertEqual(SalesAIAgent().respond_to_agent("Hello"), "Hello from the fake server")
+            self.assertIn("Respond in english.", self.server.requests[-1]['messages'][-1]['content'])
+        finally:
+            set_default_client(previous)
+
+    def test_agent_raises_typed_connection_errors(self):
+        client = OpenRouterClient(api_key="test-key", base_url="http://127.0.0.1:1/unreachable", connect_timeout=1,
+                                  scheduler=RequestScheduler(max_retries=0))
+        with self.assertRaises(APIConnectionError):
+            MarketingAIAgent(client=client).suggest_budget_allocation(1000)
+        client.close()
+
+if __name__ == '__main__':
+    unittest.main()
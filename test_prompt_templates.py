@@ -0,0 +1,19 @@
+import unittest
+from marketing_ai_agent import CAMPAIGN_IDEA_TEMPLATE, MarketingAIAgent
+from prompt_templates import CACHE_CONTROL
+
+class TestPromptTemplates(unittest.TestCase):
+    def test_static_instructions_form_a_shared_cacheable_prefix(self):
+        agent = MarketingAIAgent()
+        first = agent._messages(agent._campaign_idea_prompt("Product A", "Growth", None), 'english', CAMPAIGN_IDEA_TEMPLATE)
+        second = agent._messages(agent._campaign_idea_prompt("Product B", "Growth", None), 'german', CAMPAIGN_IDEA_TEMPLATE)
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(first[0]['role'], 'system')
+        self.assertEqual(first[0]['content'][0]['cache_control'], CACHE_CONTROL)
+        self.assertNotIn("Product A", first[0]['content'][0]['text'])
+        self.assertEqual(first[1]['role'], 'user')
+        self.assertTrue(second[1]['content'].startswith("Respond in german."))
+        self.assertIn("Product B", second[1]['content'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from docx import Document
+from report_writer import ReportWriter, unique_report_path, _template_bytes
+from marketing_team import MarketingTeam, create_styled_document
+from openrouter_errors import AuthenticationError
+from stream_observers import NullObserver
+
+class TestReportWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def paragraphs(self, source):
+        return [(p.style.name, p.text) for p in Document(source).paragraphs]
+
+    def test_sections_are_saved_as_they_are_added(self):
+        path = os.path.join(self.tmp.name, "plan.docx")
+        writer = ReportWriter(path, language='german')
+        writer.add_section("Idea", "First line\n\nSecond line")
+        self.assertEqual(self.paragraphs(path), [
+            ("CustomTitle", "Marketing-Team-Diskussion"), ("CustomHeading", "Idea"),
+            ("CustomBody", "First line"), ("CustomBody", "Second line")])
+        writer.add_section("Feedback", "More")
+        self.assertEqual(len(self.paragraphs(path)), 6)
+        self.assertEqual(os.listdir(self.tmp.name), ["plan.docx"])
+
+    def test_in_memory_target_and_unique_paths(self):
+        stream = io.BytesIO()
+        writer = ReportWriter(stream)
+        writer.add_section("Idea", "Text")
+        self.assertEqual(stream.getvalue(), b"")
+        writer.save()
+        self.assertEqual(self.paragraphs(io.BytesIO(stream.getvalue()))[1], ("CustomHeading", "Idea"))
+        self.assertEqual(_template_bytes.cache_info().misses, 1)
+        self.assertNotEqual(unique_report_path(), unique_report_path())
+
+        path = create_styled_document([{"title": "A", "content": "B"}],
+                                      filename=os.path.join(self.tmp.name, "all.docx"))
+        self.assertEqual(self.paragraphs(path)[1:], [("CustomHeading", "A"), ("CustomBody", "B")])
+
+    def test_failed_plan_keeps_finished_sections(self):
+        path = os.path.join(self.tmp.name, "partial.docx")
+        team = MarketingTeam(observer_factory=NullObserver, verbose=False)
+        team.marketing_agent.generate_campaign_idea = MagicMock(return_value="Idea")
+        team.sales_agent.respond_to_agent = MagicMock(return_value="Sales")
+        team.strategy_agent.analyze_market_trends = MagicMock(side_effect=AuthenticationError("bad key", 401))
+
+        self.assertIsNone(team.discuss_marketing_plan("Test Product", {'language': 'english'}, output_path=path))
+        headings = [text for style, text in self.paragraphs(path) if style == "CustomHeading"]
+        self.assertEqual(headings, ["Initial Marketing Campaign Idea", "Sales Agent Feedback"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import time
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient
+from openrouter_errors import AuthenticationError, RateLimitError, ServerError, parse_retry_after
+from request_scheduler import RequestScheduler, TokenBucket
+from marketing_team import MarketingTeam
+from stream_observers import NullObserver
+
+class TestRequestScheduler(unittest.TestCase):
+    def test_backoff_uses_retry_after_or_jitter(self):
+        scheduler = RequestScheduler(base_delay=1.0, max_delay=8.0)
+        self.assertEqual(scheduler.backoff_delay(0, RateLimitError("slow down", 429, retry_after=3)), 3)
+        for attempt in range(6):
+            delay = scheduler.backoff_delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(8.0, 2 ** attempt))
+        self.assertEqual(parse_retry_after("2"), 2.0)
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_token_bucket_reports_wait_time(self):
+        bucket = TokenBucket(rate_per_minute=60)
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(2), 2.0, delta=0.1)
+
+    def test_retries_only_retryable_errors(self):
+        scheduler = RequestScheduler(max_retries=3, base_delay=0)
+        call = MagicMock(side_effect=[ServerError("boom", 502), ServerError("boom", 503), "ok"])
+        self.assertEqual(scheduler.run(call), "ok")
+        self.assertEqual(scheduler.stats()["retries"], 2)
+
+        call = MagicMock(side_effect=AuthenticationError("bad key", 401))
+        with self.assertRaises(AuthenticationError):
+            scheduler.run(call)
+        self.assertEqual(call.call_count, 1)
+
+    def test_concurrency_limit_is_global(self):
+        scheduler = RequestScheduler(max_concurrency=2)
+        lock, active, peak = threading.Lock(), [0], [0]
+
+        def call():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda _: scheduler.run(call), range(12)))
+        self.assertEqual(peak[0], 2)
+
+class TestClientRetries(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Recovered").start()
+        self.client = OpenRouterClient(api_key="test-key", base_url=self.server.url,
+                                       scheduler=RequestScheduler(max_retries=2, base_delay=0.01))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_rate_limited_call_is_retried(self):
+        self.server.fail_next(429, times=2, retry_after=0)
+        self.assertEqual(self.client.stream_chat([{"role": "user", "content": "Hi"}]), "Recovered")
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_errors_are_typed_after_retries_run_out(self):
+        self.server.fail_next(503, times=3)
+        with self.assertRaises(ServerError) as ctx:
+            self.client.stream_chat([{"role": "user", "content": "Hi"}])
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.server.fail_next(401)
+        with self.assertRaises(AuthenticationError):
+            self.client.stream_chat([{"role": "user", "content": "Hi"}])
+        self.assertEqual(len(self.server.requests), 4)
+
+class TestStageRetries(unittest.TestCase):
+    def test_failed_stage_is_retried_alone(self):
+        team = MarketingTeam(observer_factory=NullObserver, verbose=False, stage_retries=1, write_document=False)
+        team.marketing_agent.generate_campaign_idea = MagicMock(return_value="Idea")
+        team.sales_agent.respond_to_agent = MagicMock(side_effect=[RateLimitError("slow down", 429), "Sales"])
+        team.strategy_agent.analyze_market_trends = MagicMock(return_value="Trends")
+        team.analytics_agent.analyze_target_audience = MagicMock(return_value="Audience")
+        team.synthesize_plan = MagicMock(return_value="Plan")
+
+        content = team.discuss_marketing_plan("Test Product", {'language': 'english'})
+
+        self.assertEqual(content[1]['content'], "Sales")
+        self.assertEqual(team.sales_agent.respond_to_agent.call_count, 2)
+        self.assertEqual(team.marketing_agent.generate_campaign_idea.call_count, 2)
+
+    @patch('marketing_team.ReportWriter')
+    def test_non_retryable_error_fails_the_plan(self, mock_report_writer):
+        team = MarketingTeam(observer_factory=NullObserver, verbose=False)
+        team.marketing_agent.generate_campaign_idea = MagicMock(side_effect=AuthenticationError("bad key", 401))
+        self.assertIsNone(team.discuss_marketing_plan("Test Product", {'language': 'english'}))
+        self.assertEqual(team.marketing_agent.generate_campaign_idea.call_count, 1)
+        mock_report_writer.return_value.add_section.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient
+from response_cache import ResponseCache, bypass_cache, cache_key
+from stream_observers import MetricsObserver
+
+MESSAGES = [{"role": "user", "content": "Respond in english. Handle the Price objection."}]
+
+class TestResponseCache(unittest.TestCase):
+    def test_key_covers_model_language_and_messages(self):
+        key = cache_key("model-a", "english", MESSAGES)
+        self.assertEqual(key, cache_key("model-a", "english", [dict(MESSAGES[0])]))
+        self.assertNotEqual(key, cache_key("model-b", "english", MESSAGES))
+        self.assertNotEqual(key, cache_key("model-a", "german", MESSAGES))
+        self.assertNotEqual(key, cache_key("model-a", "english", [{"role": "user", "content": "Other"}]))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2)
+        cache.set("a", "A")
+        cache.set("b", "B")
+        cache.get("a")
+        cache.set("c", "C")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "A")
+        self.assertEqual(cache.get("c"), "C")
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResponseCache(ttl=10)
+        with patch('response_cache.time.time', return_value=1000):
+            cache.set("a", "A")
+        with patch('response_cache.time.time', return_value=1005):
+            self.assertEqual(cache.get("a"), "A")
+        with patch('response_cache.time.time', return_value=1011):
+            self.assertIsNone(cache.get("a"))
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "cache.sqlite")
+            cache = ResponseCache(db_path=db_path)
+            cache.set("a", "A")
+            cache.close()
+
+            cache = ResponseCache(db_path=db_path)
+            self.assertEqual(cache.get("a"), "A")
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            self.assertEqual(cache.get("a"), "A")
+            self.assertEqual(cache.stats()["memory_hits"], 1)
+            cache.close()
+
+class TestClientCaching(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Lead with value, not discounts.").start()
+        self.cache = ResponseCache()
+        self.client = OpenRouterClient(api_key="test-key", base_url=self.server.url, cache=self.cache)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.stream_chat(MESSAGES, language="english")
+        observer = MetricsObserver()
+        second = self.client.stream_chat(MESSAGES, language="english", observer=observer)
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(observer.tokens, 5)
+        self.assertIsNotNone(observer.time_to_first_token)
+
+    def test_bypass(self):
+        self.client.stream_chat(MESSAGES)
+        self.client.stream_chat(MESSAGES, use_cache=False)
+        with bypass_cache():
+            self.client.stream_chat(MESSAGES)
+        self.cache.bypass = True
+        self.client.stream_chat(MESSAGES)
+        self.assertEqual(len(self.server.requests), 4)
+
+if __name__ == '__main__':
+    unittest.main()
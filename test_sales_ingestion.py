@@ -0,0 +1,114 @@
+import os
+import csv
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from sales_ai_agent import SalesAIAgent
+from sales_ingestion import SalesAggregator, iter_csv_chunks, summarize_sales
+
+ROWS = [
+    # date, rep, region, amount, cohort, converted
+    ("2024-01-05", "ana", "north", "100", "2024-01", "yes"),
+    ("2024-01-20", "ben", "south", "200", "2024-01", "no"),
+    ("2024-02-03", "ana", "north", "150", "2024-02", "yes"),
+    ("2024-02-14", "ben", "south", "", "2024-02", "yes"),
+    ("2024-02-28", "cleo", "south", "250", "2024-02", "won"),
+    ("2024-04-01", "cleo", "north", "5000", "2024-04", "no"),
+]
+
+class TestSalesIngestion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "sales.csv")
+        with open(self.path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["date", "rep", "region", "amount", "cohort", "converted"])
+            writer.writerows(ROWS)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chunked_and_memory_mapped_reads_agree(self):
+        whole = summarize_sales(self.path).to_dict()
+        chunked = summarize_sales(self.path, chunk_rows=2, memory_map=True).to_dict()
+        self.assertEqual(whole, chunked)
+        self.assertEqual(whole["rows"], 5)
+        self.assertEqual(whole["skipped_rows"], 1)
+        self.assertEqual(whole["groups"]["rep"]["cleo"], (5250.0, 2))
+        self.assertEqual(whole["period_totals"], [("2024-01", 300.0, None), ("2024-02", 400.0, (400 - 300) / 300),
+                                                  ("2024-04", 5000.0, 11.5)])
+        self.assertEqual(whole["region_growth"], {"north": (5000 - 150) / 150})
+        self.assertEqual(whole["cohort_conversion"], {"2024-01": 0.5, "2024-02": 1.0, "2024-04": 0.0})
+        self.assertEqual(whole["largest"][0], (5000.0, "2024-04-01 / cleo / north"))
+
+    def test_quarters_and_missing_optional_columns(self):
+        chunks = list(iter_csv_chunks(self.path, columns={"amount": "amount", "date": "date"}))
+        self.assertEqual(set(chunks[0]), {"amount", "date"})
+        aggregator = SalesAggregator(period="quarter")
+        for chunk in chunks:
+            aggregator.add(chunk)
+        summary = aggregator.summary()
+        self.assertEqual(summary.groups["period"], {"2024-Q1": (700.0, 4), "2024-Q2": (5000.0, 1)})
+        self.assertEqual(summary.cohorts, {})
+
+    def test_rows_without_a_valid_date_are_left_out_of_periods(self):
+        with open(self.path, "a", newline="") as f:
+            csv.writer(f).writerows([("", "ana", "north", "900", "", ""), ("05/03/2024", "ben", "south", "50", "", ""),
+                                     ("2024-13-01", "ben", "south", "10", "", "")])
+        for period, expected in (("quarter", {"2024-Q1": (700.0, 4), "2024-Q2": (5000.0, 1)}),
+                                 ("month", {"2024-01": (300.0, 2), "2024-02": (400.0, 2), "2024-04": (5000.0, 1)})):
+            summary = summarize_sales(self.path, period=period)
+            self.assertEqual(summary.groups["period"], expected)
+            self.assertEqual(summary.invalid_dates, 3)
+            self.assertEqual(summary.rows, 8)
+            self.assertEqual(summary.groups["rep"]["ana"], (1150.0, 3))
+        self.assertEqual(summary.region_growth(), {"north": (5000 - 150) / 150})
+        self.assertIn("(3 deals without a valid date are not in any month)", summary.to_prompt())
+
+    def test_chunks_without_any_valid_date_or_cohort(self):
+        with open(self.path, "w", newline="") as f:
+            csv.writer(f).writerows([("amount", "date", "cohort", "converted"), ("10", "", "", "yes"),
+                                     ("20", "n/a", " ", "no"), ("30", "2024-05-02", "2024-05", "yes")])
+        for chunk_rows in (1, 2, 10):
+            summary = summarize_sales(self.path, period="quarter", chunk_rows=chunk_rows)
+            self.assertEqual(summary.groups["period"], {"2024-Q2": (30.0, 1)})
+            self.assertEqual(summary.invalid_dates, 2)
+            self.assertEqual(summary.cohorts, {"2024-05": (1.0, 1)})
+            self.assertEqual(summary.missing_cohorts, 2)
+        self.assertIn("(2 deals without a cohort are not in any cohort)", summary.to_prompt())
+
+    def test_prompt_when_refunds_cancel_out_sales(self):
+        aggregator = SalesAggregator()
+        aggregator.add({"amount": np.array([100.0, -100.0]), "region": np.array(["north", "south"])})
+        prompt = aggregator.summary().to_prompt()
+        self.assertIn("north: 100.00 (n/a of revenue, 1 deals)", prompt)
+
+    def test_summary_stays_bounded_for_many_groups(self):
+        aggregator = SalesAggregator(sample_size=1000)
+        rng = np.random.default_rng(1)
+        for _ in range(20):
+            size = 5000
+            aggregator.add({
+                "amount": rng.lognormal(5, 1, size),
+                "rep": np.char.add("rep", rng.integers(0, 500, size).astype(str)),
+                "date": np.char.add("2024-", np.char.zfill(rng.integers(1, 13, size).astype(str), 2)),
+            })
+        summary = aggregator.summary()
+        self.assertEqual(summary.rows, 100_000)
+        self.assertEqual(len(aggregator._reservoir.sample()), 1000)
+        self.assertAlmostEqual(summary.percentiles[50], np.exp(5), delta=np.exp(5) * 0.15)
+        prompt = summary.to_prompt(max_groups=5)
+        self.assertIn("Reps by revenue (top 5 of 500)", prompt)
+        self.assertLess(len(prompt), 2500)
+
+    def test_agent_sends_only_the_summary(self):
+        agent = SalesAIAgent()
+        with patch.object(agent, 'call_openrouter_api', return_value="Insights") as mock_call:
+            self.assertEqual(agent.analyze_sales_file(self.path), "Insights")
+        prompt = mock_call.call_args.args[0]
+        self.assertTrue(prompt.startswith("Sales performance summary:\nTransactions: 5"))
+        self.assertIn("2024-04: 5,000.00 (+1150.0%)", prompt)
+
+if __name__ == '__main__':
+    unittest.main()
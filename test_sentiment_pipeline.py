@@ -0,0 +1,117 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, patch
+from analytics_ai_agent import AnalyticsAIAgent
+from openrouter_errors import ServerError
+from sentiment_pipeline import LexiconScorer, iter_texts, text_hash
+
+TEXTS = [
+    "Great product, love it!",
+    "It arrived on Tuesday.",
+    "great product... LOVE it",
+    "Not bad, but the battery is weak.",
+    "Terrible support, total waste of money.",
+    "It arrived on Tuesday.",
+]
+
+def fake_model(skip=()):
+    """Label every item in a bulk request neutral, leaving out the texts in `skip` once."""
+    skipped = set()
+
+    def answer(prompt, language, template):
+        items = json.loads(prompt)
+        labels = {}
+        for key, text in items.items():
+            if text in skip and text not in skipped:
+                skipped.add(text)
+                continue
+            labels[key] = {"label": "neutral", "score": 0.1}
+        return "```json\n" + json.dumps(labels) + "\n```"
+    return answer
+
+class TestLexiconScorer(unittest.TestCase):
+    def test_only_unambiguous_texts_are_scored(self):
+        lexicon = LexiconScorer()
+        self.assertEqual(lexicon.score("Great product, love it!"), ("positive", 0.75))
+        self.assertEqual(lexicon.score("Terrible support, total waste of money.")[0], "negative")
+        self.assertIsNone(lexicon.score("Not bad, but the battery is weak."))
+        self.assertIsNone(lexicon.score("Good."))
+        self.assertEqual(text_hash("Great product, love it!"), text_hash("great product... LOVE it"))
+
+class TestBulkSentiment(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.agent = AnalyticsAIAgent()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_duplicates_and_obvious_texts_skip_the_model(self):
+        source = os.path.join(self.tmp.name, "reviews.jsonl")
+        with open(source, "w") as f:
+            f.writelines(json.dumps({"id": f"r{i}", "text": text}) + "\n" for i, text in enumerate(TEXTS))
+        output = os.path.join(self.tmp.name, "labels.jsonl")
+        with patch.object(self.agent, 'call_openrouter_api', side_effect=fake_model()) as mock_call:
+            stats = self.agent.analyze_sentiment_bulk(source, output)
+
+        self.assertEqual(mock_call.call_count, 1)
+        self.assertEqual(set(json.loads(mock_call.call_args.args[0]).values()),
+                         {"It arrived on Tuesday.", "Not bad, but the battery is weak."})
+        with open(output) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record["id"] for record in records], [f"r{i}" for i in range(6)])
+        self.assertEqual([record["source"] for record in records],
+                         ["lexicon", "model", "lexicon", "model", "lexicon", "model"])
+        self.assertEqual([record["duplicate"] for record in records], [False, False, True, False, False, True])
+        self.assertEqual(stats.total, 6)
+        self.assertEqual(stats.unique, 4)
+        self.assertEqual(stats.labels, {"positive": 2, "neutral": 3, "negative": 1})
+
+    def test_malformed_lines_are_skipped(self):
+        source = os.path.join(self.tmp.name, "reviews.jsonl")
+        with open(source, "w") as f:
+            f.write('{"id": "a", "text": "Great product"}\n{not json\n\n["a list"]\n{"text": "Slow shipping"}\n')
+        errors = []
+        texts = list(iter_texts(source, on_error=lambda record_id, error: errors.append(record_id)))
+        self.assertEqual(texts, [("a", "Great product"), (3, "Slow shipping")])
+        self.assertEqual(errors, ["reviews.jsonl:2", "reviews.jsonl:4"])
+        with self.assertLogs(level="WARNING") as logs:
+            self.assertEqual(len(list(iter_texts(source))), 2)
+        self.assertIn("Skipping invalid record reviews.jsonl:2", logs.output[0])
+
+    def test_items_left_out_are_asked_again_and_failures_are_recorded(self):
+        texts = ["It arrived on Tuesday.", "Plain box.", "Ships from Ohio."]
+        with patch.object(self.agent, 'call_openrouter_api', side_effect=fake_model(skip={"Plain box."})) as mock_call:
+            stats = self.agent.analyze_sentiment_bulk(texts, lexicon=False)
+        self.assertEqual(mock_call.call_count, 2)
+        self.assertEqual(json.loads(mock_call.call_args.args[0]), {"0": "Plain box."})
+        self.assertEqual(stats.sources, {"model": 3})
+
+        agent = AnalyticsAIAgent()
+        with patch.object(agent, 'call_openrouter_api', side_effect=ServerError("down", status_code=503)):
+            stats = agent.analyze_sentiment_bulk(texts, lexicon=False)
+        self.assertEqual(stats.sources, {"failed": 3})
+        self.assertEqual(stats.scored, 0)
+
+    def test_async_batches_and_stats_feed_the_audience_analysis(self):
+        texts = [f"Review number {i}" for i in range(10)]
+        model = fake_model()
+
+        async def _answer(prompt, language, template):
+            return model(prompt, language, template)
+
+        with patch.object(self.agent, 'acall_openrouter_api', new=AsyncMock(side_effect=_answer)) as mock_call:
+            stats = asyncio.run(self.agent.aanalyze_sentiment_bulk(texts, batch_size=4, concurrency=2))
+        self.assertEqual(mock_call.await_count, 3)
+        self.assertEqual(stats.distribution()["neutral"], 1.0)
+
+        with patch.object(self.agent, 'call_openrouter_api', return_value="Analysis") as mock_call:
+            self.agent.analyze_target_audience("Test Product", sentiment=stats)
+        self.assertIn("Customer sentiment over 10 texts (10 unique): positive 0.0%, neutral 100.0%",
+                      mock_call.call_args.args[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient
+from stream_observers import MetricsObserver, NullObserver
+from usage_tracking import UsageReport, usage_scope
+
+MESSAGES = [{"role": "user", "content": "Respond in english. Objection type: Price"}]
+
+class FailingObserver(NullObserver):
+    def on_token(self, text):
+        raise RuntimeError("subscriber gave up")
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Shared answer for every caller", chunk_size=4,
+                                           first_token_delay=0.2, chunk_delay=0.01).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_concurrent_identical_requests_share_one_stream(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url)
+        observers = [MetricsObserver() for _ in range(5)]
+        usage = UsageReport()
+
+        def call(observer):
+            with usage_scope(usage, "sales"):
+                return client.stream_chat(MESSAGES, observer=observer, language='english')
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(call, observers))
+        client.close()
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(set(results), {"Shared answer for every caller"})
+        self.assertEqual(sorted(result.coalesced for result in results), [False, True, True, True, True])
+        self.assertTrue(all(observer.tokens == 8 and observer.finished_at for observer in observers))
+        totals = usage.totals()
+        self.assertEqual((totals["calls"], totals["coalesced"]), (5, 4))
+        # Only the caller that started the request is billed for it
+        self.assertEqual(totals["completion_tokens"], next(r for r in results if not r.coalesced).completion_tokens)
+        self.assertEqual(client.single_flight.coalesced, 4)
+
+    def test_failing_subscriber_does_not_break_the_stream(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            failing = executor.submit(client.stream_chat, MESSAGES, observer=FailingObserver())
+            healthy = executor.submit(client.stream_chat, MESSAGES, observer=NullObserver())
+            with self.assertRaises(RuntimeError):
+                failing.result()
+            self.assertEqual(healthy.result(), "Shared answer for every caller")
+        client.close()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_cancelled_async_subscriber_leaves_the_stream_to_others(self):
+        async def _run():
+            async with AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url) as client:
+                first = asyncio.ensure_future(client.stream_chat(MESSAGES, observer=NullObserver()))
+                second = asyncio.ensure_future(client.stream_chat(MESSAGES, observer=NullObserver()))
+                await asyncio.sleep(0.05)
+                first.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await first
+                return await second
+        result = asyncio.run(_run())
+        self.assertEqual(result, "Shared answer for every caller")
+        self.assertTrue(result.coalesced)
+        self.assertEqual(len(self.server.requests), 1)
+
+if __name__ == '__main__':
+    unittest.main()
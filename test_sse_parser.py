@@ -0,0 +1,119 @@
+import json
+import asyncio
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient
+from openrouter_errors import ServerError
+from sse_parser import ChatStreamParser, iter_deltas
+from stream_observers import MetricsObserver, NullObserver
+
+MESSAGES = [{"role": "user", "content": "Respond in english. Say hello."}]
+# Keep-alive comments, CRLF line endings, an event field, a multi-line data field and an event after [DONE]
+STREAM = (b": OPENROUTER PROCESSING\r\n\r\n"
+          b'data: {"id": "gen-1", "choices": [{"delta": {"content": "Hel"}}]}\r\n\r\n'
+          b"event: message\r\n"
+          b'data: {"id": "gen-1",\r\n'
+          b'data: "choices": [{"delta": {"content": "lo"}, "finish_reason": "stop"}],\r\n'
+          b'data: "usage": {"prompt_tokens": 3, "completion_tokens": 2}}\r\n\r\n'
+          b"data: [DONE]\r\n\r\n"
+          b'data: {"choices": [{"delta": {"content": " ignored"}}]}\r\n\r\n')
+
+def delta_line(content, finish_reason=None):
+    return b"data: " + json.dumps({"id": "gen-1", "choices": [{"delta": {"content": content}, "finish_reason": finish_reason}]}).encode()
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(STREAM)))
+        self.end_headers()
+        self.wfile.write(STREAM)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestClientStreams(unittest.TestCase):
+    """Both clients parse the raw stream through ChatStreamParser."""
+
+    def setUp(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StreamHandler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/api/v1/chat/completions"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def assert_parsed(self, result):
+        self.assertEqual(result, "Hello")
+        self.assertEqual(result.response_id, "gen-1")
+        self.assertEqual((result.prompt_tokens, result.completion_tokens), (3, 2))
+
+    def test_sync_client(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.url, cache=None, single_flight=False)
+        try:
+            self.assert_parsed(client.stream_chat(MESSAGES, observer=NullObserver()))
+        finally:
+            client.close()
+
+    def test_async_client(self):
+        async def _run():
+            async with AsyncOpenRouterClient(api_key="test-key", base_url=self.url, cache=None) as client:
+                return await client.stream_chat(MESSAGES, observer=NullObserver())
+
+        self.assert_parsed(asyncio.run(_run()))
+
+class TestChatStreamParser(unittest.TestCase):
+    def test_observer_and_malformed_chunks(self):
+        observer = MetricsObserver()
+        parser = ChatStreamParser(observer)
+        for line in [delta_line("a"), b"", b"data: {not json", b"", delta_line("b"), b""]:
+            parser.feed_line(line)
+        self.assertEqual(parser.finish(), "ab")
+        self.assertEqual(observer.tokens, 2)
+        self.assertEqual(observer.chunks, 2)
+        self.assertIsNotNone(observer.finished_at)
+
+    def test_trailing_event_and_done(self):
+        parser = ChatStreamParser()
+        self.assertEqual(parser.feed_line(delta_line("a")), None)
+        self.assertEqual(parser.feed_line(b""), "a")
+        self.assertEqual(parser.feed_line(delta_line("b", "stop")), None)
+        # An event the stream ends without a blank line after is still handled
+        self.assertEqual(parser.finish(), "ab")
+        self.assertEqual(parser.finish_reason, "stop")
+        for line in [b"data: [DONE]", b"", delta_line("c"), b""]:
+            parser.feed_line(line)
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.text, "ab")
+
+    def test_iter_deltas_yields_each_delta_as_it_completes(self):
+        fed = []
+
+        def lines():
+            for line in STREAM.split(b"\r\n"):
+                fed.append(line)
+                yield line
+
+        parser = ChatStreamParser()
+        deltas = iter_deltas(lines(), parser)
+        self.assertEqual(next(deltas), "Hel")
+        # Only the first event has been read so far
+        self.assertEqual(fed[-1], b"")
+        self.assertEqual(len(fed), 4)
+        self.assertEqual(next(deltas), "lo")
+        self.assertEqual(list(deltas), [])
+        # The event after [DONE] is read, so the connection is drained, but not yielded
+        self.assertEqual(fed, STREAM.split(b"\r\n"))
+        self.assertEqual((parser.text, parser.response_id, parser.finish_reason), ("Hello", "gen-1", "stop"))
+
+    def test_error_event_raises(self):
+        parser = ChatStreamParser()
+        parser.feed_line(b'data: {"error": {"code": 502, "message": "upstream"}}')
+        with self.assertRaises(ServerError):
+            parser.feed_line(b"")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient, set_default_client
+from marketing_team import MarketingTeam
+from model_router import DEFAULT_TIERS, ModelRouter
+from pipeline import Stage, run_stage_graph
+from base_ai_agent import NO_RESPONSE
+from stage_store import StageStore
+from stream_observers import NullObserver
+
+class TestStageStore(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Plan section").start()
+        self.client = OpenRouterClient(api_key="test-key", base_url=self.server.url)
+        self.previous_client = set_default_client(self.client)
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        set_default_client(self.previous_client)
+        self.client.close()
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def team(self, store, router=None):
+        return MarketingTeam(observer_factory=NullObserver, verbose=False, write_document=False, stage_store=store,
+                             router=router)
+
+    def test_budget_change_only_recomputes_synthesis(self):
+        team = self.team(StageStore())
+        self.assertIsNotNone(team.discuss_marketing_plan("Widget", {'budget': '$1000'}))
+        self.assertEqual(len(self.server.requests), 6)
+
+        sections = team.discuss_marketing_plan("Widget", {'budget': '$2000'})
+        self.assertEqual(len(sections), 6)
+        self.assertEqual(len(self.server.requests), 7)
+        self.assertIn("$2000", self.server.requests[-1]['messages'][-1]['content'])
+        self.assertEqual(team.last_usage.totals()["stage_reuses"], 5)
+
+    def test_run_resumes_after_crash(self):
+        db_path = os.path.join(self.tmp.name, "stages.db")
+        team = self.team(StageStore(db_path))
+        with mock.patch.object(team.analytics_agent, 'analyze_target_audience', side_effect=RuntimeError("crash")):
+            self.assertIsNone(team.discuss_marketing_plan("Widget", {}))
+        team.stage_store.close()
+        self.assertEqual(len(self.server.requests), 3)
+
+        resumed = self.team(StageStore(db_path))
+        self.assertIsNotNone(resumed.discuss_marketing_plan("Widget", {}))
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual(sorted(stage for stage, totals in resumed.last_usage.stages().items()
+                                if totals["stage_reuses"]), ["marketing", "sales", "strategy"])
+        resumed.stage_store.close()
+
+    def test_routing_change_recomputes_stages(self):
+        store = StageStore()
+        self.assertIsNotNone(self.team(store, ModelRouter()).discuss_marketing_plan("Widget", {}))
+        self.assertIsNotNone(self.team(store, ModelRouter()).discuss_marketing_plan("Widget", {}))
+        self.assertEqual(len(self.server.requests), 6)
+
+        router = ModelRouter(routes={"default": "fast"}, tiers=DEFAULT_TIERS)
+        self.assertIsNotNone(self.team(store, router).discuss_marketing_plan("Widget", {}))
+        self.assertEqual(len(self.server.requests), 12)
+        self.assertEqual(self.server.requests[-1]["model"], DEFAULT_TIERS["fast"][0])
+
+    def test_placeholders_are_not_stored_and_outputs_expire(self):
+        db_path = os.path.join(self.tmp.name, "stages.db")
+        store = StageStore(db_path, ttl=60)
+        store.put("empty", "sales", f"Sales\n{NO_RESPONSE}")
+        self.assertIsNone(store.get("empty"))
+        store.put("kept", "sales", "Sales plan")
+        self.assertEqual(store.get("kept"), "Sales plan")
+        with mock.patch("stage_store.time.time", return_value=time.time() + 61):
+            self.assertIsNone(store.get("kept"))
+        store.close()
+
+        reopened = StageStore(db_path, ttl=60)
+        with mock.patch("stage_store.time.time", return_value=time.time() + 61):
+            self.assertIsNone(reopened.get("kept"))
+        self.assertEqual(reopened.get("kept"), "Sales plan")
+        reopened.close()
+
+    def test_stage_graph_reuses_stages_with_unchanged_inputs(self):
+        calls = []
+
+        def stage(name, output):
+            async def run(inputs):
+                calls.append(name)
+                return output(inputs)
+            return run
+
+        stages = [
+            Stage("a", "A", stage("a", lambda inputs: "a"), params=("product",)),
+            Stage("b", "B", stage("b", lambda inputs: inputs["a"] + "b"), deps=("a",), params=("budget",)),
+            Stage("c", "C", stage("c", lambda inputs: inputs["a"] + "c"), deps=("a",)),
+        ]
+        store = StageStore()
+        first = asyncio.run(run_stage_graph(stages, store=store, params={"product": "x", "budget": 1}))
+        second = asyncio.run(run_stage_graph(stages, store=store, params={"product": "x", "budget": 2}))
+        self.assertEqual(first, second)
+        self.assertEqual(sorted(calls), ["a", "b", "b", "c"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+import os
+import json
+import pstats
+import logging
+import tempfile
+import threading
+import unittest
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient, set_default_client
+from marketing_team import MarketingTeam
+from stream_observers import NullObserver
+from tracing import FileSpanExporter, Tracer, set_tracer, span
+from logging_setup import configure_logging, log_response, stop_logging
+from profiling import PlanProfiler
+from batch_calls import fan_out
+from single_flight import SingleFlight
+
+def read_spans(path):
+    with open(path) as f:
+        return [span for line in f for resource in json.loads(line)["resourceSpans"]
+                for scope in resource["scopeSpans"] for span in scope["spans"]]
+
+def attributes(span):
+    return {item["key"]: next(iter(item["value"].values())) for item in span["attributes"]}
+
+class _BlockedExporter:
+    def __init__(self):
+        self.release = threading.Event()
+
+    def export(self, spans):
+        self.release.wait(5)
+
+    def shutdown(self):
+        pass
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.tmp.name, "spans.jsonl")
+        self.tracer = Tracer(FileSpanExporter(self.trace_file), flush_interval=0.05)
+        self.previous = set_tracer(self.tracer)
+
+    def tearDown(self):
+        set_tracer(self.previous)
+        self.tracer.shutdown()
+        self.tmp.cleanup()
+
+    def test_plan_stage_and_http_spans_nest(self):
+        server = FakeOpenRouterServer(response_text="Agent output").start()
+        client = OpenRouterClient(api_key="test-key", base_url=server.url, single_flight=False)
+        previous = set_default_client(client)
+        try:
+            team = MarketingTeam(observer_factory=NullObserver, verbose=False, write_document=False,
+                                 stage_store=False)
+            team.discuss_marketing_plan("Test Product", {'language': 'english'})
+        finally:
+            set_default_client(previous)
+            client.close()
+            server.stop()
+        self.assertTrue(self.tracer.flush())
+
+        spans = read_spans(self.trace_file)
+        by_name = {}
+        for item in spans:
+            by_name.setdefault(item["name"], []).append(item)
+        plan, = by_name["plan"]
+        self.assertEqual(attributes(plan)["plan.status"], "completed")
+        self.assertEqual({item["traceId"] for item in spans}, {plan["traceId"]})
+        stages = {attributes(item)["stage"]: item for item in by_name["stage"]}
+        self.assertEqual(set(stages), {"marketing", "sales", "strategy", "analytics", "final_marketing", "synthesis"})
+        self.assertTrue(all(item["parentSpanId"] == plan["spanId"] for item in stages.values()))
+        stage_ids = {item["spanId"] for item in stages.values()}
+        chats = by_name["openrouter.chat"]
+        self.assertEqual(len(chats), 6)
+        self.assertTrue(all(item["parentSpanId"] in stage_ids for item in chats))
+        chat = attributes(chats[0])
+        self.assertEqual(chat["llm.model"], "anthropic/claude-3.5-sonnet")
+        self.assertEqual(chat["llm.retries"], "0")
+        self.assertIn("llm.time_to_first_token", chat)
+
+    def test_errors_mark_the_span_and_a_stuck_exporter_never_blocks(self):
+        with self.assertRaises(ValueError), span("work"):
+            raise ValueError("boom")
+        self.assertTrue(self.tracer.flush())
+        failed, = read_spans(self.trace_file)
+        self.assertEqual(failed["status"], {"code": 2, "message": "ValueError: boom"})
+
+        exporter = _BlockedExporter()
+        stuck = Tracer(exporter, max_queue=2, batch_size=1, flush_interval=0.01)
+        set_tracer(stuck)
+        for _ in range(20):
+            with span("fast"):
+                pass
+        self.assertGreater(stuck.dropped, 0)
+        exporter.release.set()
+        set_tracer(self.tracer)
+        stuck.shutdown()
+
+class TestLoggingAndProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = logging.getLogger()
+        self.saved = (list(root.handlers), root.level)
+
+    def tearDown(self):
+        stop_logging()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in self.saved[0]:
+            root.addHandler(handler)
+        root.setLevel(self.saved[1])
+        self.tmp.cleanup()
+
+    def test_queued_logging_truncates_long_messages(self):
+        path = os.path.join(self.tmp.name, "run.log")
+        configure_logging("DEBUG", path, max_message_chars=100)
+        logging.info("x" * 5000)
+        log_response("Sales Agent", "y" * 1000)
+        log_response("Marketing Agent", "skipped", sample_rate=0.0)
+        stop_logging()
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith("x" * 100 + "... [4900 more chars]"))
+        self.assertIn("Sales Agent response: " + "y" * 78, lines[1])
+        self.assertLess(len(lines[1]), 250)
+
+    def test_profilers_write_one_file_per_run(self):
+        def busy():
+            return sum(i * i for i in range(200000))
+
+        with PlanProfiler(self.tmp.name, 'cprofile').profile() as path:
+            busy()
+        self.assertTrue(pstats.Stats(path).total_calls > 0)
+
+        def other_plan():
+            return [sum(i * i for i in range(200000)) for _ in range(5)]
+
+        # Only the plan's own threads are sampled, not another plan running at the same time
+        with PlanProfiler(self.tmp.name, 'sample', interval=0.001).profile() as path:
+            stranger = threading.Thread(target=other_plan)
+            stranger.start()
+            fan_out(lambda key: [busy() for _ in range(3)], range(2), 2)
+            stranger.join()
+        with open(path) as f:
+            stacks = f.read()
+        self.assertRegex(stacks, r"profiling\.py:followed;.*test_tracing\.py:busy")
+        self.assertNotIn("other_plan", stacks)
+
+    def test_sampled_plans_include_their_single_flight_requests(self):
+        def fetch(observer):
+            observer.on_complete("done")
+            return sum(i * i for i in range(2000000))
+
+        flights = SingleFlight()
+        with PlanProfiler(self.tmp.name, interval=0.001).profile() as path:
+            flights.run("key", fetch, NullObserver())
+        flights.close()
+        with open(path) as f:
+            self.assertRegex(f.read(), r"single_flight\.py:_fly;.*test_tracing\.py:fetch")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+from docx import Document
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterClient, set_default_client
+from marketing_team import MarketingTeam
+from async_marketing_team import AsyncMarketingTeam
+from analytics_ai_agent import AnalyticsAIAgent
+from stream_observers import NullObserver
+
+def headings(path):
+    return [p.text for p in Document(path).paragraphs if p.style.name in ("CustomTitle", "CustomHeading")]
+
+def user_messages(server):
+    return [request["messages"][-1]["content"] for request in server.requests]
+
+class TestTranslationStage(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Agent output").start()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.stop()
+        self.tmp.cleanup()
+
+    def test_plan_runs_once_and_is_translated(self):
+        # Every section reads the same here, so keep identical translations from being coalesced
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url, single_flight=False)
+        previous = set_default_client(client)
+        try:
+            team = MarketingTeam(observer_factory=NullObserver, verbose=False, stage_store=False,
+                                 languages=['english', 'german'])
+            content = team.discuss_marketing_plan("Test Product", {'language': 'german'},
+                                                  output_path=os.path.join(self.tmp.name, "plan.docx"))
+        finally:
+            set_default_client(previous)
+            client.close()
+
+        # Six pipeline calls in the pivot language, then one translation per section
+        messages = user_messages(self.server)
+        self.assertEqual(len(messages), 12)
+        self.assertEqual(sum(m.startswith("Respond in english.") for m in messages), 6)
+        self.assertEqual(sum(m.startswith("Respond in german.") for m in messages), 6)
+        self.assertEqual(content.status, "completed")
+        self.assertEqual(len(content.translations['german']), 6)
+        german = content.documents['german']
+        self.assertEqual(german, os.path.join(self.tmp.name, "plan_german.docx"))
+        self.assertEqual(headings(german)[:3], ["Marketing-Team-Diskussion", "Erste Idee für die Marketingkampagne",
+                                                "Rückmeldung des Vertriebsagenten"])
+        self.assertEqual(headings(os.path.join(self.tmp.name, "plan.docx"))[0], "Marketing Team Discussion")
+
+    def test_async_team_translates_in_parallel(self):
+        async def _run():
+            client = AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url)
+            async with AsyncMarketingTeam(client=client, write_document=False, verbose=False, stage_store=False,
+                                          languages=['german', 'english']) as team:
+                return await team.discuss_marketing_plan("Test Product", {'language': 'english'})
+
+        content = asyncio.run(_run())
+        self.assertEqual(content.translations['english'][0]['title'], "Initial Marketing Campaign Idea")
+        self.assertEqual(sum(m.startswith("Respond in german.") for m in user_messages(self.server)), 6)
+
+class TestAnalyticsLanguage(unittest.TestCase):
+    def test_target_audience_analysis_uses_the_requested_language(self):
+        agent = AnalyticsAIAgent()
+        with patch.object(agent, 'call_openrouter_api', return_value="Analyse") as mock_call:
+            agent.analyze_target_audience("Test Product", language='german')
+        self.assertEqual(mock_call.call_args.kwargs['language'], 'german')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from fake_openrouter_server import FakeOpenRouterServer
+from openrouter_client import OpenRouterClient, AsyncOpenRouterClient, set_default_client
+from request_scheduler import RequestScheduler
+from response_cache import ResponseCache
+from marketing_team import MarketingTeam
+from async_marketing_team import AsyncMarketingTeam
+from stream_observers import NullObserver
+from usage_tracking import CompletionResult, UsageReport, usage_scope
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+class TestCompletionResult(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="three word answer", first_token_delay=0.05).start()
+        self.client = OpenRouterClient(api_key="test-key", base_url=self.server.url, cache=ResponseCache(),
+                                       scheduler=RequestScheduler(max_retries=2, base_delay=0.01))
+
+    def tearDown(self):
+        self.client.close()
+        self.server.stop()
+
+    def test_result_carries_usage_timing_and_retries(self):
+        self.server.fail_next(503)
+        result = self.client.stream_chat(MESSAGES)
+
+        self.assertIsInstance(result, CompletionResult)
+        self.assertEqual(result, "three word answer")
+        self.assertEqual((result.prompt_tokens, result.completion_tokens, result.total_tokens), (10, 3, 13))
+        self.assertTrue(result.response_id)
+        self.assertEqual(result.retries, 1)
+        self.assertFalse(result.usage_estimated)
+        self.assertGreaterEqual(result.time_to_first_token, 0.05)
+        self.assertGreaterEqual(result.latency, result.time_to_first_token)
+
+        cached = self.client.stream_chat(MESSAGES)
+        self.assertTrue(cached.cached)
+        self.assertEqual(cached.total_tokens, 0)
+
+    def test_usage_scope_records_sync_and_async_calls(self):
+        report = UsageReport()
+        with usage_scope(report, "sales"):
+            self.client.stream_chat(MESSAGES, use_cache=False)
+
+        async def _run():
+            async with AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url) as client:
+                with usage_scope(report, "strategy"):
+                    await client.stream_chat(MESSAGES)
+        asyncio.run(_run())
+
+        stages = report.stages()
+        self.assertEqual(stages["sales"]["total_tokens"], 13)
+        self.assertEqual(stages["strategy"]["calls"], 1)
+        self.assertEqual(report.totals()["prompt_tokens"], 20)
+
+class TestPlanUsage(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenRouterServer(response_text="Agent output").start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_teams_roll_usage_up_per_stage(self):
+        client = OpenRouterClient(api_key="test-key", base_url=self.server.url)
+        previous_client = set_default_client(client)
+        team = MarketingTeam(observer_factory=NullObserver, verbose=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            team.discuss_marketing_plan("Test Product", {'language': 'english'}, output_path=os.path.join(tmp, "plan.docx"))
+        set_default_client(previous_client)
+        client.close()
+
+        async def _run():
+            async_client = AsyncOpenRouterClient(api_key="test-key", base_url=self.server.url)
+            async with AsyncMarketingTeam(client=async_client, write_document=False, verbose=False) as async_team:
+                await async_team.discuss_marketing_plan("Test Product", {'language': 'english'})
+                return async_team.last_usage
+        async_usage = asyncio.run(_run())
+
+        for usage in (team.last_usage, async_usage):
+            self.assertEqual(sorted(usage.stages()), sorted(
+                ["marketing", "sales", "strategy", "analytics", "final_marketing", "synthesis"]))
+            self.assertEqual(usage.totals()["calls"], 6)
+            self.assertEqual(usage.totals()["completion_tokens"], 6 * 2)
+        # Every call of the async plan reuses an instruction prefix the sync plan already sent.
+        self.assertGreater(team.last_usage.totals()["cached_prompt_tokens"], 0)
+        self.assertEqual(async_usage.stages()["synthesis"]["cached_prompt_tokens"],
+                         team.last_usage.stages()["synthesis"]["prompt_tokens"] - 10)
+        self.assertGreater(async_usage.prompt_cache_hit_rate(), team.last_usage.prompt_cache_hit_rate())
+
+        batch = UsageReport(plans=0)
+        batch.merge(team.last_usage)
+        batch.merge(async_usage)
+        exported = json.loads(batch.to_json())
+        self.assertEqual(exported["plans"], 2)
+        self.assertEqual(exported["stages"]["sales"]["calls"], 2)
+        metrics = batch.to_prometheus()
+        self.assertIn("marketmind_plans_total 2", metrics)
+        self.assertIn('marketmind_stage_completion_tokens_total{stage="synthesis"} 4', metrics)
+        self.assertIn('marketmind_stage_cached_prompt_tokens_total{stage="synthesis"}', metrics)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+import os
+import json
+import atexit
+import time
+import queue
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+import requests
+
+SERVICE_NAME = "marketmind-maestro"
+# OTLP span kinds
+SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    """One timed operation of a trace, with attributes; ended by the span() context manager."""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes",
+                 "status", "message")
+
+    def __init__(self, name, kind, trace_id, parent_id, attributes):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.status = "unset"
+        self.message = None
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_error(self, error):
+        self.status = "error"
+        self.message = f"{type(error).__name__}: {error}"
+        self.set_attribute("http.status_code", getattr(error, "status_code", None))
+
+    @property
+    def duration(self):
+        return (self.end_ns - self.start_ns) / 1e9 if self.end_ns else None
+
+    def to_otlp(self):
+        """The span in OTLP/JSON form."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": {"unset": 0, "ok": 1, "error": 2}[self.status]},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.message:
+            span["status"]["message"] = self.message
+        return span
+
+
+class _NoopSpan:
+    """Stands in for a Span while tracing is off, so instrumented code costs next to nothing."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def set_error(self, error):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def export_request(spans, service_name=SERVICE_NAME):
+    """An OTLP/JSON ExportTraceServiceRequest holding `spans`."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{"scope": {"name": "marketmind"}, "spans": [span.to_otlp() for span in spans]}],
+    }]}
+
+
+class FileSpanExporter:
+    """Appends each batch of spans to a file as one OTLP/JSON line (the OpenTelemetry Collector file format)."""
+
+    def __init__(self, path, service_name=SERVICE_NAME):
+        self.path = path
+        self.service_name = service_name
+
+    def export(self, spans):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(export_request(spans, self.service_name)) + "\n")
+
+    def shutdown(self):
+        pass
+
+
+class OTLPHttpExporter:
+    """Posts batches of spans as OTLP/JSON to an OTLP/HTTP endpoint such as http://localhost:4318/v1/traces."""
+
+    def __init__(self, endpoint, headers=None, timeout=5.0, service_name=SERVICE_NAME):
+        self.endpoint = endpoint
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.timeout = timeout
+        self.service_name = service_name
+        self._session = requests.Session()
+
+    def export(self, spans):
+        response = self._session.post(self.endpoint, data=json.dumps(export_request(spans, self.service_name)),
+                                      headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+
+    def shutdown(self):
+        self._session.close()
+
+
+class Tracer:
+    """Hands finished spans to an exporter on a background thread.
+
+    Ending a span only puts it on a bounded queue; a daemon thread exports
+    them in batches of up to `batch_size` at least every `flush_interval`
+    seconds. When the exporter falls behind and the queue is full, new
+    spans are dropped (and counted) rather than blocking the caller.
+    """
+
+    def __init__(self, exporter, max_queue=10000, batch_size=256, flush_interval=1.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._export_failed = False
+        self._thread = threading.Thread(target=self._worker, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls):
+        """A Tracer for OPENROUTER_TRACE_FILE and/or OPENROUTER_TRACE_ENDPOINT, or None when neither is set."""
+        exporters = []
+        if os.environ.get("OPENROUTER_TRACE_FILE"):
+            exporters.append(FileSpanExporter(os.environ["OPENROUTER_TRACE_FILE"]))
+        if os.environ.get("OPENROUTER_TRACE_ENDPOINT"):
+            exporters.append(OTLPHttpExporter(os.environ["OPENROUTER_TRACE_ENDPOINT"]))
+        if not exporters:
+            return None
+        return cls(exporters[0] if len(exporters) == 1 else _FanOutExporter(exporters))
+
+    def finish(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        # The queue carries spans, flush() events, and None to stop
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = False
+            if isinstance(item, Span):
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            self._export(batch)
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+
+    def _export(self, batch):
+        if not batch:
+            return
+        try:
+            self.exporter.export(batch)
+            self._export_failed = False
+        except Exception as e:
+            # Warn once per outage rather than once per batch
+            if not self._export_failed:
+                logging.warning(f"Exporting {len(batch)} trace spans failed: {e}")
+            self._export_failed = True
+
+    def flush(self, timeout=5.0):
+        """Export every span ended so far; returns False if that took longer than `timeout`."""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def shutdown(self, timeout=5.0):
+        self.flush(timeout)
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self.exporter.shutdown()
+
+
+class _FanOutExporter:
+    def __init__(self, exporters):
+        self.exporters = exporters
+
+    def export(self, spans):
+        for exporter in self.exporters:
+            exporter.export(spans)
+
+    def shutdown(self):
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+
+_UNSET = object()
+_tracer = _UNSET
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """The process-wide Tracer, configured from the environment on first use (None when tracing is off)."""
+    global _tracer
+    if _tracer is _UNSET:
+        with _tracer_lock:
+            if _tracer is _UNSET:
+                _tracer = Tracer.from_env()
+                if _tracer is not None:
+                    atexit.register(_tracer.shutdown)
+    return _tracer
+
+
+def set_tracer(tracer):
+    """Replace the process-wide Tracer (None turns tracing off) and return the previous one."""
+    global _tracer
+    with _tracer_lock:
+        previous, _tracer = _tracer, tracer
+    return None if previous is _UNSET else previous
+
+
+def current_span():
+    """The span active in this thread or task, or a no-op span."""
+    return _current_span.get() or NOOP_SPAN
+
+
+@contextmanager
+def span(name, kind="internal", **attributes):
+    """Time the enclosed block as a child of the current span.
+
+    Yields the Span so callers can add attributes as they learn them; an
+    exception marks it as failed and propagates. Spans nest through a
+    context variable, so they follow work into asyncio tasks and into
+    threads started with a copied context (batch_calls.fan_out).
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    current = Span(name, kind, parent.trace_id if parent else os.urandom(16).hex(),
+                   parent.span_id if parent else None, attributes)
+    reset = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(e)
+        raise
+    finally:
+        _current_span.reset(reset)
+        current.end_ns = time.time_ns()
+        tracer.finish(current)
+
+
+def completion_attributes(result):
+    """Span attributes for a CompletionResult."""
+    return {
+        "llm.model": result.model,
+        "llm.response_id": result.response_id,
+        "llm.prompt_tokens": result.prompt_tokens,
+        "llm.completion_tokens": result.completion_tokens,
+        "llm.cached_prompt_tokens": result.cached_prompt_tokens,
+        "llm.time_to_first_token": result.time_to_first_token,
+        "llm.retries": result.retries,
+        "llm.hedges_issued": result.hedges_issued,
+        "llm.cached": result.cached,
+        "llm.coalesced": result.coalesced,
+        "llm.usage_estimated": result.usage_estimated,
+    }
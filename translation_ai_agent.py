@@ -0,0 +1,32 @@
+from base_ai_agent import BaseAIAgent
+from prompt_templates import PromptTemplate
+from report_writer import localized_title
+
+TRANSLATE_TEMPLATE = PromptTemplate("translate", """
+Translate the section of a marketing plan given in the user message into the requested language.
+Keep its structure, numbering, figures, product and brand names, and its tone. Reply with the translated
+section only, without any note about the translation.
+""")
+
+class TranslationAIAgent(BaseAIAgent):
+    def translate_sections(self, sections, language, source_language='english', concurrency=6):
+        """Translate finished plan sections into `language`, one concurrent call per section.
+
+        Headings are taken from the localized section titles, so only the
+        section bodies go through the model.
+        """
+        answers = self.call_many(self._tasks(sections, source_language), 'fan_out', concurrency, language)
+        return self._translated(sections, answers, language)
+
+    async def atranslate_sections(self, sections, language, source_language='english', concurrency=6):
+        """Async version of translate_sections."""
+        answers = await self.acall_many(self._tasks(sections, source_language), 'fan_out', concurrency, language)
+        return self._translated(sections, answers, language)
+
+    def _tasks(self, sections, source_language):
+        return {str(i): (f"Source language: {source_language}\n\n{section['content']}", TRANSLATE_TEMPLATE)
+                for i, section in enumerate(sections)}
+
+    def _translated(self, sections, answers, language):
+        return [{"title": localized_title(section['title'], language), "content": answers[str(i)]}
+                for i, section in enumerate(sections)]
@@ -0,0 +1,254 @@
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+class CompletionResult(str):
+    """Text of one API call plus its accounting data.
+
+    Subclasses str so agent methods keep returning something that formats,
+    concatenates and compares like the plain response text.
+    """
+
+    def __new__(cls, text, response_id=None, model=None, prompt_tokens=0, completion_tokens=0,
+                time_to_first_token=None, latency=0.0, retries=0, cached=False, usage_estimated=False,
+                cached_prompt_tokens=0, coalesced=False, hedges_issued=0, hedges_won=0):
+        result = super().__new__(cls, text)
+        result.response_id = response_id
+        result.model = model
+        result.prompt_tokens = prompt_tokens or 0
+        result.completion_tokens = completion_tokens or 0
+        result.cached_prompt_tokens = cached_prompt_tokens or 0
+        result.time_to_first_token = time_to_first_token
+        result.latency = latency
+        result.retries = retries
+        result.cached = cached
+        result.coalesced = coalesced
+        result.hedges_issued = hedges_issued
+        result.hedges_won = hedges_won
+        result.usage_estimated = usage_estimated
+        return result
+
+    @property
+    def text(self):
+        return str(self)
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def metadata(self):
+        return {
+            "response_id": self.response_id,
+            "model": self.model,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "total_tokens": self.total_tokens,
+            "time_to_first_token": self.time_to_first_token,
+            "latency": self.latency,
+            "retries": self.retries,
+            "cached": self.cached,
+            "coalesced": self.coalesced,
+            "hedges_issued": self.hedges_issued,
+            "hedges_won": self.hedges_won,
+            "usage_estimated": self.usage_estimated,
+        }
+
+
+def _empty_totals():
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_prompt_tokens": 0,
+        "total_tokens": 0,
+        "latency_seconds": 0.0,
+        "time_to_first_token_seconds": 0.0,
+        "retries": 0,
+        "cache_hits": 0,
+        "coalesced": 0,
+        "hedges_issued": 0,
+        "hedges_won": 0,
+        "stage_reuses": 0,
+    }
+
+
+def _count(names):
+    counts = {}
+    for name in names:
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def _copy_route(route):
+    return {**route, "skipped": dict(route["skipped"]), "failed": dict(route["failed"]),
+            "errors": dict(route["errors"])}
+
+
+class UsageReport:
+    """Thread-safe roll-up of CompletionResults per stage.
+
+    One report covers a plan; merge() folds plan reports into a batch
+    report, which starts with `plans=0`. Model routing decisions are counted
+    alongside the totals, per stage, route key, tier and model, so a
+    long-lived report stays the same size however many calls it covers.
+    """
+
+    def __init__(self, plans=1):
+        self._stages = {}
+        self._routes = {}
+        self._lock = threading.Lock()
+        self.plans = plans
+
+    def record(self, stage, result):
+        with self._lock:
+            totals = self._stages.setdefault(stage, _empty_totals())
+            totals["calls"] += 1
+            totals["prompt_tokens"] += result.prompt_tokens
+            totals["completion_tokens"] += result.completion_tokens
+            totals["cached_prompt_tokens"] += result.cached_prompt_tokens
+            totals["total_tokens"] += result.total_tokens
+            totals["latency_seconds"] += result.latency or 0.0
+            totals["time_to_first_token_seconds"] += result.time_to_first_token or 0.0
+            totals["retries"] += result.retries
+            totals["cache_hits"] += int(result.cached)
+            totals["coalesced"] += int(result.coalesced)
+            totals["hedges_issued"] += result.hedges_issued
+            totals["hedges_won"] += result.hedges_won
+
+    def record_reuse(self, stage):
+        """Count a stage whose stored output was reused instead of recomputed."""
+        with self._lock:
+            self._stages.setdefault(stage, _empty_totals())["stage_reuses"] += 1
+
+    def record_route(self, stage, decision):
+        route = {"stage": stage, "key": decision.get("key"), "tier": decision["tier"], "model": decision["model"],
+                 "calls": 1, "skipped": _count(item["model"] for item in decision.get("skipped", ())),
+                 "failed": _count(item["model"] for item in decision.get("failed", ())),
+                 "errors": _count(item["error"] for item in decision.get("failed", ()))}
+        with self._lock:
+            self._add_route(route)
+
+    def _add_route(self, route):
+        key = (route["stage"], route["key"], route["tier"], route["model"])
+        current = self._routes.get(key)
+        if current is None:
+            self._routes[key] = _copy_route(route)
+            return
+        current["calls"] += route["calls"]
+        for field in ("skipped", "failed", "errors"):
+            for name, count in route[field].items():
+                current[field][name] = current[field].get(name, 0) + count
+
+    def routes(self):
+        """Routing decisions counted per stage, route key, tier and model, in the order first seen.
+
+        Each entry holds the number of `calls` routed that way, plus per-model
+        counts of the models `skipped` as unhealthy and of those that `failed`
+        before it, and the `errors` those failures raised.
+        """
+        with self._lock:
+            return [_copy_route(route) for route in self._routes.values()]
+
+    def merge(self, other):
+        """Add another report's stage totals, routing decisions and plan count to this one."""
+        stages = other.stages()
+        routes = other.routes()
+        with self._lock:
+            self.plans += other.plans
+            for route in routes:
+                self._add_route(route)
+            for stage, other_totals in stages.items():
+                totals = self._stages.setdefault(stage, _empty_totals())
+                for name, value in other_totals.items():
+                    totals[name] += value
+
+    def stages(self):
+        with self._lock:
+            return {stage: dict(totals) for stage, totals in self._stages.items()}
+
+    def totals(self):
+        overall = _empty_totals()
+        for totals in self.stages().values():
+            for name, value in totals.items():
+                overall[name] += value
+        return overall
+
+    def prompt_cache_hit_rate(self):
+        """Share of prompt tokens the provider served from its prompt cache."""
+        totals = self.totals()
+        return totals["cached_prompt_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+
+    def to_dict(self):
+        return {"plans": self.plans, "stages": self.stages(), "totals": self.totals(),
+                "prompt_cache_hit_rate": self.prompt_cache_hit_rate(), "routes": self.routes()}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self, prefix="marketmind"):
+        """Render the report in the Prometheus text exposition format."""
+        metrics = [
+            ("calls", "counter", "API calls made"),
+            ("prompt_tokens", "counter", "Prompt tokens billed"),
+            ("completion_tokens", "counter", "Completion tokens billed"),
+            ("cached_prompt_tokens", "counter", "Prompt tokens served from the provider prompt cache"),
+            ("total_tokens", "counter", "Prompt plus completion tokens"),
+            ("latency_seconds", "counter", "Sum of end-to-end call latency"),
+            ("time_to_first_token_seconds", "counter", "Sum of time to first token"),
+            ("retries", "counter", "Retried attempts"),
+            ("cache_hits", "counter", "Calls answered from the response cache"),
+            ("coalesced", "counter", "Calls that shared an identical in-flight request"),
+            ("hedges_issued", "counter", "Hedge requests sent for streams slow to start"),
+            ("hedges_won", "counter", "Hedge requests that beat the original request"),
+            ("stage_reuses", "counter", "Stage runs answered from the stage store"),
+        ]
+        stages = self.stages()
+        lines = [f"# HELP {prefix}_plans_total Plans covered by this report.",
+                 f"# TYPE {prefix}_plans_total counter",
+                 f"{prefix}_plans_total {self.plans}"]
+        for name, kind, help_text in metrics:
+            metric = f"{prefix}_stage_{name}_total"
+            lines.append(f"# HELP {metric} {help_text} per pipeline stage.")
+            lines.append(f"# TYPE {metric} {kind}")
+            for stage, totals in sorted(stages.items()):
+                label = stage.replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{metric}{{stage="{label}"}} {totals[name]}')
+        return "\n".join(lines) + "\n"
+
+
+_usage_scope = contextvars.ContextVar("usage_scope", default=None)
+
+
+@contextmanager
+def usage_scope(report, stage):
+    """Record every API call made inside the block in `report` under `stage`."""
+    token = _usage_scope.set((report, stage))
+    try:
+        yield report
+    finally:
+        _usage_scope.reset(token)
+
+
+def record_completion(result):
+    """Record a finished call in the active usage scope, if there is one."""
+    scope = _usage_scope.get()
+    if scope is not None:
+        report, stage = scope
+        report.record(stage, result)
+
+
+def current_stage():
+    """Stage name of the active usage scope, or None outside one."""
+    scope = _usage_scope.get()
+    return scope[1] if scope is not None else None
+
+
+def record_route(decision):
+    """Record a model routing decision in the active usage scope, if there is one."""
+    scope = _usage_scope.get()
+    if scope is not None:
+        report, stage = scope
+        report.record_route(stage, decision)